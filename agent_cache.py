@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from prompt_renderer import prompt_digest
+
+logger = logging.getLogger(__name__)
+
+# Default location and limits of the agent call cache
+DEFAULT_CACHE_PATH = Path('.cache') / 'agent_calls.sqlite'
+DEFAULT_MAX_ENTRIES = 1_000_000
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+
+# Bump when the cached response layout changes so stale entries are never read
+CACHE_FORMAT_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    agent TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+def cache_key(agent: str, payload: dict, template_version) -> str:
+    """Content address of an agent call: (agent role, prompt template version, payload as sent).
+
+    Specialist payloads hold only label fields and a prompt rendered from them, so the key is
+    the labels plus the template version, and patient-days with equal labels share an entry.
+    Every field the backend receives is hashed (the prompt through prompt_digest()), so
+    requests that differ in anything sent never share one.
+    """
+    fields = dict(payload)
+    if 'prompt' in fields:
+        fields['prompt'] = prompt_digest(fields['prompt'])
+    canonical = json.dumps([CACHE_FORMAT_VERSION, agent, template_version, fields],
+                           sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=20).hexdigest()
+
+class AgentCache:
+    """Persistent SQLite store of agent responses with LRU and TTL eviction and hit-rate statistics."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = Counter()
+        self.misses = Counter()
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+        self.evict()
+
+    def get_many(self, agent: str, keys: List[str]) -> Dict[str, dict]:
+        """Look up responses by key, counting hits and misses for `agent`."""
+        now = time.time()
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(unique_keys), 500):
+            chunk = unique_keys[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT key, response, created FROM responses WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for key, response, created in rows:
+                if self.ttl_seconds is None or now - created <= self.ttl_seconds:
+                    found[key] = json.loads(response)
+
+        if found:
+            self._conn.executemany('UPDATE responses SET accessed = ?, hits = hits + 1 WHERE key = ?',
+                                   [(now, key) for key in found])
+            self._conn.commit()
+        n_hits = sum(key in found for key in keys)
+        self.hits[agent] += n_hits
+        self.misses[agent] += len(keys) - n_hits
+        return found
+
+    def put_many(self, agent: str, responses: Dict[str, dict]):
+        """Store responses by key, then evict if over the entry limit."""
+        now = time.time()
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO responses (key, agent, response, created, accessed) VALUES (?, ?, ?, ?, ?)',
+            [(key, agent, json.dumps(response), now, now) for key, response in responses.items()]
+        )
+        self._conn.commit()
+        if self.max_entries is not None and len(self) > self.max_entries:
+            self.evict()
+
+    def evict(self) -> int:
+        """Delete expired entries, then least recently used entries beyond `max_entries`; returns entries removed."""
+        removed = 0
+        if self.ttl_seconds is not None:
+            removed += self._conn.execute('DELETE FROM responses WHERE created < ?',
+                                          (time.time() - self.ttl_seconds,)).rowcount
+        if self.max_entries is not None:
+            excess = len(self) - self.max_entries
+            if excess > 0:
+                removed += self._conn.execute(
+                    'DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)',
+                    (excess,)
+                ).rowcount
+        self._conn.commit()
+        if removed:
+            logger.info(f"Evicted {removed} agent cache entries")
+        return removed
+
+    def __len__(self) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def stats(self) -> Dict[str, dict]:
+        """Hits, misses and hit rate per agent for this session, plus an 'all' total."""
+        stats = {}
+        for agent in sorted(set(self.hits) | set(self.misses)) + ['all']:
+            hits = sum(self.hits.values()) if agent == 'all' else self.hits[agent]
+            misses = sum(self.misses.values()) if agent == 'all' else self.misses[agent]
+            stats[agent] = {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses else 0.0}
+        return stats
+
+    def close(self):
+        self._conn.close()
+
+def cached_backend(backend, cache: AgentCache, template_version):
+    """Wrap a committee backend so only payloads missing from `cache` reach it.
+
+    Identical payloads within a batch are sent once; new responses are stored under their
+    content address.
+    """
+    async def call(agent: str, payloads: List[dict]) -> List[dict]:
+        keys = [cache_key(agent, payload, template_version) for payload in payloads]
+        found = cache.get_many(agent, keys)
+
+        missing = {key: payload for key, payload in zip(keys, payloads) if key not in found}
+        if missing:
+            responses = await backend(agent, list(missing.values()))
+            if len(responses) != len(missing):
+                raise ValueError(f"{agent} returned {len(responses)} opinions for {len(missing)} payloads")
+            new_entries = dict(zip(missing, responses))
+            cache.put_many(agent, new_entries)
+            found.update(new_entries)
+        return [found[key] for key in keys]
+
+    return call
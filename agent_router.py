@@ -0,0 +1,127 @@
+import pandas as pd
+import numpy as np
+import argparse
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from instrumentation import instrumented
+from data_io import DEFAULT_FORMAT, READABLE_FORMATS, output_path, read_table, table_columns, write_table
+from trend_engine import trend_suffixes
+
+logger = logging.getLogger(__name__)
+
+# Agent to variable mapping from the README (Data Router)
+AGENT_VARIABLES = {
+    'hepatologist': [
+        'ALT', 'Arterial_Ammonia', 'Bilirubin', 'Creat', 'F27Q04', 'Hispanic', 'INR1', 'Lymph', 'Platelet_Cnt',
+        'Pre_NAC_IV', 'Prothrom_Sec', 'Sex', 'Venous_Ammonia', 'WBC', 'ammonia'
+    ],
+    'surgeon': [
+        'Bilirubin', 'Creat', 'F27Q04', 'Hemoglobin', 'Hispanic', 'INR1', 'Infection', 'NA', 'Platelet_Cnt',
+        'Prothrom_Sec', 'Ratio_PO2_FiO2', 'Trt_CVVH', 'Trt_Pressors', 'Trt_Ventilator'
+    ],
+    'critical_care': [
+        'Arterial_Ammonia', 'Creat', 'F27Q04', 'HCO3', 'Hemoglobin', 'INR1', 'Infection', 'Lactate', 'Lymph', 'NA',
+        'PMN', 'Phosphate', 'Platelet_Cnt', 'Ratio_PO2_FiO2', 'Trt_CVVH', 'Trt_Pressors', 'Trt_Ventilator',
+        'Venous_Ammonia', 'WBC', 'ammonia'
+    ]
+}
+
+AGENT_NAMES = {
+    'hepatologist': 'AI Hepatologist',
+    'surgeon': 'AI Transplant Surgeon',
+    'critical_care': 'AI Critical Care Physician'
+}
+
+# Columns identifying the patient-day, included in every agent view.
+# The outcome (Spont_Survival21) is never routed to an agent.
+KEY_COLUMNS = ['subject_id', 'day']
+
+# Vignette columns derived from a variable: raw value, text label, bin, value and trend windows
+VARIABLE_COLUMN_SUFFIXES = ['', '_text', '_binned', '_value'] + trend_suffixes()
+
+# Label columns an agent reasons over (the raw and _value columns only back them)
+LABEL_COLUMN_SUFFIXES = ['_text', '_binned'] + trend_suffixes()
+
+def _variable_columns(variable: str) -> List[str]:
+    return [f"{variable}{suffix}" for suffix in VARIABLE_COLUMN_SUFFIXES]
+
+def label_fields(payload: dict) -> dict:
+    """The label fields of a patient-day payload, without identifiers or raw values."""
+    return {key: value for key, value in payload.items() if key.endswith(tuple(LABEL_COLUMN_SUFFIXES))}
+
+@lru_cache(maxsize=16)
+def _compile_routes(columns: Tuple[str, ...], agents: Tuple[Tuple[str, Tuple[str, ...]], ...]) -> Dict[str, np.ndarray]:
+    position = {col: i for i, col in enumerate(columns)}
+    routes = {}
+    for agent, variables in agents:
+        wanted = KEY_COLUMNS + [col for var in variables for col in _variable_columns(var)]
+        routes[agent] = np.array(sorted({position[col] for col in wanted if col in position}), dtype=np.intp)
+    return routes
+
+def compile_routes(columns, agent_variables: Optional[Dict[str, List[str]]] = None) -> Dict[str, np.ndarray]:
+    """Compile the agent-to-variable mapping into column-index projections over a vignette layout.
+
+    Each agent gets the sorted positions of its key and variable columns in `columns`; variables
+    missing from the layout are skipped. Compiled once per distinct layout.
+    """
+    agent_variables = agent_variables or AGENT_VARIABLES
+    agents = tuple((agent, tuple(variables)) for agent, variables in agent_variables.items())
+    return _compile_routes(tuple(columns), agents)
+
+def route_vignettes(vignettes_df: pd.DataFrame,
+                    routes: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, pd.DataFrame]:
+    """Split vignettes into one view per agent without copying column data.
+
+    Each view shares its column buffers with `vignettes_df` (rows are all patient-days, in
+    order), so fanning out to the committee costs no copies; treat the views as read-only.
+    """
+    routes = routes if routes is not None else compile_routes(vignettes_df.columns)
+    views = {}
+    for agent, indices in routes.items():
+        columns = vignettes_df.columns[indices]
+        views[agent] = pd.DataFrame({col: vignettes_df[col] for col in columns}, copy=False)
+    return views
+
+def agent_input_columns(agent: str, columns) -> List[str]:
+    """Vignette columns routed to one agent, for column-projected reads of a vignette table."""
+    return list(pd.Index(columns)[compile_routes(columns)[agent]])
+
+@instrumented(args=('output_dir',))
+def write_agent_partitions(vignettes_df: pd.DataFrame, output_dir, fmt: str = DEFAULT_FORMAT,
+                           routes: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, Path]:
+    """Write one table per agent (e.g. output_dir/hepatologist.parquet) from the routed views."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    for agent, view in route_vignettes(vignettes_df, routes).items():
+        paths[agent] = write_table(view, output_dir / output_path(agent, fmt), fmt)
+        logger.info(f"Routed {view.shape[1] - len(KEY_COLUMNS)} columns to {AGENT_NAMES.get(agent, agent)}")
+    return paths
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Write per-agent partitions of the clinical vignettes")
+    parser.add_argument('--input', default=str(output_path('clinical_vignettes', 'parquet')),
+                        help="Vignette table written by create_vignettes (parquet or feather)")
+    parser.add_argument('--output-dir', default='agent_vignettes',
+                        help="Directory for the per-agent tables (default: agent_vignettes)")
+    parser.add_argument('--output-format', choices=list(READABLE_FORMATS) + ['csv'], default=DEFAULT_FORMAT,
+                        help=f"Format of the per-agent tables (default: {DEFAULT_FORMAT})")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    columns = table_columns(args.input)
+    routed = sorted(set().union(*(agent_input_columns(agent, columns) for agent in AGENT_VARIABLES)),
+                    key=columns.index)
+    vignettes_df = read_table(args.input, columns=routed)
+    paths = write_agent_partitions(vignettes_df, args.output_dir, fmt=args.output_format)
+    for agent, path in paths.items():
+        logger.info(f"{AGENT_NAMES[agent]}: {path}")
+
+if __name__ == '__main__':
+    main()
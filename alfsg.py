@@ -0,0 +1,79 @@
+"""Command line entry point of the ALFSG pipeline: `alfsg <command> [options]`.
+
+Each command runs the main() of one pipeline script with the remaining arguments. The
+script (and pandas, numpy, the Excel readers, ...) is imported only once a command is
+chosen, so `alfsg --help` and clinical_tables lookups start without the heavy imports.
+"""
+import argparse
+import importlib
+import importlib.util
+import os
+import sys
+
+# Command -> (module whose main(argv) it runs, help line)
+COMMANDS = {
+    'ingest': ('process_excel', "Merge the ALFSG Excel files into one subject-level table"),
+    'vignettes': ('create_vignettes', "Create clinical vignettes for each patient-day"),
+    'route': ('agent_router', "Write per-agent partitions of the clinical vignettes"),
+    'tensors': ('tensor_export', "Export the clinical vignettes as memory-mappable feature tensors"),
+    'committee': ('committee', "Run the multi-agent transplant committee over clinical vignettes"),
+    'serve': ('scoring_service', "Serve on-demand vignettes and committee opinions for single patient-days"),
+    'synth': ('synthetic_cohort', "Generate a synthetic cohort shaped like the ALFSG Excel extracts")
+}
+BENCH_COMMAND = 'bench'
+
+# Benchmark scripts live next to the pipeline scripts in a source checkout
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks')
+
+def benchmark_scripts() -> dict:
+    """Benchmark scripts by name (bench_pipeline.py -> 'pipeline'); empty outside a source checkout."""
+    if not os.path.isdir(BENCHMARK_DIR):
+        return {}
+    scripts = sorted(name for name in os.listdir(BENCHMARK_DIR) if name.endswith('.py'))
+    return {name[:-3].removeprefix('bench_'): os.path.join(BENCHMARK_DIR, name) for name in scripts}
+
+def build_parser() -> argparse.ArgumentParser:
+    """Parser of the command name only; the command's own options are parsed by its script."""
+    parser = argparse.ArgumentParser(
+        prog='alfsg',
+        description="ALFSG multi-agent pipeline",
+        epilog="Run 'alfsg <command> --help' for the options of a command."
+    )
+    commands = parser.add_subparsers(dest='command', metavar='command', required=True)
+    for name, (_, help_line) in COMMANDS.items():
+        commands.add_parser(name, help=help_line, add_help=False)
+    commands.add_parser(BENCH_COMMAND, help="Run a benchmark script (see 'alfsg bench --help')", add_help=False)
+    return parser
+
+def run_benchmark(argv: list):
+    """Run benchmarks/<name>.py's main() with the arguments after the benchmark name."""
+    scripts = benchmark_scripts()
+    parser = argparse.ArgumentParser(
+        prog=f"alfsg {BENCH_COMMAND}",
+        description="Run a benchmark script from the source checkout's benchmarks directory",
+        epilog="Run 'alfsg bench <benchmark> --help' for the options of a benchmark."
+    )
+    parser.add_argument('benchmark', choices=list(scripts))
+    name = parser.parse_args(argv[:1]).benchmark
+
+    path = scripts[name]
+    spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.argv[0] = f"alfsg {BENCH_COMMAND} {name}"
+    module.main(argv[1:])
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Only the command name is parsed here so its options reach the script unchanged
+    command = build_parser().parse_args(argv[:1]).command
+    if command == BENCH_COMMAND:
+        run_benchmark(argv[1:])
+        return
+    module = importlib.import_module(COMMANDS[command][0])
+    # argparse takes the prog name of the script's parser from argv[0]
+    sys.argv[0] = f"alfsg {command}"
+    module.main(argv[1:])
+
+if __name__ == '__main__':
+    main()
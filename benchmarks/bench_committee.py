@@ -0,0 +1,69 @@
+"""Benchmark committee throughput (patient-days/second) against the local stub backend.
+
+Usage: python benchmarks/bench_committee.py --subjects 500 --latency-ms 20 --batch-sizes 1 8 32 --concurrency 4 16
+"""
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from clinical_tables import BINNING_THRESHOLDS, STATIC_CATEGORICAL_VARS, TREATMENT_VARS
+from committee import latency_summary, run_committee, stub_backend
+from create_vignettes import create_vignettes
+
+def make_wide_data(n_subjects, n_days=7, missing_rate=0.2, seed=0):
+    """Synthetic merged table with every continuous and treatment variable."""
+    rng = np.random.default_rng(seed)
+    columns = {'subject_id': np.arange(1, n_subjects + 1), 'Spont_Survival21': rng.integers(0, 2, n_subjects)}
+    for var in STATIC_CATEGORICAL_VARS:
+        columns[var] = rng.integers(0, 2, n_subjects).astype(float)
+    for var, spec in BINNING_THRESHOLDS.items():
+        high = spec['bins'][-2] * 1.5
+        for day in range(1, n_days + 1):
+            values = rng.uniform(0, high, n_subjects)
+            columns[f"{var}_day_{day}"] = np.where(rng.random(n_subjects) < missing_rate, np.nan, values)
+    for var in TREATMENT_VARS:
+        for day in range(1, n_days + 1):
+            columns[f"{var}_day_{day}"] = rng.integers(0, 2, n_subjects).astype(float)
+    return pd.DataFrame(columns)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subjects', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Stub latency per request")
+    parser.add_argument('--per-item-ms', type=float, default=0.5, help="Stub latency per patient-day in a request")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[4, 16, 64])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    logging.disable(logging.INFO)
+
+    vignettes_df = create_vignettes(make_wide_data(args.subjects, seed=args.seed))
+    print(f"Input: {len(vignettes_df):,} patient-days; stub latency {args.latency_ms}ms + {args.per_item_ms}ms/item")
+    print(f"{'batch':>6} {'concurrency':>12} {'seconds':>9} {'patient-days/s':>15} {'specialist p50 ms':>18} {'leader p50 ms':>14}")
+
+    reference = None
+    for batch_size in args.batch_sizes:
+        for concurrency in args.concurrency:
+            backend = stub_backend(latency=args.latency_ms / 1000, per_item_latency=args.per_item_ms / 1000)
+            start = time.perf_counter()
+            predictions, metrics = run_committee(vignettes_df, backend, batch_size=batch_size,
+                                                 max_concurrency=concurrency)
+            seconds = time.perf_counter() - start
+            summary = latency_summary(metrics, len(vignettes_df)).set_index('stage')
+
+            # Batching and concurrency must not change the predictions
+            if reference is None:
+                reference = predictions
+            pd.testing.assert_frame_equal(predictions, reference)
+            print(f"{batch_size:>6} {concurrency:>12} {seconds:>9.2f} {len(vignettes_df) / seconds:>15.1f} "
+                  f"{summary.loc['critical_care', 'p50_ms']:>18.1f} {summary.loc['leader', 'p50_ms']:>14.1f}")
+
+if __name__ == '__main__':
+    main()
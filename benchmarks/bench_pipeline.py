@@ -0,0 +1,168 @@
+"""Benchmark the preprocessing pipeline stage by stage on synthetic cohorts.
+
+Reports wall time, peak RSS and rows/s for reading, processing, joining and vignette
+creation at each cohort size, writes the results as JSON and optionally compares them
+with an earlier run.
+
+Usage: python benchmarks/bench_pipeline.py --sizes 1000 10000 100000 --output bench_pipeline.json
+       python benchmarks/bench_pipeline.py --sizes 1000 --compare bench_pipeline.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from create_vignettes import create_vignettes
+from instrumentation import current_rss
+from process_excel import EXCEL_FILES, join_processed_dfs, process_dataframe, read_excel_file, stream_excel_file
+from synthetic_cohort import generate_cohort, write_cohort
+
+STAGES = ['generate', 'read_excel', 'process_dataframe', 'stream_excel', 'join', 'create_vignettes']
+
+def measure(stage, subjects, fn):
+    """Run fn() while sampling RSS; returns (result, record) where fn returns (result, rows)."""
+    start_rss = current_rss()
+    peak = [start_rss]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.01):
+            peak[0] = max(peak[0], current_rss())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    result, rows = fn()
+    seconds = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    peak[0] = max(peak[0], current_rss())
+
+    record = {
+        'subjects': subjects,
+        'stage': stage,
+        'seconds': round(seconds, 4),
+        'rows': int(rows),
+        'rows_per_second': round(rows / seconds, 1) if seconds else None,
+        'peak_rss_mb': round(peak[0] / 1024 ** 2, 1),
+        'rss_delta_mb': round((peak[0] - start_rss) / 1024 ** 2, 1)
+    }
+    print(f"{subjects:>8} {stage:>18} {seconds:>9.2f}s {rows:>10,} rows {record['rows_per_second'] or 0:>12,.0f} rows/s "
+          f"{record['peak_rss_mb']:>9,.0f} MB peak (+{record['rss_delta_mb']:,.0f})")
+    return result, record
+
+def bench_size(subjects, args):
+    """Run every stage for one cohort size; returns the stage records."""
+    cohort_dir = Path(args.data_dir) / f"n{subjects}_d{args.days}_s{args.seed}{'_enc' if args.password else ''}"
+    paths = [cohort_dir / filepath for filepath in EXCEL_FILES]
+    records = []
+
+    def generate():
+        frames = generate_cohort(subjects, n_days=args.days, missing_rate=args.missing_rate, seed=args.seed)
+        write_cohort(frames, cohort_dir, password=args.password)
+        return None, sum(len(df) for df in frames.values())
+
+    if args.regenerate or not all(path.exists() for path in paths):
+        records.append(measure('generate', subjects, generate)[1])
+
+    raw_dfs, record = measure('read_excel', subjects, lambda: (
+        dfs := {path.name: read_excel_file(path, password=args.password) for path in paths},
+        sum(len(df) for df in dfs.values())
+    ))
+    records.append(record)
+
+    processed_dfs, record = measure('process_dataframe', subjects, lambda: (
+        {name: process_dataframe(df, name) for name, df in raw_dfs.items()},
+        sum(len(df) for df in raw_dfs.values())
+    ))
+    records.append(record)
+
+    # read_excel + process_dataframe in one row-level pass over each workbook
+    _, record = measure('stream_excel', subjects, lambda: (
+        [stream_excel_file(path, password=args.password) for path in paths],
+        sum(len(df) for df in raw_dfs.values())
+    ))
+    records.append(record)
+
+    merged_df, record = measure('join', subjects, lambda: (
+        final_df := join_processed_dfs(processed_dfs)[0],
+        len(final_df)
+    ))
+    records.append(record)
+
+    _, record = measure('create_vignettes', subjects, lambda: (
+        vignettes_df := create_vignettes(merged_df, n_days=args.days),
+        len(vignettes_df)
+    ))
+    records.append(record)
+    return records
+
+def compare(records, baseline_path, tolerance):
+    """Print time ratios against a baseline run; returns the (subjects, stage) pairs slower than `tolerance`."""
+    baseline = {(r['subjects'], r['stage']): r for r in json.loads(Path(baseline_path).read_text())['results']}
+    regressions = []
+    print(f"\nComparison with {baseline_path} (ratio = current / baseline seconds)")
+    for record in records:
+        key = (record['subjects'], record['stage'])
+        if key not in baseline or not baseline[key]['seconds']:
+            continue
+        ratio = record['seconds'] / baseline[key]['seconds']
+        rss_ratio = record['peak_rss_mb'] / baseline[key]['peak_rss_mb']
+        flag = '  REGRESSION' if ratio > tolerance else ''
+        print(f"{key[0]:>8} {key[1]:>18} time {ratio:6.2f}x  peak RSS {rss_ratio:6.2f}x{flag}")
+        if flag:
+            regressions.append(key)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000], help="Cohort sizes (subjects)")
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--missing-rate', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--password', default=None, help="Benchmark password-encrypted workbooks")
+    parser.add_argument('--data-dir', default=str(Path('.cache') / 'synthetic_cohorts'),
+                        help="Generated cohorts are kept here and reused between runs")
+    parser.add_argument('--regenerate', action='store_true', help="Regenerate cohorts even if present")
+    parser.add_argument('--output', default='bench_pipeline.json', help="JSON results file")
+    parser.add_argument('--compare', default=None, help="Earlier JSON results to compare against")
+    parser.add_argument('--tolerance', type=float, default=1.2,
+                        help="Time ratio above which a stage counts as a regression (default: 1.2)")
+    args = parser.parse_args(argv)
+    logging.disable(logging.INFO)
+
+    records = []
+    for subjects in sorted(args.sizes):
+        records.extend(bench_size(subjects, args))
+
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'days': args.days,
+            'missing_rate': args.missing_rate,
+            'seed': args.seed,
+            'encrypted': bool(args.password)
+        },
+        'results': records
+    }
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"\nWrote {len(records)} results to {args.output}")
+
+    if args.compare and compare(records, args.compare, args.tolerance):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
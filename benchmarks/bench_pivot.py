@@ -0,0 +1,79 @@
+"""Benchmark the single-pass pivot in process_dataframe against the per-variable pivot_table path.
+
+Usage: python benchmarks/bench_pivot.py --subjects 50000 --variables 30 --days 21
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from process_excel import pivot_by_day
+
+def legacy_pivot(long_df, variables):
+    """Previous process_dataframe path: one pivot_table per variable folded together with outer merges."""
+    unstacked_dfs = []
+    for var in variables:
+        pivot_df = long_df[['subject_id', 'day', var]].pivot_table(
+            index='subject_id',
+            columns='day',
+            values=var,
+            aggfunc='first'
+        )
+        pivot_df.columns = [f"{var}_day_{col}" for col in pivot_df.columns]
+        unstacked_dfs.append(pivot_df)
+
+    final_df = unstacked_dfs[0]
+    for df_pivot in unstacked_dfs[1:]:
+        final_df = final_df.merge(df_pivot, left_index=True, right_index=True, how='outer')
+    return final_df.reset_index()
+
+def make_long_data(n_subjects, n_variables, n_days, missing_rate=0.3, duplicate_rate=0.02, seed=0):
+    """Synthetic (subject_id, day) rows with missing values and duplicate visits."""
+    rng = np.random.default_rng(seed)
+    subject_ids = np.repeat(np.arange(1, n_subjects + 1), n_days)
+    days = np.tile(np.arange(1, n_days + 1).astype(str), n_subjects)
+
+    duplicates = rng.random(len(subject_ids)) < duplicate_rate
+    subject_ids = np.concatenate([subject_ids, subject_ids[duplicates]])
+    days = np.concatenate([days, days[duplicates]])
+
+    long_df = pd.DataFrame({'subject_id': subject_ids, 'day': days})
+    for j in range(n_variables):
+        values = rng.lognormal(mean=1.0, sigma=1.0, size=len(long_df))
+        values[rng.random(len(long_df)) < missing_rate] = np.nan
+        long_df[f"var{j}"] = values
+    return long_df
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subjects', type=int, default=50_000)
+    parser.add_argument('--variables', type=int, default=30)
+    parser.add_argument('--days', type=int, default=21)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    long_df = make_long_data(args.subjects, args.variables, args.days, seed=args.seed)
+    variables = [col for col in long_df.columns if col.startswith('var')]
+    print(f"Input: {len(long_df):,} rows, {args.subjects:,} subjects x {args.variables} variables x {args.days} days")
+
+    start = time.perf_counter()
+    legacy_df = legacy_pivot(long_df, variables)
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    single_pass_df = pivot_by_day(long_df, variables)
+    single_pass_seconds = time.perf_counter() - start
+
+    assert_frame_equal(legacy_df, single_pass_df)
+    print(f"Output: {single_pass_df.shape} (identical)")
+    print(f"pivot_table + merges: {legacy_seconds:8.2f}s")
+    print(f"single-pass pivot:    {single_pass_seconds:8.2f}s ({legacy_seconds / single_pass_seconds:.1f}x)")
+
+if __name__ == '__main__':
+    main()
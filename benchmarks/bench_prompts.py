@@ -0,0 +1,63 @@
+"""Benchmark columnar prompt rendering against per-row f-strings over record dicts.
+
+Usage: python benchmarks/bench_prompts.py --patient-days 100000
+"""
+import argparse
+import logging
+import math
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_committee import make_wide_data
+from agent_router import AGENT_VARIABLES
+from create_vignettes import create_vignettes
+from prompt_renderer import compile_templates, render_prompts
+
+def render_rows(vignettes_df, agent):
+    """Per-row reference renderer: one dict per patient-day and a branch per field."""
+    template = compile_templates(vignettes_df.columns)[agent]
+    prompts = []
+    for record in vignettes_df.to_dict('records'):
+        prompt = 'Clinical findings'
+        for var, segments in template:
+            body = ''
+            for column, prefix, suffix in segments:
+                value = record[column]
+                if value is None or (isinstance(value, float) and math.isnan(value)):
+                    continue
+                body += f"{prefix}{value}{suffix}"
+            if body:
+                prompt += f"\n- {var}:{body}"
+        prompts.append(prompt)
+    return prompts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patient-days', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    logging.disable(logging.INFO)
+
+    vignettes_df = create_vignettes(make_wide_data(math.ceil(args.patient_days / 7), seed=args.seed))
+    vignettes_df = vignettes_df.head(args.patient_days)
+    print(f"Input: {len(vignettes_df):,} patient-days x {vignettes_df.shape[1]} columns")
+    print(f"{'agent':>14} {'per-row/s':>12} {'columnar/s':>12} {'speedup':>8}")
+
+    for agent in AGENT_VARIABLES:
+        start = time.perf_counter()
+        reference = render_rows(vignettes_df, agent)
+        row_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        prompts = render_prompts(vignettes_df, agent)
+        columnar_seconds = time.perf_counter() - start
+
+        assert prompts == reference, f"{agent} prompts differ from the per-row renderer"
+        print(f"{agent:>14} {len(prompts) / row_seconds:>12,.0f} {len(prompts) / columnar_seconds:>12,.0f} "
+              f"{row_seconds / columnar_seconds:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark sharded vignette generation against the single-process build as workers increase.
+
+Builds a merged table from a synthetic cohort, times create_vignettes and then
+create_vignettes_sharded at each worker count (checking the output is identical), and reports
+speedup, parallel efficiency and the time spent in the serial shard exchange
+(hashing subjects, writing the shared input, wrapping the shared output).
+
+Usage: python benchmarks/bench_sharding.py --subjects 100000 --workers 1 2 4 8 16 32 --output bench_sharding.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from create_vignettes import create_vignettes, create_vignettes_sharded
+from instrumentation import disable_metrics, enable_metrics
+from process_excel import join_processed_dfs, process_dataframe
+from synthetic_cohort import generate_cohort
+
+# Stages of the sharded build that run in the parent process only
+SERIAL_STAGES = ['plan_shards', 'write_shard_inputs', 'gather_shards']
+
+def merged_table(subjects, days, seed):
+    """The wide merged table process_excel would write for a synthetic cohort."""
+    frames = generate_cohort(subjects, n_days=days, seed=seed)
+    processed = {name: process_dataframe(df, name) for name, df in frames.items()}
+    return join_processed_dfs(processed)[0]
+
+def best_of(repeat, fn):
+    """Run fn() `repeat` times; returns (last result, fastest seconds)."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subjects', type=int, default=100_000)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help="Worker counts (default: powers of two up to the CPU count)")
+    parser.add_argument('--shards', type=int, default=None, help="Shards per run (default: one per worker)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per configuration; the fastest is reported")
+    parser.add_argument('--output', default='bench_sharding.json', help="JSON results file")
+    args = parser.parse_args(argv)
+    logging.disable(logging.INFO)
+
+    cpus = os.cpu_count() or 1
+    worker_counts = args.workers or sorted({2 ** k for k in range(cpus.bit_length()) if 2 ** k <= cpus} | {cpus})
+    merged_df = merged_table(args.subjects, args.days, args.seed)
+    print(f"{len(merged_df):,} subjects x {args.days} days on {cpus} CPUs")
+
+    expected, serial_seconds = best_of(args.repeat, lambda: create_vignettes(merged_df, n_days=args.days))
+    print(f"{'serial':>8} {serial_seconds:>9.2f}s")
+
+    records = []
+    for workers in worker_counts:
+        enable_metrics()
+        vignettes_df, seconds = best_of(args.repeat, lambda: create_vignettes_sharded(
+            merged_df, workers, shards=args.shards, n_days=args.days))
+        summary = disable_metrics()['summary']
+        assert_frame_equal(vignettes_df, expected)
+
+        serial_ms = sum(summary[name]['total_ms'] for name in SERIAL_STAGES if name in summary) / args.repeat
+        record = {
+            'workers': workers,
+            'shards': args.shards or workers,
+            'seconds': round(seconds, 4),
+            'speedup': round(serial_seconds / seconds, 2),
+            'efficiency': round(serial_seconds / seconds / workers, 2),
+            'exchange_seconds': round(serial_ms / 1000, 4)
+        }
+        records.append(record)
+        print(f"{workers:>8} {seconds:>9.2f}s  speedup {record['speedup']:>6.2f}x  "
+              f"efficiency {record['efficiency']:>5.0%}  exchange {record['exchange_seconds']:.2f}s")
+
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': cpus,
+            'subjects': len(merged_df),
+            'days': args.days,
+            'seed': args.seed,
+            'serial_seconds': round(serial_seconds, 4)
+        },
+        'results': records
+    }
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"\nWrote {len(records)} results to {args.output}")
+
+if __name__ == '__main__':
+    main()
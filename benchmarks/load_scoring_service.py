@@ -0,0 +1,187 @@
+"""Load-test the scoring service: request latency percentiles and throughput under concurrent clients.
+
+Starts scoring_service.py in a subprocess for each --max-batch setting (1 disables
+micro-batching) unless --url points at a running service, then keeps --concurrency
+keep-alive clients busy with /score requests for random subjects of a synthetic cohort,
+each subject reporting days 1, 2, ... in order (the service refuses days older than its
+trend window). Reports p50/p95/p99 latency, requests/s, rejected requests and the
+service's mean batch size.
+
+Usage: python benchmarks/load_scoring_service.py --requests 5000 --concurrency 64 --max-batch 1 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from clinical_tables import BINNING_THRESHOLDS, STATIC_CATEGORICAL_VARS, TREATMENT_VARS
+
+SERVICE = Path(__file__).resolve().parent.parent / 'scoring_service.py'
+
+def request_bodies(n_requests, n_subjects, n_days, committee, seed):
+    """Random /score bodies: one reported day of raw values for a random subject.
+
+    A subject's requests are for days 1, 2, ... up to `n_days` (later ones re-report the last
+    day), so days never go back in time as the service replays them.
+    """
+    rng = random.Random(seed)
+    next_day = {}
+    bodies = []
+    for _ in range(n_requests):
+        values = {var: round(rng.uniform(0, spec['bins'][-2] * 1.5), 2) for var, spec in BINNING_THRESHOLDS.items()}
+        values.update({var: rng.randint(0, 1) for var in TREATMENT_VARS + STATIC_CATEGORICAL_VARS})
+        subject_id = f"S{rng.randrange(n_subjects):06d}"
+        day = next_day[subject_id] = min(next_day.get(subject_id, 0) + 1, n_days)
+        body = {'subject_id': subject_id, 'day': day, 'values': values, 'committee': committee}
+        bodies.append(json.dumps(body).encode())
+    return bodies
+
+async def _call(reader, writer, method, path, body=b'', accept=(200,)):
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode().partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    payload = json.loads(await reader.readexactly(length))
+    if status not in accept:
+        raise RuntimeError(f"{method} {path} returned {status}: {payload}")
+    return status, payload
+
+async def _client(host, port, bodies, latencies, rejected):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while bodies:
+            body = bodies.pop()
+            start = time.perf_counter()
+            # 400 is a request the service refused (e.g. a day outside the trend window), not a failure
+            status, _ = await _call(reader, writer, 'POST', '/score', body, accept=(200, 400))
+            if status == 400:
+                rejected.append(body)
+                continue
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+async def run_load(host, port, bodies, concurrency):
+    """Send every body with `concurrency` clients; returns (latencies, rejected requests, seconds, service health)."""
+    latencies, rejected = [], []
+    pending = list(reversed(bodies))
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, pending, latencies, rejected) for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+    reader, writer = await asyncio.open_connection(host, port)
+    _, health = await _call(reader, writer, 'GET', '/health')
+    writer.close()
+    return np.asarray(latencies), len(rejected), seconds, health
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_service(port, max_batch, max_wait_ms, stub_latency_ms):
+    process = subprocess.Popen(
+        [sys.executable, str(SERVICE), '--port', str(port), '--max-batch', str(max_batch),
+         '--max-wait-ms', str(max_wait_ms), '--stub-latency-ms', str(stub_latency_ms)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError(f"{SERVICE.name} exited with {process.returncode}")
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{SERVICE.name} did not start listening on port {port}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=64, help="Concurrent keep-alive clients")
+    parser.add_argument('--subjects', type=int, default=1000, help="Distinct subject_ids requested")
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--max-batch', type=int, nargs='+', default=[1, 64],
+                        help="Service --max-batch settings to compare (1 = no micro-batching)")
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--stub-latency-ms', type=float, default=0.0, help="Stub backend latency per request")
+    parser.add_argument('--no-committee', action='store_true', help="Request vignettes only")
+    parser.add_argument('--url', default=None, help="Load an already running service (host:port) instead")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='load_scoring_service.json', help="JSON results file")
+    args = parser.parse_args(argv)
+
+    bodies = request_bodies(args.requests, args.subjects, args.days, not args.no_committee, args.seed)
+    settings = [None] if args.url else args.max_batch
+    print(f"{args.requests:,} requests, {args.concurrency} clients, committee {'off' if args.no_committee else 'on'}")
+    print(f"{'max batch':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'mean batch':>11} {'rejected':>9}")
+
+    records = []
+    for max_batch in settings:
+        process = None
+        if args.url:
+            host, port = args.url.rsplit(':', 1)
+            port = int(port)
+        else:
+            host, port = '127.0.0.1', _free_port()
+            process = start_service(port, max_batch, args.max_wait_ms, args.stub_latency_ms)
+        try:
+            latencies, rejected, seconds, health = asyncio.run(run_load(host, port, bodies, args.concurrency))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+        latencies_ms = latencies * 1000
+        record = {
+            'max_batch': max_batch,
+            'requests': len(latencies),
+            'rejected': rejected,
+            'seconds': round(seconds, 4),
+            'requests_per_second': round(len(latencies) / seconds, 1),
+            'p50_ms': round(float(np.percentile(latencies_ms, 50)), 2),
+            'p95_ms': round(float(np.percentile(latencies_ms, 95)), 2),
+            'p99_ms': round(float(np.percentile(latencies_ms, 99)), 2),
+            'max_ms': round(float(latencies_ms.max()), 2),
+            'mean_batch_size': round(health['mean_batch_size'], 1)
+        }
+        records.append(record)
+        print(f"{str(max_batch or '-'):>10} {record['p50_ms']:>9.1f} {record['p95_ms']:>9.1f} {record['p99_ms']:>9.1f} "
+              f"{record['requests_per_second']:>9.1f} {record['mean_batch_size']:>11.1f} {rejected:>9}")
+
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'concurrency': args.concurrency,
+            'subjects': args.subjects,
+            'committee': not args.no_committee,
+            'max_wait_ms': args.max_wait_ms,
+            'stub_latency_ms': args.stub_latency_ms
+        },
+        'results': records
+    }
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"\nWrote {len(records)} results to {args.output}")
+
+if __name__ == '__main__':
+    main()
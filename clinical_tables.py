@@ -0,0 +1,229 @@
+"""Clinical lookup tables shared by the pipeline: target variables, binning thresholds and categorical labels.
+
+Kept free of pandas, numpy and typing so tools that only need a table or a single-value lookup
+import it in a few milliseconds; create_vignettes and process_excel re-export these names.
+"""
+import math
+from numbers import Real
+
+# Variables to extract
+TARGET_VARIABLES = [
+    'Spont_Survival21',
+    'Sex',
+    'Hispanic',
+    'Pre_NAC_IV',
+    'Hemoglobin',
+    'WBC',
+    'PMN',
+    'Lymph',
+    'Platelet_Cnt',
+    'Prothrom_Sec',
+    'ALT',
+    'Bilirubin',
+    'Creat',
+    'NA',
+    'HCO3',
+    'Phosphate',
+    'Lactate',
+    'PH',
+    'Arterial_Ammonia',
+    'Venous_Ammonia',
+    'INR1',
+    'ammonia',
+    'Ratio_PO2_FiO2',
+    'F27Q04',
+    'Infection',
+    'Trt_Ventilator',
+    'Trt_Pressors',
+    'Trt_CVVH'
+]
+
+# Vignette layout: days covered per subject, static and per-day categorical variables
+VIGNETTE_DAYS = list(range(1, 8))
+STATIC_CATEGORICAL_VARS = ['Sex', 'Hispanic', 'Pre_NAC_IV']
+TREATMENT_VARS = ['Infection', 'Trt_Ventilator', 'Trt_Pressors', 'Trt_CVVH', 'F27Q04']
+
+# Clinical binning thresholds based on medical literature and README examples
+BINNING_THRESHOLDS = {
+    'Lactate': {
+        'bins': [0, 2.0, 4.0, 7.0, float('inf')],
+        'labels': ['Normal', 'Elevated (Hyperlactatemia)', 'Severely Elevated (Lactic Acidosis)', 'Critical (High Mortality Risk)'],
+        'unit': 'mmol/L'
+    },
+    'Creat': {
+        'bins': [0, 1.2, 1.6, 2.5, float('inf')],
+        'labels': ['Normal', 'High (Meets Stage 1 AKI criteria)', 'Severely High (Stage 2 AKI)', 'Critical (Stage 3 AKI)'],
+        'unit': 'mg/dL'
+    },
+    'INR1': {
+        'bins': [0, 1.2, 1.8, 3.0, float('inf')],
+        'labels': ['Normal', 'Elevated (Hepatic Dysfunction)', 'Severely Elevated (Synthetic Failure)', 'Critical'],
+        'unit': ''
+    },
+    'Hemoglobin': {
+        'bins': [0, 10.0, 12.0, 15.0, float('inf')],
+        'labels': ['Critical (Severe Anemia)', 'Low (Moderate Anemia)', 'Normal', 'High'],
+        'unit': 'g/dL'
+    },
+    'WBC': {
+        'bins': [0, 4.0, 10.0, 15.0, float('inf')],
+        'labels': ['Low (Leukopenia)', 'Normal', 'Elevated (Leukocytosis)', 'High (Severe Leukocytosis)'],
+        'unit': 'k/uL'
+    },
+    'Platelet_Cnt': {
+        'bins': [0, 50, 100, 150, float('inf')],
+        'labels': ['Critical (Severe Thrombocytopenia)', 'Low (Thrombocytopenia)', 'Borderline', 'Normal'],
+        'unit': 'k/uL'
+    },
+    'Bilirubin': {
+        'bins': [0, 1.2, 2.0, 5.0, float('inf')],
+        'labels': ['Normal', 'Elevated', 'High (Jaundice)', 'Critical (Severe Hyperbilirubinemia)'],
+        'unit': 'mg/dL'
+    },
+    'ALT': {
+        'bins': [0, 40, 100, 300, float('inf')],
+        'labels': ['Normal', 'Elevated', 'High', 'Critical (Severe Hepatocellular Injury)'],
+        'unit': 'U/L'
+    },
+    'NA': {
+        'bins': [0, 130, 135, 145, float('inf')],
+        'labels': ['Critical (Severe Hyponatremia)', 'Low (Hyponatremia)', 'Normal', 'High (Hypernatremia)'],
+        'unit': 'mEq/L'
+    },
+    'HCO3': {
+        'bins': [0, 18, 22, 26, float('inf')],
+        'labels': ['Critical (Severe Acidosis)', 'Low (Acidosis)', 'Normal', 'High (Alkalosis)'],
+        'unit': 'mEq/L'
+    },
+    'Phosphate': {
+        'bins': [0, 2.5, 3.5, 4.5, float('inf')],
+        'labels': ['Low (Hypophosphatemia)', 'Normal', 'Elevated', 'High (Hyperphosphatemia)'],
+        'unit': 'mg/dL'
+    },
+    'PH': {
+        'bins': [0, 7.2, 7.35, 7.45, float('inf')],
+        'labels': ['Critical (Severe Acidosis)', 'Low (Acidosis)', 'Normal', 'High (Alkalosis)'],
+        'unit': ''
+    },
+    'Arterial_Ammonia': {
+        'bins': [0, 50, 100, 200, float('inf')],
+        'labels': ['Normal', 'Elevated', 'High', 'Critical (Severe Hyperammonemia)'],
+        'unit': 'μmol/L'
+    },
+    'Venous_Ammonia': {
+        'bins': [0, 50, 100, 200, float('inf')],
+        'labels': ['Normal', 'Elevated', 'High', 'Critical (Severe Hyperammonemia)'],
+        'unit': 'μmol/L'
+    },
+    'ammonia': {
+        'bins': [0, 50, 100, 200, float('inf')],
+        'labels': ['Normal', 'Elevated', 'High', 'Critical (Severe Hyperammonemia)'],
+        'unit': 'μmol/L'
+    },
+    'Ratio_PO2_FiO2': {
+        'bins': [0, 200, 300, 400, float('inf')],
+        'labels': ['Critical (Severe ARDS)', 'Low (ARDS)', 'Moderate (ALI)', 'Normal'],
+        'unit': ''
+    },
+    'Prothrom_Sec': {
+        'bins': [0, 12, 15, 18, float('inf')],
+        'labels': ['Normal', 'Elevated', 'High', 'Critical (Severe Coagulopathy)'],
+        'unit': 'seconds'
+    },
+    'PMN': {
+        'bins': [0, 40, 60, 80, float('inf')],
+        'labels': ['Low', 'Normal', 'Elevated', 'High'],
+        'unit': '%'
+    },
+    'Lymph': {
+        'bins': [0, 15, 30, 45, float('inf')],
+        'labels': ['Low (Lymphopenia)', 'Normal', 'Elevated', 'High'],
+        'unit': '%'
+    }
+}
+
+def _is_missing(value) -> bool:
+    """None, NaN or NaT (pd.isna for scalars, without importing pandas)."""
+    try:
+        return value is None or bool(value != value)
+    except TypeError:  # pd.NA
+        return True
+
+def bin_continuous_value(value: float, var_name: str) -> str | None:
+    """Bin a continuous value based on clinical thresholds."""
+    if _is_missing(value):
+        return None
+    
+    if var_name not in BINNING_THRESHOLDS:
+        return None
+    
+    thresholds = BINNING_THRESHOLDS[var_name]
+    bins = thresholds['bins']
+    labels = thresholds['labels']
+    
+    # Find which bin the value falls into
+    for i in range(len(bins) - 1):
+        if bins[i] <= value < bins[i + 1]:
+            return labels[i]
+    
+    # Handle edge case for last bin
+    if value >= bins[-2]:
+        return labels[-1]
+    
+    return None
+
+# Categorical variable mappings
+CATEGORICAL_MAPPINGS = {
+    'Sex': {
+        0: 'Female',
+        1: 'Male'
+    },
+    'Hispanic': {
+        0: 'Non-Hispanic',
+        1: 'Hispanic'
+    },
+    'Pre_NAC_IV': {
+        0: 'No prior IV N-acetylcysteine',
+        1: 'Received IV N-acetylcysteine'
+    },
+    'Infection': {
+        0: 'No infection documented',
+        1: 'Infection documented'
+    },
+    'Trt_Ventilator': {
+        0: 'Not on mechanical ventilation',
+        1: 'Receiving mechanical ventilation'
+    },
+    'Trt_Pressors': {
+        0: 'No vasopressor support',
+        1: 'Receiving vasopressor support'
+    },
+    'Trt_CVVH': {
+        0: 'Not receiving CVVH',
+        1: 'Receiving CVVH'
+    },
+    'F27Q04': {  # Coma Grade (West Haven Criteria for Hepatic Encephalopathy)
+        0: 'No Hepatic Encephalopathy (Grade 0)',
+        1: 'Mild Hepatic Encephalopathy (Grade 1)',
+        2: 'Moderate Hepatic Encephalopathy (Grade 2)',
+        3: 'Severe Hepatic Encephalopathy (Grade 3)',
+        4: 'Coma (Grade 4)'
+    }
+}
+
+def transform_categorical(value, var_name: str) -> str | None:
+    """Transform categorical variable to text label."""
+    if _is_missing(value):
+        return None
+    
+    if var_name not in CATEGORICAL_MAPPINGS:
+        return None
+    
+    mapping = CATEGORICAL_MAPPINGS[var_name]
+    
+    # Integer codes (1 and 1.0 hash alike); other finite numbers are truncated like _categorical_text
+    if value in mapping:
+        return mapping[value]
+    if isinstance(value, Real) and math.isfinite(value):
+        return mapping.get(int(value))
+    return None
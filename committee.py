@@ -0,0 +1,269 @@
+import pandas as pd
+import numpy as np
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import zlib
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from agent_cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_ENTRIES, DEFAULT_TTL_SECONDS, AgentCache, cached_backend
+from agent_router import AGENT_NAMES, AGENT_VARIABLES, KEY_COLUMNS, LABEL_COLUMN_SUFFIXES, label_fields, route_vignettes
+from data_io import output_path, read_table, write_table
+from prompt_renderer import PROMPT_TEMPLATE_VERSION, render_prompts
+
+logger = logging.getLogger(__name__)
+
+# Leader weighting of the specialist opinions (README: Critical Care 40%, Surgeon 30%, Hepatologist 30%)
+LEADER_WEIGHTS = {
+    'critical_care': 0.4,
+    'surgeon': 0.3,
+    'hepatologist': 0.3
+}
+LEADER = 'leader'
+SPECIALISTS = list(AGENT_VARIABLES)
+
+# Runner defaults
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 0.5
+
+# A backend answers one batched request: (agent, payloads) -> one opinion per payload.
+# Specialist payloads hold the agent's label fields (bins, trends, text) plus its rendered 'prompt';
+# identifiers and raw values are never sent, so equal labels make equal, cacheable requests.
+# Opinions are dicts with 'probability' (of 21-day spontaneous survival), 'decision' and 'reasoning'.
+Backend = Callable[[str, List[dict]], Awaitable[List[dict]]]
+
+class TransientBackendError(RuntimeError):
+    """A backend failure worth retrying (rate limit, timeout, dropped connection)."""
+
+def weighted_decision(opinions: Dict[str, dict], weights: Optional[Dict[str, float]] = None) -> dict:
+    """Combine specialist opinions into the leader's weighted survival probability and decision."""
+    weights = weights or LEADER_WEIGHTS
+    total = sum(weights[agent] for agent in opinions)
+    probability = sum(weights[agent] * opinions[agent]['probability'] for agent in opinions) / total
+    return {
+        'probability': probability,
+        'decision': 'Yes' if probability >= 0.5 else 'No',
+        'reasoning': '; '.join(
+            f"{AGENT_NAMES.get(agent, agent)} ({weights[agent]:.0%}): {opinion['decision']}"
+            for agent, opinion in opinions.items()
+        )
+    }
+
+def _stub_opinion(agent: str, payload: dict) -> dict:
+    """Deterministic offline opinion: the share of binned labels that are not critical or severe."""
+    labels = [value for key, value in payload.items() if key.endswith('_binned') and isinstance(value, str)]
+    severe = sum(('Critical' in label) or ('Severe' in label) for label in labels)
+    # Small per-agent jitter derived from the labels only, so equal inputs get equal opinions
+    fields = json.dumps(label_fields(payload), sort_keys=True, default=str)
+    jitter = (zlib.crc32(f"{agent}|{fields}".encode()) % 21 - 10) / 100
+    probability = float(np.clip(1 - severe / max(len(labels), 1) + jitter, 0, 1))
+    return {
+        'probability': probability,
+        'decision': 'Yes' if probability >= 0.5 else 'No',
+        'reasoning': f"{severe} of {len(labels)} binned findings critical or severe"
+    }
+
+def stub_backend(latency: float = 0.0, per_item_latency: float = 0.0, failure_rate: float = 0.0,
+                 seed: int = 0) -> Backend:
+    """Local backend for offline runs and benchmarks.
+
+    Each request sleeps `latency + per_item_latency * len(payloads)` seconds to mimic a model
+    endpoint and fails with TransientBackendError at `failure_rate`. The leader applies
+    weighted_decision() to the specialist opinions in its payloads.
+    """
+    rng = random.Random(seed)
+
+    async def backend(agent: str, payloads: List[dict]) -> List[dict]:
+        await asyncio.sleep(latency + per_item_latency * len(payloads))
+        if rng.random() < failure_rate:
+            raise TransientBackendError(f"Stub failure for {agent}")
+        if agent == LEADER:
+            return [weighted_decision(payload['opinions'], payload['weights']) for payload in payloads]
+        return [_stub_opinion(agent, payload) for payload in payloads]
+
+    return backend
+
+def _records(view: pd.DataFrame, agent: str) -> List[dict]:
+    """Patient-day payloads for one agent: its label fields, with None for missing labels, and the rendered prompt."""
+    # Column-wise object conversion; far cheaper than astype(object).where(...) on small batches
+    columns = {col: view[col].to_numpy(dtype=object, na_value=None)
+               for col in view.columns if col.endswith(tuple(LABEL_COLUMN_SUFFIXES))}
+    records = [dict(zip(columns, row)) for row in zip(*columns.values())]
+    for record, prompt in zip(records, render_prompts(view, agent)):
+        record['prompt'] = prompt
+    return records
+
+async def _call_with_retries(backend: Backend, agent: str, payloads: List[dict], semaphore: asyncio.Semaphore,
+                             metrics: Dict[str, list], max_retries: int, backoff: float) -> List[dict]:
+    """Call the backend under the concurrency limit, retrying transient failures with exponential backoff."""
+    for attempt in range(max_retries + 1):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                opinions = await backend(agent, payloads)
+            except (TransientBackendError, asyncio.TimeoutError, ConnectionError) as e:
+                metrics['retries'].append(agent)
+                if attempt == max_retries:
+                    raise
+                logger.warning(f"{agent} batch failed ({e}); retry {attempt + 1}/{max_retries}")
+            else:
+                metrics[agent].append(time.perf_counter() - start)
+                if len(opinions) != len(payloads):
+                    raise ValueError(f"{agent} returned {len(opinions)} opinions for {len(payloads)} payloads")
+                return opinions
+        # Back off outside the semaphore so waiting retries do not hold a slot
+        await asyncio.sleep(backoff * 2 ** attempt * (0.5 + random.random()))
+
+async def _run_batch(backend: Backend, batch: Dict[str, List[dict]], semaphore: asyncio.Semaphore,
+                     metrics: Dict[str, list], weights: Dict[str, float], max_retries: int,
+                     backoff: float) -> List[dict]:
+    """Run the specialists concurrently on one batch of patient-days, then the leader synthesis."""
+    start = time.perf_counter()
+    specialist_opinions = await asyncio.gather(*(
+        _call_with_retries(backend, agent, payloads, semaphore, metrics, max_retries, backoff)
+        for agent, payloads in batch.items()
+    ))
+    metrics['specialists'].append(time.perf_counter() - start)
+
+    per_row = [dict(zip(batch, row_opinions)) for row_opinions in zip(*specialist_opinions)]
+    leader_payloads = [{'opinions': opinions, 'weights': weights} for opinions in per_row]
+    leader_opinions = await _call_with_retries(backend, LEADER, leader_payloads, semaphore, metrics,
+                                               max_retries, backoff)
+    metrics['patient_day_batch'].append(time.perf_counter() - start)
+
+    rows = []
+    for opinions, leader in zip(per_row, leader_opinions):
+        row = {}
+        for agent, opinion in {**opinions, LEADER: leader}.items():
+            row[f"{agent}_probability"] = opinion['probability']
+            row[f"{agent}_decision"] = opinion['decision']
+        row[f"{LEADER}_reasoning"] = leader['reasoning']
+        rows.append(row)
+    return rows
+
+async def run_committee_async(vignettes_df: pd.DataFrame, backend: Backend, batch_size: int = DEFAULT_BATCH_SIZE,
+                              max_concurrency: int = DEFAULT_MAX_CONCURRENCY, max_retries: int = DEFAULT_MAX_RETRIES,
+                              backoff: float = DEFAULT_BACKOFF_SECONDS,
+                              weights: Optional[Dict[str, float]] = None) -> Tuple[pd.DataFrame, Dict[str, list]]:
+    """Run the committee over every patient-day of `vignettes_df`.
+
+    Patient-days are sent in batches of `batch_size`; each batch fans out to the three
+    specialists concurrently and then to the leader. At most `max_concurrency` backend
+    requests are in flight. Returns one prediction row per patient-day (input order) and the
+    raw per-stage latencies in seconds.
+    """
+    weights = weights or LEADER_WEIGHTS
+    views = route_vignettes(vignettes_df)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    metrics = defaultdict(list)
+
+    # Payloads are built once per agent and sliced per batch
+    records = {agent: _records(views[agent], agent) for agent in SPECIALISTS}
+    tasks = []
+    for start in range(0, len(vignettes_df), batch_size):
+        batch = {agent: records[agent][start:start + batch_size] for agent in SPECIALISTS}
+        tasks.append(_run_batch(backend, batch, semaphore, metrics, weights, max_retries, backoff))
+
+    start = time.perf_counter()
+    batches = await asyncio.gather(*tasks)
+    metrics['total'].append(time.perf_counter() - start)
+
+    predictions = pd.DataFrame([row for rows in batches for row in rows], index=vignettes_df.index)
+    predictions = pd.concat([vignettes_df[KEY_COLUMNS], predictions], axis=1).reset_index(drop=True)
+    return predictions, dict(metrics)
+
+def run_committee(vignettes_df: pd.DataFrame, backend: Optional[Backend] = None,
+                  **kwargs) -> Tuple[pd.DataFrame, Dict[str, list]]:
+    """Synchronous wrapper around run_committee_async (stub backend by default)."""
+    return asyncio.run(run_committee_async(vignettes_df, backend or stub_backend(), **kwargs))
+
+def latency_summary(metrics: Dict[str, list], n_patient_days: int) -> pd.DataFrame:
+    """Per-stage latency percentiles (ms) and overall throughput in patient-days/second."""
+    rows = []
+    for stage, latencies in metrics.items():
+        if stage in ('retries', 'total'):
+            continue
+        latencies = np.asarray(latencies) * 1000
+        rows.append({
+            'stage': stage,
+            'calls': len(latencies),
+            'p50_ms': np.percentile(latencies, 50),
+            'p95_ms': np.percentile(latencies, 95),
+            'max_ms': latencies.max()
+        })
+    summary = pd.DataFrame(rows)
+    total = metrics['total'][0]
+    summary.attrs['retries'] = len(metrics.get('retries', []))
+    summary.attrs['seconds'] = total
+    summary.attrs['patient_days_per_second'] = n_patient_days / total if total else float('inf')
+    return summary
+
+def log_latency_summary(summary: pd.DataFrame):
+    logger.info(f"Stage latencies:\n{summary.to_string(index=False, float_format='%.1f')}")
+    logger.info(f"Throughput: {summary.attrs['patient_days_per_second']:.1f} patient-days/s "
+                f"({summary.attrs['seconds']:.2f}s, {summary.attrs['retries']} retries)")
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Run the multi-agent transplant committee over clinical vignettes")
+    parser.add_argument('--input', default=str(output_path('clinical_vignettes', 'parquet')),
+                        help="Vignette table written by create_vignettes (parquet or feather)")
+    parser.add_argument('--output', default=str(output_path('committee_predictions', 'parquet')),
+                        help="Prediction table; format is taken from the suffix")
+    parser.add_argument('--limit', type=int, default=None, help="Only score the first N patient-days")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Patient-days per backend request (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help=f"Maximum backend requests in flight (default: {DEFAULT_MAX_CONCURRENCY})")
+    parser.add_argument('--retries', type=int, default=DEFAULT_MAX_RETRIES,
+                        help=f"Retries per failed request (default: {DEFAULT_MAX_RETRIES})")
+    parser.add_argument('--backoff', type=float, default=DEFAULT_BACKOFF_SECONDS,
+                        help=f"Initial retry backoff in seconds, doubled per attempt (default: {DEFAULT_BACKOFF_SECONDS})")
+    parser.add_argument('--stub-latency-ms', type=float, default=0.0,
+                        help="Simulated latency per request of the local stub backend")
+    parser.add_argument('--stub-failure-rate', type=float, default=0.0,
+                        help="Fraction of stub backend requests that fail transiently")
+    parser.add_argument('--cache-db', default=str(DEFAULT_CACHE_PATH),
+                        help=f"SQLite cache of agent responses (default: {DEFAULT_CACHE_PATH})")
+    parser.add_argument('--cache-max-entries', type=int, default=DEFAULT_MAX_ENTRIES,
+                        help=f"Least recently used responses are evicted beyond this many (default: {DEFAULT_MAX_ENTRIES})")
+    parser.add_argument('--cache-ttl-days', type=float, default=DEFAULT_TTL_SECONDS / 86400,
+                        help=f"Responses older than this are evicted (default: {DEFAULT_TTL_SECONDS / 86400:g})")
+    parser.add_argument('--no-cache', action='store_true', help="Call the backend for every patient-day")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    vignettes_df = read_table(args.input)
+    if args.limit:
+        vignettes_df = vignettes_df.head(args.limit)
+
+    backend = stub_backend(latency=args.stub_latency_ms / 1000, failure_rate=args.stub_failure_rate)
+    cache = None
+    if not args.no_cache:
+        cache = AgentCache(args.cache_db, max_entries=args.cache_max_entries, ttl_seconds=args.cache_ttl_days * 86400)
+        backend = cached_backend(backend, cache, PROMPT_TEMPLATE_VERSION)
+    logger.info(f"Running committee over {len(vignettes_df)} patient-days with the local stub backend")
+    predictions, metrics = run_committee(
+        vignettes_df, backend, batch_size=args.batch_size, max_concurrency=args.concurrency,
+        max_retries=args.retries, backoff=args.backoff
+    )
+    log_latency_summary(latency_summary(metrics, len(vignettes_df)))
+    if cache is not None:
+        for agent, stats in cache.stats().items():
+            logger.info(f"Cache {agent}: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%})")
+        cache.close()
+
+    output_file = write_table(predictions, args.output)
+    logger.info(f"Saved predictions to {output_file}")
+    logger.info(f"Leader decisions: {predictions[f'{LEADER}_decision'].value_counts().to_dict()}")
+
+if __name__ == '__main__':
+    main()
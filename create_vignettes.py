@@ -1,132 +1,66 @@
 import pandas as pd
 import numpy as np
+import argparse
 import logging
-from typing import Dict, Tuple, Optional
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple, Optional
+
+from agent_router import write_agent_partitions
+from clinical_tables import (BINNING_THRESHOLDS, CATEGORICAL_MAPPINGS, STATIC_CATEGORICAL_VARS, TREATMENT_VARS,
+                             VIGNETTE_DAYS, bin_continuous_value, transform_categorical)
+from instrumentation import (add_metrics_arguments, add_records, collect_worker_metrics, instrumented, metrics_session,
+                             stage, take_records, worker_settings)
+from data_io import (DEFAULT_FORMAT, FORMAT_SUFFIXES, iter_table_batches, output_path, read_arrow_rows, read_table,
+                     table_columns, write_arrow_file, write_batches, write_table)
+from patient_store import day_cube, is_store, iter_store_chunks, read_store
+from subject_schema import as_float64
+from trend_engine import TREND_CLASSES, TREND_WINDOWS, trend_reach, window_trends
+from vignette_manifest import (affected_days, manifest_path, manifest_summary, read_manifest, settings_digest,
+                               subject_fingerprints, write_manifest)
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Clinical binning thresholds based on medical literature and README examples
-BINNING_THRESHOLDS = {
-    'Lactate': {
-        'bins': [0, 2.0, 4.0, 7.0, float('inf')],
-        'labels': ['Normal', 'Elevated (Hyperlactatemia)', 'Severely Elevated (Lactic Acidosis)', 'Critical (High Mortality Risk)'],
-        'unit': 'mmol/L'
-    },
-    'Creat': {
-        'bins': [0, 1.2, 1.6, 2.5, float('inf')],
-        'labels': ['Normal', 'High (Meets Stage 1 AKI criteria)', 'Severely High (Stage 2 AKI)', 'Critical (Stage 3 AKI)'],
-        'unit': 'mg/dL'
-    },
-    'INR1': {
-        'bins': [0, 1.2, 1.8, 3.0, float('inf')],
-        'labels': ['Normal', 'Elevated (Hepatic Dysfunction)', 'Severely Elevated (Synthetic Failure)', 'Critical'],
-        'unit': ''
-    },
-    'Hemoglobin': {
-        'bins': [0, 10.0, 12.0, 15.0, float('inf')],
-        'labels': ['Critical (Severe Anemia)', 'Low (Moderate Anemia)', 'Normal', 'High'],
-        'unit': 'g/dL'
-    },
-    'WBC': {
-        'bins': [0, 4.0, 10.0, 15.0, float('inf')],
-        'labels': ['Low (Leukopenia)', 'Normal', 'Elevated (Leukocytosis)', 'High (Severe Leukocytosis)'],
-        'unit': 'k/uL'
-    },
-    'Platelet_Cnt': {
-        'bins': [0, 50, 100, 150, float('inf')],
-        'labels': ['Critical (Severe Thrombocytopenia)', 'Low (Thrombocytopenia)', 'Borderline', 'Normal'],
-        'unit': 'k/uL'
-    },
-    'Bilirubin': {
-        'bins': [0, 1.2, 2.0, 5.0, float('inf')],
-        'labels': ['Normal', 'Elevated', 'High (Jaundice)', 'Critical (Severe Hyperbilirubinemia)'],
-        'unit': 'mg/dL'
-    },
-    'ALT': {
-        'bins': [0, 40, 100, 300, float('inf')],
-        'labels': ['Normal', 'Elevated', 'High', 'Critical (Severe Hepatocellular Injury)'],
-        'unit': 'U/L'
-    },
-    'NA': {
-        'bins': [0, 130, 135, 145, float('inf')],
-        'labels': ['Critical (Severe Hyponatremia)', 'Low (Hyponatremia)', 'Normal', 'High (Hypernatremia)'],
-        'unit': 'mEq/L'
-    },
-    'HCO3': {
-        'bins': [0, 18, 22, 26, float('inf')],
-        'labels': ['Critical (Severe Acidosis)', 'Low (Acidosis)', 'Normal', 'High (Alkalosis)'],
-        'unit': 'mEq/L'
-    },
-    'Phosphate': {
-        'bins': [0, 2.5, 3.5, 4.5, float('inf')],
-        'labels': ['Low (Hypophosphatemia)', 'Normal', 'Elevated', 'High (Hyperphosphatemia)'],
-        'unit': 'mg/dL'
-    },
-    'PH': {
-        'bins': [0, 7.2, 7.35, 7.45, float('inf')],
-        'labels': ['Critical (Severe Acidosis)', 'Low (Acidosis)', 'Normal', 'High (Alkalosis)'],
-        'unit': ''
-    },
-    'Arterial_Ammonia': {
-        'bins': [0, 50, 100, 200, float('inf')],
-        'labels': ['Normal', 'Elevated', 'High', 'Critical (Severe Hyperammonemia)'],
-        'unit': 'μmol/L'
-    },
-    'Venous_Ammonia': {
-        'bins': [0, 50, 100, 200, float('inf')],
-        'labels': ['Normal', 'Elevated', 'High', 'Critical (Severe Hyperammonemia)'],
-        'unit': 'μmol/L'
-    },
-    'ammonia': {
-        'bins': [0, 50, 100, 200, float('inf')],
-        'labels': ['Normal', 'Elevated', 'High', 'Critical (Severe Hyperammonemia)'],
-        'unit': 'μmol/L'
-    },
-    'Ratio_PO2_FiO2': {
-        'bins': [0, 200, 300, 400, float('inf')],
-        'labels': ['Critical (Severe ARDS)', 'Low (ARDS)', 'Moderate (ALI)', 'Normal'],
-        'unit': ''
-    },
-    'Prothrom_Sec': {
-        'bins': [0, 12, 15, 18, float('inf')],
-        'labels': ['Normal', 'Elevated', 'High', 'Critical (Severe Coagulopathy)'],
-        'unit': 'seconds'
-    },
-    'PMN': {
-        'bins': [0, 40, 60, 80, float('inf')],
-        'labels': ['Low', 'Normal', 'Elevated', 'High'],
-        'unit': '%'
-    },
-    'Lymph': {
-        'bins': [0, 15, 30, 45, float('inf')],
-        'labels': ['Low (Lymphopenia)', 'Normal', 'Elevated', 'High'],
-        'unit': '%'
-    }
-}
+def _compile_binning_thresholds(thresholds: Dict[str, dict]) -> Dict[str, dict]:
+    """Precompile binning thresholds into contiguous edge arrays and categorical label dtypes."""
+    compiled = {}
+    for var_name, spec in thresholds.items():
+        compiled[var_name] = {
+            'edges': np.ascontiguousarray(spec['bins'], dtype=np.float64),
+            'dtype': pd.CategoricalDtype(spec['labels'], ordered=True)
+        }
+    return compiled
 
-def bin_continuous_value(value: float, var_name: str) -> Optional[str]:
-    """Bin a continuous value based on clinical thresholds."""
-    if pd.isna(value):
-        return None
-    
-    if var_name not in BINNING_THRESHOLDS:
-        return None
-    
-    thresholds = BINNING_THRESHOLDS[var_name]
-    bins = thresholds['bins']
-    labels = thresholds['labels']
-    
-    # Find which bin the value falls into
-    for i in range(len(bins) - 1):
-        if bins[i] <= value < bins[i + 1]:
-            return labels[i]
-    
-    # Handle edge case for last bin
-    if value >= bins[-2]:
-        return labels[-1]
+# Binning tables compiled once at import for array binning
+COMPILED_BINS = _compile_binning_thresholds(BINNING_THRESHOLDS)
+
+def bin_codes(values, var_name: str) -> np.ndarray:
+    """Bin an array of values; returns int8 label codes with -1 for missing or out-of-range values.
+
+    Matches bin_continuous_value: bins are left-closed and the last bin is open-ended.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if var_name not in COMPILED_BINS:
+        return np.full(values.shape, -1, dtype=np.int8)
     
-    return None
+    compiled = COMPILED_BINS[var_name]
+    n_labels = len(compiled['dtype'].categories)
+    codes = np.searchsorted(compiled['edges'], values, side='right') - 1
+    np.minimum(codes, n_labels - 1, out=codes)
+    codes[np.isnan(values)] = -1
+    return codes.astype(np.int8)
+
+def bin_continuous_array(values, var_name: str) -> pd.Categorical:
+    """Bin a Series or array of continuous values into a Categorical of clinical labels.
+
+    Missing values (and values bin_continuous_value maps to None) are left as missing.
+    """
+    codes = bin_codes(values, var_name)
+    if var_name not in COMPILED_BINS:
+        return pd.Categorical.from_codes(codes.ravel(), categories=[])
+    return pd.Categorical.from_codes(codes.ravel(), dtype=COMPILED_BINS[var_name]['dtype'])
 
 def calculate_trend(current: float, previous: float, days_diff: int = 1) -> Optional[str]:
     """Calculate trend description between two time points."""
@@ -157,93 +91,6 @@ def calculate_trend(current: float, previous: float, days_diff: int = 1) -> Opti
     else:
         return "Stable"
 
-# Categorical variable mappings
-CATEGORICAL_MAPPINGS = {
-    'Sex': {
-        0: 'Female',
-        1: 'Male',
-        0.0: 'Female',
-        1.0: 'Male'
-    },
-    'Hispanic': {
-        0: 'Non-Hispanic',
-        1: 'Hispanic',
-        0.0: 'Non-Hispanic',
-        1.0: 'Hispanic'
-    },
-    'Pre_NAC_IV': {
-        0: 'No prior IV N-acetylcysteine',
-        1: 'Received IV N-acetylcysteine',
-        0.0: 'No prior IV N-acetylcysteine',
-        1.0: 'Received IV N-acetylcysteine'
-    },
-    'Infection': {
-        0: 'No infection documented',
-        1: 'Infection documented',
-        0.0: 'No infection documented',
-        1.0: 'Infection documented'
-    },
-    'Trt_Ventilator': {
-        0: 'Not on mechanical ventilation',
-        1: 'Receiving mechanical ventilation',
-        0.0: 'Not on mechanical ventilation',
-        1.0: 'Receiving mechanical ventilation'
-    },
-    'Trt_Pressors': {
-        0: 'No vasopressor support',
-        1: 'Receiving vasopressor support',
-        0.0: 'No vasopressor support',
-        1.0: 'Receiving vasopressor support'
-    },
-    'Trt_CVVH': {
-        0: 'Not receiving CVVH',
-        1: 'Receiving CVVH',
-        0.0: 'Not receiving CVVH',
-        1.0: 'Receiving CVVH'
-    },
-    'F27Q04': {  # Coma Grade (West Haven Criteria for Hepatic Encephalopathy)
-        0: 'No Hepatic Encephalopathy (Grade 0)',
-        1: 'Mild Hepatic Encephalopathy (Grade 1)',
-        2: 'Moderate Hepatic Encephalopathy (Grade 2)',
-        3: 'Severe Hepatic Encephalopathy (Grade 3)',
-        4: 'Coma (Grade 4)',
-        0.0: 'No Hepatic Encephalopathy (Grade 0)',
-        1.0: 'Mild Hepatic Encephalopathy (Grade 1)',
-        2.0: 'Moderate Hepatic Encephalopathy (Grade 2)',
-        3.0: 'Severe Hepatic Encephalopathy (Grade 3)',
-        4.0: 'Coma (Grade 4)'
-    }
-}
-
-def transform_categorical(value, var_name: str) -> Optional[str]:
-    """Transform categorical variable to text label."""
-    if pd.isna(value):
-        return None
-    
-    if var_name not in CATEGORICAL_MAPPINGS:
-        return None
-    
-    mapping = CATEGORICAL_MAPPINGS[var_name]
-    
-    # Try exact match first
-    if value in mapping:
-        return mapping[value]
-    
-    # Try converting to int/float
-    try:
-        if isinstance(value, float):
-            int_val = int(value)
-            if int_val in mapping:
-                return mapping[int_val]
-        elif isinstance(value, int):
-            float_val = float(value)
-            if float_val in mapping:
-                return mapping[float_val]
-    except (ValueError, TypeError):
-        pass
-    
-    return None
-
 def calculate_trend_detailed(current: float, previous: float, days_diff: int, var_name: str) -> Optional[str]:
     """Calculate detailed trend description with context."""
     if pd.isna(current) or pd.isna(previous) or days_diff <= 0:
@@ -290,165 +137,681 @@ def calculate_trend_detailed(current: float, previous: float, days_diff: int, va
     
     return trend
 
-def create_vignettes(df: pd.DataFrame) -> pd.DataFrame:
-    """Create clinical vignettes for each patient-day combination."""
+# Subjects per batch in streaming mode
+DEFAULT_CHUNK_SIZE = 10_000
+
+# Shard inputs and outputs are exchanged with worker processes as Arrow files in this directory
+# (/dev/shm keeps them in shared memory on Linux; elsewhere the system temp directory is used)
+SHARD_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+def _trend_text_table(var_name: str) -> list:
+    """Flat table of trend strings indexed by (trend class, previous bin + 1, current bin + 1).
+
+    The final entry is None and is used for cells without a trend.
+    """
+    bin_labels = [None] + BINNING_THRESHOLDS[var_name]['labels']
+    table = []
+    for trend in TREND_CLASSES:
+        for previous_bin in bin_labels:
+            for current_bin in bin_labels:
+                if current_bin and previous_bin:
+                    if current_bin != previous_bin:
+                        table.append(f"{trend} (from {previous_bin} to {current_bin})")
+                    else:
+                        table.append(f"{trend} (remains {current_bin})")
+                else:
+                    table.append(trend)
+    table.append(None)
+    return table
+
+def _category_codes(dtype: pd.CategoricalDtype, labels: list) -> np.ndarray:
+    """Codes of `labels` within `dtype`, with -1 for None."""
+    return np.array([-1 if label is None else dtype.categories.get_loc(label) for label in labels], dtype=np.int16)
+
+# Fixed category sets shared by every column of a vignette label family
+BINNED_DTYPE = pd.CategoricalDtype(list(dict.fromkeys(
+    label for spec in BINNING_THRESHOLDS.values() for label in spec['labels']
+)))
+TREND_DTYPE = pd.CategoricalDtype(list(dict.fromkeys(
+    trend for var_name in BINNING_THRESHOLDS for trend in _trend_text_table(var_name) if trend is not None
+)))
+TEXT_DTYPE = pd.CategoricalDtype(list(dict.fromkeys(
+    label for mapping in CATEGORICAL_MAPPINGS.values() for label in mapping.values()
+)))
+
+# Per-variable code lookups into the shared family dtypes (last entry maps missing to -1)
+_BINNED_CODES = {
+    var_name: _category_codes(BINNED_DTYPE, spec['labels'] + [None])
+    for var_name, spec in BINNING_THRESHOLDS.items()
+}
+_TREND_CODES = {var_name: _category_codes(TREND_DTYPE, _trend_text_table(var_name)) for var_name in BINNING_THRESHOLDS}
+
+def _categorical_text(values: np.ndarray, var_name: str) -> pd.Categorical:
+    """Vectorized transform_categorical over a float array."""
+    mapping = {int(key): label for key, label in CATEGORICAL_MAPPINGS[var_name].items()}
+    lookup = _category_codes(TEXT_DTYPE, [mapping.get(code) for code in range(max(mapping) + 1)] + [None])
+    truncated = np.trunc(values)
+    valid = np.isfinite(truncated) & (truncated >= 0) & (truncated < len(lookup) - 1)
+    codes = np.where(valid, truncated, len(lookup) - 1).astype(np.intp)
+    return pd.Categorical.from_codes(lookup[codes], dtype=TEXT_DTYPE)
+
+def _static_values(series: pd.Series) -> np.ndarray:
+    """Values of a static column as a plain array; nullable integer codes become floats with NaN."""
+    if pd.api.types.is_extension_array_dtype(series) and pd.api.types.is_numeric_dtype(series):
+        return as_float64(series)
+    return series.to_numpy()
+
+def build_day_cube(df: pd.DataFrame, variables: list, days: list) -> np.ndarray:
+    """Reshape wide {var}_day_{n} columns into a float (subject, day, var) array."""
+    columns = [f"{var}_day_{day}" for var in variables for day in days]
+    cube = np.full((len(df), len(columns)), np.nan)
+    for k, col in enumerate(columns):
+        if col in df.columns:
+            cube[:, k] = as_float64(df[col])
+    return cube.reshape(len(df), len(variables), len(days)).transpose(0, 2, 1)
+
+def vignette_input_columns(columns: List[str], n_days: int = len(VIGNETTE_DAYS)) -> List[str]:
+    """Select the merged-table columns create_vignettes reads, for column-projected input."""
+    static_vars = ['subject_id', 'Spont_Survival21'] + STATIC_CATEGORICAL_VARS
+    continuous_vars = [var for var in BINNING_THRESHOLDS.keys() if any(f"{var}_day_" in col for col in columns)]
+    day_cols = {f"{var}_day_{day}" for var in continuous_vars + TREATMENT_VARS for day in range(1, n_days + 1)}
+    # Keep one column per continuous variable so create_vignettes detects it even without days 1..n_days
+    detected = [next(col for col in columns if f"{var}_day_" in col) for var in continuous_vars]
+    return [col for col in columns if col in static_vars or col in day_cols or col in detected]
+
+def _wide_continuous_vars(columns) -> List[str]:
+    """Continuous variables with at least one day column in the wide table."""
+    return [var for var in BINNING_THRESHOLDS.keys() if any(f"{var}_day_" in col for col in columns)]
+
+def _wide_static_data(df: pd.DataFrame) -> pd.DataFrame:
+    """Static variables for each row of the wide table, taken from the first row of each subject."""
+    static_vars = ['subject_id'] + STATIC_CATEGORICAL_VARS
+    static_data = df[static_vars].drop_duplicates('subject_id').set_index('subject_id').reindex(df['subject_id'])
+    static_data = static_data.reset_index()
+    static_data['Spont_Survival21'] = df['Spont_Survival21'].array
+    return static_data
+
+def _wide_vignettes(df: pd.DataFrame, static_data: pd.DataFrame, continuous_vars: List[str],
+                    days: List[int], categorical: bool) -> pd.DataFrame:
+    return _assemble_vignettes(
+        static_data,
+        build_day_cube(df, continuous_vars, days),
+        continuous_vars,
+        build_day_cube(df, TREATMENT_VARS, days),
+        days,
+        categorical
+    )
+
+def _long_vignettes(subjects_df: pd.DataFrame, days_df: pd.DataFrame, continuous_vars: List[str],
+                    days: List[int], categorical: bool) -> pd.DataFrame:
+    subject_ids = subjects_df['subject_id'].to_numpy()
+    return _assemble_vignettes(
+        subjects_df,
+        day_cube(days_df, subject_ids, continuous_vars, days),
+        continuous_vars,
+        day_cube(days_df, subject_ids, TREATMENT_VARS, days),
+        days,
+        categorical
+    )
+
+def _log_vignettes(vignettes_df: pd.DataFrame):
+    logger.info(f"Created {len(vignettes_df)} vignettes for {vignettes_df['subject_id'].nunique()} subjects")
+    logger.info(f"Vignette shape: {vignettes_df.shape}")
+
+@instrumented()
+def create_vignettes(df: pd.DataFrame, categorical: bool = True, n_days: int = len(VIGNETTE_DAYS)) -> pd.DataFrame:
+    """Create clinical vignettes for each patient-day combination from the wide merged table.
+
+    Label columns (`_binned`, `_trend*`, `_text`) are Categoricals over the shared
+    BINNED_DTYPE, TREND_DTYPE and TEXT_DTYPE category sets. Pass categorical=False
+    for the object-dtype layout with None for missing labels.
+    """
+    logger.info("Creating clinical vignettes...")
+    days = list(range(1, n_days + 1))
+    vignettes_df = _wide_vignettes(df, _wide_static_data(df), _wide_continuous_vars(df.columns), days, categorical)
+    _log_vignettes(vignettes_df)
+    return vignettes_df
+
+@instrumented()
+def create_vignettes_long(subjects_df: pd.DataFrame, days_df: pd.DataFrame, categorical: bool = True,
+                          n_days: int = len(VIGNETTE_DAYS)) -> pd.DataFrame:
+    """Create clinical vignettes directly from the long-format (subjects, days) store tables."""
     logger.info("Creating clinical vignettes...")
+    continuous_vars = [var for var in BINNING_THRESHOLDS.keys() if var in days_df.columns]
+    days = list(range(1, n_days + 1))
+    vignettes_df = _long_vignettes(subjects_df, days_df, continuous_vars, days, categorical)
+    _log_vignettes(vignettes_df)
+    return vignettes_df
+
+def iter_vignette_batches(df: pd.DataFrame, chunk_size: int = DEFAULT_CHUNK_SIZE, categorical: bool = True,
+                          n_days: int = len(VIGNETTE_DAYS)) -> Iterator[pd.DataFrame]:
+    """Yield vignettes for `chunk_size` subjects (wide-table rows) at a time.
+
+    Concatenating the batches gives exactly create_vignettes(df).
+    """
+    days = list(range(1, n_days + 1))
+    continuous_vars = _wide_continuous_vars(df.columns)
+    static_data = _wide_static_data(df)
+    for start in range(0, len(df), chunk_size):
+        rows = slice(start, start + chunk_size)
+        yield _wide_vignettes(df.iloc[rows], static_data.iloc[rows], continuous_vars, days, categorical)
+
+def iter_vignette_batches_long(subjects_df: pd.DataFrame, days_df: pd.DataFrame, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                               categorical: bool = True, n_days: int = len(VIGNETTE_DAYS)) -> Iterator[pd.DataFrame]:
+    """Yield vignettes from the long-format store for `chunk_size` subjects at a time."""
+    days = list(range(1, n_days + 1))
+    continuous_vars = [var for var in BINNING_THRESHOLDS.keys() if var in days_df.columns]
+    
+    # Order patient-days by subject position so each chunk is one contiguous slice
+    subject_pos = pd.Index(subjects_df['subject_id']).get_indexer(days_df['subject_id'])
+    order = np.argsort(subject_pos, kind='stable')
+    days_df = days_df.iloc[order]
+    subject_pos = subject_pos[order]
+    
+    for start in range(0, len(subjects_df), chunk_size):
+        lo, hi = np.searchsorted(subject_pos, [start, start + chunk_size])
+        yield _long_vignettes(subjects_df.iloc[start:start + chunk_size], days_df.iloc[lo:hi],
+                              continuous_vars, days, categorical)
+
+def iter_vignette_batches_from_file(path, chunk_size: int = DEFAULT_CHUNK_SIZE, categorical: bool = True,
+                                    n_days: int = len(VIGNETTE_DAYS)) -> Iterator[pd.DataFrame]:
+    """Stream the wide merged table from disk and yield vignettes one chunk of subjects at a time.
+
+    Only one chunk of input rows is in memory at once. Static variables are taken from the
+    first row of each subject within a chunk, which matches create_vignettes when subject_ids
+    are unique (as written by process_excel).
+    """
+    days = list(range(1, n_days + 1))
+    columns = vignette_input_columns(table_columns(path), n_days=n_days)
+    continuous_vars = _wide_continuous_vars(columns)
+    for chunk in iter_table_batches(path, columns=columns, batch_size=chunk_size):
+        yield _wide_vignettes(chunk, _wide_static_data(chunk), continuous_vars, days, categorical)
+
+def iter_vignette_batches_from_store(store_dir, chunk_size: int = DEFAULT_CHUNK_SIZE, categorical: bool = True,
+                                     n_days: int = len(VIGNETTE_DAYS)) -> Iterator[pd.DataFrame]:
+    """Stream a long-format store from disk and yield vignettes one chunk of subjects at a time.
+
+    Only one chunk of subjects and their patient-days is in memory at once (iter_store_chunks).
+    """
+    days = list(range(1, n_days + 1))
+    for subjects_df, days_df in iter_store_chunks(store_dir, chunk_size,
+                                                  subject_columns=['Spont_Survival21'] + STATIC_CATEGORICAL_VARS,
+                                                  day_columns=list(BINNING_THRESHOLDS) + TREATMENT_VARS):
+        continuous_vars = [var for var in BINNING_THRESHOLDS.keys() if var in days_df.columns]
+        yield _long_vignettes(subjects_df, days_df, continuous_vars, days, categorical)
+
+@instrumented('assemble_vignettes')
+def _assemble_vignettes(static_data: pd.DataFrame, cube: np.ndarray, continuous_vars: List[str],
+                        treatment_cube: np.ndarray, days: List[int], categorical: bool) -> pd.DataFrame:
+    """Build vignette columns from per-subject static data and (subject, day, var) value cubes."""
+    n_subjects = len(static_data)
+    n_days = len(days)
     
-    # Get all day columns for each variable
-    continuous_vars = [var for var in BINNING_THRESHOLDS.keys() if any(f"{var}_day_" in col for col in df.columns)]
+    vignette = {
+        'subject_id': np.repeat(static_data['subject_id'].to_numpy(), n_days),
+        'day': np.tile(np.array(days, dtype=np.int64), n_subjects),
+        'Spont_Survival21': np.repeat(_static_values(static_data['Spont_Survival21']), n_days),
+    }
+    for var in STATIC_CATEGORICAL_VARS:
+        values = np.repeat(_static_values(static_data[var]), n_days)
+        vignette[var] = values
+        vignette[f"{var}_text"] = _categorical_text(pd.to_numeric(values, errors='coerce').astype(float), var)
+    
+    # Binned and raw values for every (subject, day, var) cell
+    codes = np.empty(cube.shape, dtype=np.int8)
+    for j, var in enumerate(continuous_vars):
+        codes[:, :, j] = bin_codes(cube[:, :, j], var)
     
-    # Create a list to store vignette rows
-    vignette_rows = []
+    for j, var in enumerate(continuous_vars):
+        binned_codes = _BINNED_CODES[var][codes[:, :, j].ravel()]
+        vignette[f"{var}_binned"] = pd.Categorical.from_codes(binned_codes, dtype=BINNED_DTYPE)
+        vignette[f"{var}_value"] = cube[:, :, j].ravel()
     
-    # Get static variables (not time-varying)
-    static_vars = ['subject_id', 'Spont_Survival21', 'Sex', 'Hispanic', 'Pre_NAC_IV']
-    static_data = df[static_vars].copy()
+    # Trend windows, then one lookup per (var, window) into the variable's trend text table
+    windows = list(window_trends(cube, codes))
+    for j, var in enumerate(continuous_vars):
+        table = _TREND_CODES[var]
+        n_bins = len(BINNING_THRESHOLDS[var]['labels']) + 1
+        for suffix, trend, previous_codes, current_codes in windows:
+            trend_j = trend[:, :, j].astype(np.intp)
+            index = (trend_j * n_bins + previous_codes[:, :, j] + 1) * n_bins + current_codes[:, :, j] + 1
+            index[trend_j < 0] = len(table) - 1
+            vignette[f"{var}{suffix}"] = pd.Categorical.from_codes(table[index.ravel()], dtype=TREND_DTYPE)
     
-    # Process each subject
-    for idx, row in df.iterrows():
-        subject_id = row['subject_id']
-        spont_survival = row['Spont_Survival21']
+    # Add binary treatment variables with text labels
+    for j, treatment in enumerate(TREATMENT_VARS):
+        values = treatment_cube[:, :, j].ravel()
+        vignette[treatment] = values
+        vignette[f"{treatment}_text"] = _categorical_text(values, treatment)
+    
+    vignettes_df = pd.DataFrame(vignette)
+    if not categorical:
+        vignettes_df = to_object_layout(vignettes_df)
+    return vignettes_df
+
+def subject_shards(subject_ids, n_shards: int) -> np.ndarray:
+    """Shard of each row: a hash of its subject_id modulo n_shards, stable across processes and runs."""
+    hashes = pd.util.hash_pandas_object(pd.Series(subject_ids), index=False).to_numpy()
+    return (hashes % np.uint64(n_shards)).astype(np.intp)
+
+def _build_vignettes(layout: str, frames: List[pd.DataFrame], continuous_vars: List[str],
+                     days: List[int]) -> pd.DataFrame:
+    if layout == 'long':
+        return _long_vignettes(*frames, continuous_vars, days, True)
+    return _wide_vignettes(frames[0], _wide_static_data(frames[0]), continuous_vars, days, True)
+
+def _output_layout(template: pd.DataFrame, n_rows: int) -> Tuple[Dict[str, Tuple[int, str]], int]:
+    """Place each column of `n_rows` vignettes shaped like `template` in one shared output buffer.
+
+    Returns ({column: (byte offset, storage dtype)}, buffer size). Categorical columns are
+    stored as their integer codes; object columns have no place and are gathered separately.
+    """
+    layout, size = {}, 0
+    for col, dtype in template.dtypes.items():
+        storage = template[col].cat.codes.dtype if isinstance(dtype, pd.CategoricalDtype) else np.dtype(dtype)
+        if storage == object:
+            continue
+        layout[col] = (size, storage.str)
+        size += -(-n_rows * storage.itemsize // 64) * 64
+    return layout, size
+
+def _column_view(buffer: np.ndarray, layout: Dict[str, Tuple[int, str]], col: str, n_rows: int) -> np.ndarray:
+    offset, storage = layout[col]
+    return np.frombuffer(buffer, dtype=storage, count=n_rows, offset=offset)
+
+def _shard_vignettes(layout: str, input_paths: List[str], rows: List[np.ndarray], targets: np.ndarray,
+                     output, output_layout: dict, n_rows: int, continuous_vars: List[str], days: List[int],
+                     collect_metrics=None) -> Tuple[Dict[str, np.ndarray], list]:
+    """Worker: build one shard's vignettes from the memory-mapped inputs.
+
+    Columns are written straight to their final rows (`targets`) of the shared output buffer;
+    returns the object columns, which cannot live there, and the recorded stages.
+    """
+    collect_worker_metrics(collect_metrics)
+    with stage('shard_vignettes', rows=len(targets)):
+        frames = [read_arrow_rows(path, shard_rows) for path, shard_rows in zip(input_paths, rows)]
+        vignettes_df = _build_vignettes(layout, frames, continuous_vars, days)
+        buffer = np.memmap(output, dtype=np.uint8, mode='r+')
+        objects = {}
+        for col in vignettes_df.columns:
+            values = vignettes_df[col]
+            if col not in output_layout:
+                objects[col] = values.to_numpy()
+                continue
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.cat.codes
+            _column_view(buffer, output_layout, col, n_rows)[targets] = values.to_numpy()
+        del buffer
+    return objects, take_records() if collect_metrics is not None else []
+
+def _sharded_vignettes(layout: str, frames: List[pd.DataFrame], continuous_vars: List[str], days: List[int],
+                       workers: int, shards: Optional[int], categorical: bool) -> pd.DataFrame:
+    """Build vignettes in a process pool, one task per subject_id hash shard.
+
+    The first frame holds one row per subject. Each frame is written once as an Arrow file that
+    every worker memory-maps, taking only its shard's rows, and workers write their vignettes
+    into a shared memory-mapped buffer at their rows in the serial output order, so nothing is
+    pickled or reordered afterwards and the result equals the single-process build.
+    """
+    shards = shards or workers
+    with stage('plan_shards'):
+        shard_rows = []
+        for frame in frames:
+            shard_of = subject_shards(frame['subject_id'], shards)
+            order = np.argsort(shard_of, kind='stable')
+            bounds = np.searchsorted(shard_of[order], np.arange(shards + 1))
+            shard_rows.append([order[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])])
+        tasks = [k for k in range(shards) if len(shard_rows[0][k])]
         
-        # Get static variables for this subject
-        static_row = static_data[static_data['subject_id'] == subject_id].iloc[0]
+        # Column layout from the vignettes of the first subject; each subject row yields len(days) rows
+        template = _build_vignettes(layout, [frame.iloc[:1] for frame in frames], continuous_vars, days)
+        n_rows = len(frames[0]) * len(days)
+        output_layout, size = _output_layout(template, n_rows)
+    
+    with tempfile.TemporaryDirectory(prefix='vignette_shards_', dir=SHARD_DIR) as shard_dir:
+        with stage('write_shard_inputs'):
+            input_paths = [str(write_arrow_file(frame, Path(shard_dir) / f"input-{i}.arrow"))
+                           for i, frame in enumerate(frames)]
+            output = Path(shard_dir) / 'vignettes.bin'
+            with open(output, 'wb') as f:
+                f.truncate(max(size, 1))
+        logger.info(f"Building vignettes for {len(frames[0])} subjects in {len(tasks)} shards with {workers} workers")
         
-        # Process each day (1-7)
-        for day in range(1, 8):
-            day_str = str(day)
-            
-            # Create base vignette row
-            vignette = {
-                'subject_id': subject_id,
-                'day': day,
-                'Spont_Survival21': spont_survival,
-                'Sex': static_row['Sex'],
-                'Sex_text': transform_categorical(static_row['Sex'], 'Sex'),
-                'Hispanic': static_row['Hispanic'],
-                'Hispanic_text': transform_categorical(static_row['Hispanic'], 'Hispanic'),
-                'Pre_NAC_IV': static_row['Pre_NAC_IV'],
-                'Pre_NAC_IV_text': transform_categorical(static_row['Pre_NAC_IV'], 'Pre_NAC_IV')
-            }
-            
-            # Add binned values for this day
-            for var in continuous_vars:
-                day_col = f"{var}_day_{day_str}"
-                if day_col in df.columns:
-                    value = row[day_col]
-                    if not pd.isna(value):
-                        binned = bin_continuous_value(value, var)
-                        vignette[f"{var}_binned"] = binned
-                        vignette[f"{var}_value"] = value
-                    else:
-                        vignette[f"{var}_binned"] = None
-                        vignette[f"{var}_value"] = None
-                else:
-                    vignette[f"{var}_binned"] = None
-                    vignette[f"{var}_value"] = None
-            
-            # Add trend information (comparing to previous days)
-            # For day i, calculate:
-            # - Day i-1 to Day i (current period, 1 day)
-            # - Day i-2 to Day i-1 (previous period, 1 day)
-            # - Day i-3 to Day i-1 (longer term, 2 days)
-            for var in continuous_vars:
-                # Current period: Day i-1 to Day i
-                if day > 1:
-                    prev_day = str(day - 1)
-                    current_col = f"{var}_day_{day_str}"
-                    prev_col = f"{var}_day_{prev_day}"
-                    
-                    if current_col in df.columns and prev_col in df.columns:
-                        current_val = row[current_col]
-                        prev_val = row[prev_col]
-                        
-                        if not pd.isna(current_val) and not pd.isna(prev_val):
-                            trend = calculate_trend_detailed(current_val, prev_val, 1, var)
-                            vignette[f"{var}_trend"] = trend
-                        else:
-                            vignette[f"{var}_trend"] = None
-                    else:
-                        vignette[f"{var}_trend"] = None
-                else:
-                    # Day 1 (Admission) has no current trend
-                    vignette[f"{var}_trend"] = None
-                
-                # Previous period: Day i-2 to Day i-1
-                if day > 2:
-                    prev1_day = str(day - 1)
-                    prev2_day = str(day - 2)
-                    prev1_col = f"{var}_day_{prev1_day}"
-                    prev2_col = f"{var}_day_{prev2_day}"
-                    
-                    if prev1_col in df.columns and prev2_col in df.columns:
-                        prev1_val = row[prev1_col]
-                        prev2_val = row[prev2_col]
-                        
-                        if not pd.isna(prev1_val) and not pd.isna(prev2_val):
-                            trend = calculate_trend_detailed(prev1_val, prev2_val, 1, var)
-                            vignette[f"{var}_trend_prev1"] = trend
-                        else:
-                            vignette[f"{var}_trend_prev1"] = None
-                    else:
-                        vignette[f"{var}_trend_prev1"] = None
-                else:
-                    vignette[f"{var}_trend_prev1"] = None
-                
-                # Longer term: Day i-3 to Day i-1 (2-day span)
-                if day > 3:
-                    prev1_day = str(day - 1)
-                    prev3_day = str(day - 3)
-                    prev1_col = f"{var}_day_{prev1_day}"
-                    prev3_col = f"{var}_day_{prev3_day}"
-                    
-                    if prev1_col in df.columns and prev3_col in df.columns:
-                        prev1_val = row[prev1_col]
-                        prev3_val = row[prev3_col]
-                        
-                        if not pd.isna(prev1_val) and not pd.isna(prev3_val):
-                            trend = calculate_trend_detailed(prev1_val, prev3_val, 2, var)
-                            vignette[f"{var}_trend_prev2"] = trend
-                        else:
-                            vignette[f"{var}_trend_prev2"] = None
-                    else:
-                        vignette[f"{var}_trend_prev2"] = None
-                else:
-                    vignette[f"{var}_trend_prev2"] = None
-            
-            # Add binary treatment variables with text labels
-            for treatment in ['Infection', 'Trt_Ventilator', 'Trt_Pressors', 'Trt_CVVH', 'F27Q04']:
-                day_col = f"{treatment}_day_{day_str}"
-                if day_col in df.columns:
-                    value = row[day_col]
-                    vignette[treatment] = value if not pd.isna(value) else None
-                    vignette[f"{treatment}_text"] = transform_categorical(value, treatment)
-                else:
-                    vignette[treatment] = None
-                    vignette[f"{treatment}_text"] = None
-            
-            vignette_rows.append(vignette)
+        objects = {col: np.empty(n_rows, dtype=object) for col in template.columns if col not in output_layout}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for k in tasks:
+                targets = (shard_rows[0][k][:, None] * len(days) + np.arange(len(days))).ravel()
+                future = executor.submit(_shard_vignettes, layout, input_paths, [rows[k] for rows in shard_rows],
+                                         targets, output, output_layout, n_rows, continuous_vars, days,
+                                         collect_metrics=worker_settings())
+                futures[future] = targets
+            for future, targets in futures.items():
+                shard_objects, records = future.result()
+                for col, values in shard_objects.items():
+                    objects[col][targets] = values
+                add_records(records)
+        
+        # Copy-on-write mapping: the columns stay valid once the file is removed
+        buffer = np.memmap(output, dtype=np.uint8, mode='c')
     
-    vignettes_df = pd.DataFrame(vignette_rows)
-    logger.info(f"Created {len(vignettes_df)} vignettes for {vignettes_df['subject_id'].nunique()} subjects")
-    logger.info(f"Vignette shape: {vignettes_df.shape}")
+    with stage('gather_shards'):
+        vignette = {}
+        for col, dtype in template.dtypes.items():
+            if col in objects:
+                vignette[col] = objects[col]
+            elif isinstance(dtype, pd.CategoricalDtype):
+                vignette[col] = pd.Categorical.from_codes(_column_view(buffer, output_layout, col, n_rows), dtype=dtype)
+            else:
+                vignette[col] = _column_view(buffer, output_layout, col, n_rows)
+        vignettes_df = pd.DataFrame(vignette, copy=False)
+    if not categorical:
+        vignettes_df = to_object_layout(vignettes_df)
+    return vignettes_df
+
+@instrumented()
+def create_vignettes_sharded(df: pd.DataFrame, workers: int, shards: Optional[int] = None, categorical: bool = True,
+                             n_days: int = len(VIGNETTE_DAYS)) -> pd.DataFrame:
+    """create_vignettes on `workers` processes, partitioning the wide table by subject_id hash.
+
+    `shards` (default: one per worker) sets the number of partitions. All rows of a subject
+    land in the same shard, and the result equals create_vignettes(df).
+    """
+    logger.info("Creating clinical vignettes...")
+    days = list(range(1, n_days + 1))
+    vignettes_df = _sharded_vignettes('wide', [df], _wide_continuous_vars(df.columns), days, workers, shards,
+                                      categorical)
+    _log_vignettes(vignettes_df)
+    return vignettes_df
+
+@instrumented()
+def create_vignettes_long_sharded(subjects_df: pd.DataFrame, days_df: pd.DataFrame, workers: int,
+                                  shards: Optional[int] = None, categorical: bool = True,
+                                  n_days: int = len(VIGNETTE_DAYS)) -> pd.DataFrame:
+    """create_vignettes_long on `workers` processes, partitioning both store tables by subject_id hash."""
+    logger.info("Creating clinical vignettes...")
+    continuous_vars = [var for var in BINNING_THRESHOLDS.keys() if var in days_df.columns]
+    days = list(range(1, n_days + 1))
+    vignettes_df = _sharded_vignettes('long', [subjects_df, days_df], continuous_vars, days, workers, shards,
+                                      categorical)
+    _log_vignettes(vignettes_df)
+    return vignettes_df
+
+def vignettes_from_cubes(static_data: pd.DataFrame, cube: np.ndarray, continuous_vars: List[str],
+                         treatment_cube: np.ndarray, days: List[int], categorical: bool = True) -> pd.DataFrame:
+    """Build vignettes from values already held as arrays (e.g. by a service's history cache).
+
+    `static_data` has one row per subject with subject_id, Spont_Survival21 and the
+    STATIC_CATEGORICAL_VARS; `cube` and `treatment_cube` are float (subject, day, var) arrays over
+    `continuous_vars` and TREATMENT_VARS for the consecutive `days`.
+    """
+    return _assemble_vignettes(static_data, cube, continuous_vars, treatment_cube, days, categorical)
+
+def to_object_layout(vignettes_df: pd.DataFrame) -> pd.DataFrame:
+    """Convert Categorical label columns to object dtype with None for missing labels."""
+    vignettes_df = vignettes_df.copy()
+    for col in vignettes_df.columns:
+        if isinstance(vignettes_df[col].dtype, pd.CategoricalDtype):
+            values = vignettes_df[col].astype(object)
+            vignettes_df[col] = values.where(values.notna(), None)
+    return vignettes_df
+
+@instrumented()
+def memory_report(vignettes_df: pd.DataFrame) -> pd.DataFrame:
+    """Compare memory use of the Categorical label columns with the object-dtype layout.
+
+    Returns one row per column family with deep byte counts for both layouts.
+    """
+    object_df = to_object_layout(vignettes_df)
+    families = {'binned': '_binned', 'trend': '_trend', 'text': '_text'}
+    rows = []
+    for family, marker in families.items():
+        cols = [col for col in vignettes_df.columns if marker in col]
+        rows.append({
+            'family': family,
+            'columns': len(cols),
+            'categorical_bytes': int(vignettes_df[cols].memory_usage(deep=True, index=False).sum()),
+            'object_bytes': int(object_df[cols].memory_usage(deep=True, index=False).sum())
+        })
+    rows.append({
+        'family': 'total',
+        'columns': vignettes_df.shape[1],
+        'categorical_bytes': int(vignettes_df.memory_usage(deep=True, index=False).sum()),
+        'object_bytes': int(object_df.memory_usage(deep=True, index=False).sum())
+    })
+    report = pd.DataFrame(rows)
+    report['ratio'] = report['categorical_bytes'] / report['object_bytes']
+    return report
+
+@instrumented()
+def stream_vignettes(input_file, output, chunk_size: int, n_days: int = len(VIGNETTE_DAYS)):
+    """Generate vignettes chunk by chunk and append each batch to `output` as it is produced."""
+    if is_store(input_file):
+        batches = iter_vignette_batches_from_store(input_file, chunk_size=chunk_size, n_days=n_days)
+    else:
+        batches = iter_vignette_batches_from_file(input_file, chunk_size=chunk_size, n_days=n_days)
     
+    rows, n_batches = write_batches(batches, output)
+    logger.info(f"Streamed {rows} vignettes in {n_batches} batches to {output}")
+
+def _manifest_settings(continuous_vars: List[str], days: List[int]) -> dict:
+    """Run settings that invalidate every stored fingerprint when they change."""
+    return {
+        'days': days,
+        'continuous_vars': continuous_vars,
+        'config': settings_digest(BINNING_THRESHOLDS, CATEGORICAL_MAPPINGS, TREND_WINDOWS, TREND_CLASSES,
+                                  STATIC_CATEGORICAL_VARS, TREATMENT_VARS)
+    }
+
+@instrumented()
+def read_vignette_inputs(input_file, n_days: int = len(VIGNETTE_DAYS)):
+    """Read the merged table or store into (static_data, cube, continuous_vars, treatment_cube, days)."""
+    days = list(range(1, n_days + 1))
+    if is_store(input_file):
+        subjects_df, days_df = read_store(
+            input_file,
+            subject_columns=['Spont_Survival21'] + STATIC_CATEGORICAL_VARS,
+            day_columns=list(BINNING_THRESHOLDS) + TREATMENT_VARS
+        )
+        continuous_vars = [var for var in BINNING_THRESHOLDS.keys() if var in days_df.columns]
+        subject_ids = subjects_df['subject_id'].to_numpy()
+        return (subjects_df, day_cube(days_df, subject_ids, continuous_vars, days), continuous_vars,
+                day_cube(days_df, subject_ids, TREATMENT_VARS, days), days)
+
+    df = read_table(input_file, columns=vignette_input_columns(table_columns(input_file), n_days=n_days))
+    continuous_vars = _wide_continuous_vars(df.columns)
+    return (_wide_static_data(df), build_day_cube(df, continuous_vars, days), continuous_vars,
+            build_day_cube(df, TREATMENT_VARS, days), days)
+
+@instrumented()
+def update_vignettes(static_data: pd.DataFrame, cube: np.ndarray, continuous_vars: List[str],
+                     treatment_cube: np.ndarray, days: List[int], previous_vignettes: Optional[pd.DataFrame] = None,
+                     previous_manifest: Optional[pd.DataFrame] = None) -> Tuple[pd.DataFrame, pd.DataFrame, int]:
+    """Recompute only the vignette rows whose inputs changed since the previous run.
+
+    Rows are recomputed for new subjects, subjects whose static values changed, and days
+    whose own values or trend-window days changed; every other row is kept from
+    `previous_vignettes`. Returns (vignettes, fingerprints for the next manifest, rows recomputed).
+    The result equals a full create_vignettes run.
+    """
+    if not static_data['subject_id'].is_unique:
+        raise ValueError("Incremental vignettes need one input row per subject_id")
+
+    fingerprints = subject_fingerprints(static_data, ['Spont_Survival21'] + STATIC_CATEGORICAL_VARS,
+                                        [cube, treatment_cube], days)
+    if previous_vignettes is None:
+        previous_manifest = None
+    affected = affected_days(previous_manifest, fingerprints, reach=trend_reach())
+    n_subjects, n_rows = manifest_summary(affected)
+    logger.info(f"Recomputing {n_rows} vignette rows for {n_subjects} of {len(static_data)} subjects")
+
+    subjects = np.flatnonzero(affected.any(axis=1))
+    new_rows = _assemble_vignettes(static_data.iloc[subjects], cube[subjects], continuous_vars,
+                                   treatment_cube[subjects], days, categorical=True)
+    new_rows = new_rows[affected[subjects].ravel()]
+    if previous_manifest is None:
+        return new_rows.reset_index(drop=True), fingerprints, n_rows
+
+    # Keep unaffected rows of current subjects, then restore input subject order and day order
+    subject_pos = pd.Index(fingerprints['subject_id']).get_indexer(previous_vignettes['subject_id'])
+    day_pos = pd.Index(days).get_indexer(previous_vignettes['day'])
+    present = (subject_pos >= 0) & (day_pos >= 0)
+    keep = present.copy()
+    keep[present] = ~affected[subject_pos[present], day_pos[present]]
+    kept = previous_vignettes[keep].astype(new_rows.dtypes.to_dict())
+
+    if len(kept) + len(new_rows) != affected.size:
+        logger.warning("Previous vignettes do not match the manifest; running a full build")
+        return update_vignettes(static_data, cube, continuous_vars, treatment_cube, days)
+
+    vignettes_df = pd.concat([kept, new_rows], ignore_index=True)
+    row_key = np.concatenate([
+        subject_pos[keep] * len(days) + day_pos[keep],
+        np.flatnonzero(affected.ravel())
+    ])
+    vignettes_df = vignettes_df.iloc[np.argsort(row_key, kind='stable')].reset_index(drop=True)
+    return vignettes_df, fingerprints, n_rows
+
+@instrumented()
+def incremental_vignettes(input_file, output, manifest_file=None, n_days: int = len(VIGNETTE_DAYS)) -> pd.DataFrame:
+    """Refresh `output` in place, recomputing only rows affected by changes since the last run.
+
+    Subject fingerprints of the last run are kept in `manifest_file` (by default next to the
+    output); a missing or mismatched manifest or output triggers a full build.
+    """
+    manifest_file = manifest_file or manifest_path(output)
+    static_data, cube, continuous_vars, treatment_cube, days = read_vignette_inputs(input_file, n_days=n_days)
+    settings = _manifest_settings(continuous_vars, days)
+
+    previous_manifest = read_manifest(manifest_file, settings)
+    previous_vignettes = None
+    if previous_manifest is not None:
+        if Path(output).exists():
+            previous_vignettes = read_table(output)
+        else:
+            logger.info(f"No previous output at {output}; running a full build")
+
+    vignettes_df, fingerprints, n_rows = update_vignettes(
+        static_data, cube, continuous_vars, treatment_cube, days, previous_vignettes, previous_manifest
+    )
+    removed = 0 if previous_manifest is None else int((~previous_manifest['subject_id'].isin(fingerprints['subject_id'])).sum())
+    if n_rows or removed or previous_vignettes is None:
+        write_table(vignettes_df, output)
+    else:
+        logger.info(f"No changes since the last run; {output} is up to date")
+    write_manifest(manifest_file, fingerprints, settings)
+    logger.info(f"Incremental run: {n_rows} rows recomputed, {removed} subjects removed, {len(vignettes_df)} rows total")
     return vignettes_df
 
-def main():
+def export_tensors(vignettes_df: pd.DataFrame, tensor_dir) -> Path:
+    """Write the feature tensors of the vignettes (see tensor_export, which builds on this module)."""
+    from tensor_export import write_tensors
+    return write_tensors(vignettes_df, tensor_dir)
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Create clinical vignettes for each patient-day")
+    parser.add_argument('--input', default=str(output_path('merged_subjects', 'parquet')),
+                        help="Merged subjects table (parquet or feather) or long-format store directory written by process_excel")
+    parser.add_argument('--days', type=int, default=len(VIGNETTE_DAYS),
+                        help=f"Number of days per subject (default: {len(VIGNETTE_DAYS)})")
+    parser.add_argument('--output', default=str(output_path('clinical_vignettes', DEFAULT_FORMAT)),
+                        help="Vignette output file; format is taken from the suffix (.parquet, .feather, .csv, .xlsx) "
+                             f"(default: clinical_vignettes.{DEFAULT_FORMAT}, the input of route, committee and tensors)")
+    parser.add_argument('--export-xlsx', action='store_true',
+                        help="Also export the vignettes next to --output as .xlsx")
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help="Stream vignettes for this many subjects at a time to --output "
+                             "(a directory of Parquet parts, or a .csv file)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Recompute only vignettes whose inputs changed since the last run and merge them "
+                             "into --output (.parquet or .feather)")
+    parser.add_argument('--manifest', default=None,
+                        help="Fingerprint manifest for --incremental (default: <output>.manifest.parquet)")
+    parser.add_argument('--agent-dir', default=None,
+                        help="Also write one vignette table per committee agent into this directory")
+    parser.add_argument('--tensor-dir', default=None,
+                        help="Also export memory-mappable feature tensors (.npy + manifest.json) into this directory")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Build vignettes in this many processes, sharding subjects by subject_id hash")
+    parser.add_argument('--shards', type=int, default=None,
+                        help="Number of subject shards for --workers (default: one per worker)")
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.workers > 1 and (args.chunk_size or args.incremental):
+        parser.error("--workers cannot be combined with --chunk-size or --incremental")
+    if args.chunk_size and (args.incremental or args.agent_dir or args.tensor_dir or args.export_xlsx):
+        parser.error("--chunk-size cannot be combined with --incremental, --agent-dir, --tensor-dir or --export-xlsx")
+    if args.incremental and Path(args.output).suffix.lower() not in ('.parquet', '.feather'):
+        parser.error("--incremental needs --output to be a .parquet or .feather file")
+    if args.chunk_size and Path(args.output).suffix.lower() in ('.xlsx', '.feather', '.parquet'):
+        parser.error("--chunk-size needs --output to be a directory (Parquet parts) or a .csv file")
+    return args
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    with metrics_session(args):
+        run(args)
+
+def export_xlsx(vignettes_df: pd.DataFrame, args):
+    """With --export-xlsx, also write the vignettes as <output>.xlsx (unless --output already is one)."""
+    xlsx_path = Path(args.output).with_suffix(FORMAT_SUFFIXES['xlsx'])
+    if args.export_xlsx and xlsx_path != Path(args.output):
+        write_table(vignettes_df, xlsx_path, 'xlsx')
+        logger.info(f"Exported vignettes to {xlsx_path}")
+
+def run(args):
+    """Create vignettes as configured by the command line options."""
     logger.info("Starting vignette creation process")
     
-    # Read merged subjects
-    input_file = 'merged_subjects.xlsx'
+    # Read merged subjects, loading only the columns used for vignettes
+    input_file = args.input
     logger.info(f"Reading {input_file}")
-    df = pd.read_excel(input_file)
-    logger.info(f"Input shape: {df.shape}")
+    if args.chunk_size:
+        stream_vignettes(input_file, args.output, args.chunk_size, n_days=args.days)
+        return
+    if args.incremental:
+        vignettes_df = incremental_vignettes(input_file, args.output, manifest_file=args.manifest, n_days=args.days)
+        export_xlsx(vignettes_df, args)
+        if args.agent_dir:
+            write_agent_partitions(vignettes_df, args.agent_dir)
+        if args.tensor_dir:
+            export_tensors(vignettes_df, args.tensor_dir)
+        return
+    
+    if is_store(input_file):
+        subjects_df, days_df = read_store(
+            input_file,
+            subject_columns=['Spont_Survival21'] + STATIC_CATEGORICAL_VARS,
+            day_columns=list(BINNING_THRESHOLDS) + TREATMENT_VARS
+        )
+        logger.info(f"Input shapes: subjects = {subjects_df.shape}, days = {days_df.shape}")
+        if args.workers > 1:
+            vignettes_df = create_vignettes_long_sharded(subjects_df, days_df, args.workers, shards=args.shards,
+                                                         n_days=args.days)
+        else:
+            vignettes_df = create_vignettes_long(subjects_df, days_df, n_days=args.days)
+    else:
+        df = read_table(input_file, columns=vignette_input_columns(table_columns(input_file), n_days=args.days))
+        logger.info(f"Input shape: {df.shape}")
+        if args.workers > 1:
+            vignettes_df = create_vignettes_sharded(df, args.workers, shards=args.shards, n_days=args.days)
+        else:
+            vignettes_df = create_vignettes(df, n_days=args.days)
     
-    # Create vignettes
-    vignettes_df = create_vignettes(df)
+    # Report memory savings of the Categorical label columns
+    report = memory_report(vignettes_df)
+    logger.info(f"Memory report (categorical vs object layout):\n{report.to_string(index=False)}")
     
     # Save output
-    output_file = 'clinical_vignettes.xlsx'
-    vignettes_df.to_excel(output_file, index=False, engine='openpyxl')
+    output_file = write_table(vignettes_df, args.output)
     logger.info(f"Saved vignettes to {output_file}")
+    export_xlsx(vignettes_df, args)
+    if args.agent_dir:
+        write_agent_partitions(vignettes_df, args.agent_dir)
+    if args.tensor_dir:
+        export_tensors(vignettes_df, args.tensor_dir)
     
     # Print summary
     logger.info("\n" + "="*60)
@@ -0,0 +1,178 @@
+import pandas as pd
+import logging
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from instrumentation import instrumented
+
+logger = logging.getLogger(__name__)
+
+# Supported table formats and their file suffixes
+FORMAT_SUFFIXES = {
+    'parquet': '.parquet',
+    'feather': '.feather',
+    'csv': '.csv',
+    'xlsx': '.xlsx'
+}
+
+# Formats that can be read back as pipeline input (csv and xlsx are export-only sinks)
+READABLE_FORMATS = ['parquet', 'feather']
+
+# Default intermediate format between process_excel and create_vignettes
+DEFAULT_FORMAT = 'parquet'
+
+def detect_format(path) -> str:
+    """Detect the table format from a file suffix."""
+    suffix = Path(path).suffix.lower()
+    for fmt, fmt_suffix in FORMAT_SUFFIXES.items():
+        if suffix == fmt_suffix:
+            return fmt
+    raise ValueError(f"Unsupported table format for {path}; expected one of {list(FORMAT_SUFFIXES.values())}")
+
+def output_path(stem: str, fmt: str) -> Path:
+    """Build an output path like 'merged_subjects.parquet' from a stem and format."""
+    if fmt not in FORMAT_SUFFIXES:
+        raise ValueError(f"Unsupported table format: {fmt}")
+    return Path(stem).with_suffix(FORMAT_SUFFIXES[fmt])
+
+@instrumented(args=('path',))
+def write_table(df: pd.DataFrame, path, fmt: Optional[str] = None) -> Path:
+    """Write a dataframe in the given format (detected from the suffix if not provided)."""
+    path = Path(path)
+    fmt = fmt or detect_format(path)
+
+    if fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    elif fmt == 'feather':
+        df.reset_index(drop=True).to_feather(path)
+    elif fmt == 'csv':
+        df.to_csv(path, index=False)
+    elif fmt == 'xlsx':
+        df.to_excel(path, index=False, engine='openpyxl')
+    else:
+        raise ValueError(f"Unsupported table format: {fmt}")
+
+    logger.info(f"Wrote {df.shape} table to {path} ({fmt})")
+    return path
+
+def table_columns(path, fmt: Optional[str] = None) -> List[str]:
+    """Read column names from a table's schema without loading any data."""
+    fmt = fmt or detect_format(path)
+
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(path).names)
+    elif fmt == 'feather':
+        import pyarrow.ipc as ipc
+        with ipc.open_file(path) as reader:
+            return list(reader.schema.names)
+    raise ValueError(f"Format {fmt} is export-only; use one of {READABLE_FORMATS} as pipeline input")
+
+@instrumented(args=('path',))
+def read_table(path, columns: Optional[List[str]] = None, fmt: Optional[str] = None) -> pd.DataFrame:
+    """Read a table, loading only `columns` when given (column projection)."""
+    fmt = fmt or detect_format(path)
+
+    if fmt == 'parquet':
+        df = pd.read_parquet(path, columns=columns)
+    elif fmt == 'feather':
+        df = pd.read_feather(path, columns=columns)
+    else:
+        raise ValueError(f"Format {fmt} is export-only; use one of {READABLE_FORMATS} as pipeline input")
+
+    logger.info(f"Read {df.shape} table from {path} ({fmt})")
+    return df
+
+def iter_table_batches(path, columns: Optional[List[str]] = None, batch_size: int = 10_000,
+                       fmt: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """Yield a table in row batches of at most `batch_size` rows without loading it whole."""
+    fmt = fmt or detect_format(path)
+
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            yield batch.to_pandas()
+    elif fmt == 'feather':
+        import pyarrow as pa
+        # Feather files are compressed record batches (64K rows by default): decode one
+        # batch at a time, and only the projected columns of it
+        with pa.memory_map(str(path)) as source:
+            options = None
+            if columns is not None:
+                schema = pa.ipc.open_file(source).schema
+                options = pa.ipc.IpcReadOptions(included_fields=[schema.get_field_index(col) for col in columns])
+            reader = pa.ipc.open_file(source, options=options)
+            for i in range(reader.num_record_batches):
+                record_batch = reader.get_batch(i)
+                if columns is not None:
+                    record_batch = record_batch.select(columns)
+                for offset in range(0, record_batch.num_rows, batch_size):
+                    yield record_batch.slice(offset, batch_size).to_pandas()
+    else:
+        raise ValueError(f"Format {fmt} is export-only; use one of {READABLE_FORMATS} as pipeline input")
+
+def write_batches(batches: Iterable[pd.DataFrame], path, fmt: Optional[str] = None) -> Tuple[int, int]:
+    """Append dataframe batches to a sink as they arrive; returns (rows, batches) written.
+
+    'parquet' writes a directory of part-NNNNN.parquet files (one per batch); 'csv' appends
+    every batch to one file with a single header.
+    """
+    path = Path(path)
+    fmt = fmt or ('csv' if path.suffix.lower() == FORMAT_SUFFIXES['csv'] else 'parquet')
+
+    if fmt == 'parquet':
+        path.mkdir(parents=True, exist_ok=True)
+        for stale_part in path.glob('part-*.parquet'):
+            stale_part.unlink()
+    elif fmt != 'csv':
+        raise ValueError(f"Format {fmt} cannot be written in batches; use 'parquet' or 'csv'")
+
+    rows = 0
+    n_batches = 0
+    for batch in batches:
+        if fmt == 'parquet':
+            batch.to_parquet(path / f"part-{n_batches:05d}.parquet", index=False)
+        else:
+            batch.to_csv(path, index=False, mode='w' if n_batches == 0 else 'a', header=n_batches == 0)
+        rows += len(batch)
+        n_batches += 1
+        logger.info(f"Wrote batch {n_batches} ({len(batch)} rows) to {path}")
+
+    return rows, n_batches
+
+def to_ipc_bytes(df: pd.DataFrame) -> bytes:
+    """Serialize a dataframe to an Arrow IPC stream (compact transfer between processes)."""
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def from_ipc_bytes(data: bytes) -> pd.DataFrame:
+    """Deserialize a dataframe written by to_ipc_bytes."""
+    import pyarrow as pa
+    with pa.ipc.open_stream(data) as reader:
+        return reader.read_all().to_pandas()
+
+def write_arrow_file(df: pd.DataFrame, path) -> Path:
+    """Write a dataframe as an uncompressed Arrow IPC file, so readers can memory-map it without decoding."""
+    import pyarrow as pa
+    path = Path(path)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(str(path), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return path
+
+def read_arrow_rows(path, rows=None) -> pd.DataFrame:
+    """Read an Arrow IPC file written by write_arrow_file through a memory map.
+
+    With `rows` (positional indices), only those rows are copied out of the mapping.
+    """
+    import pyarrow as pa
+    with pa.memory_map(str(path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+        if rows is not None:
+            table = table.take(pa.array(rows, type=pa.int64()))
+        return table.to_pandas()
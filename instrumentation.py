@@ -0,0 +1,270 @@
+import contextlib
+import functools
+import inspect
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Active metrics run, or None when instrumentation is disabled (the default).
+# Disabled stages cost one global lookup.
+_run = None
+
+# Returned by stage() when disabled; its attrs dict is shared and discarded
+_NULL_STAGE = contextlib.nullcontext({})
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (peak RSS where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+def metrics_enabled() -> bool:
+    return _run is not None
+
+def enable_metrics(trace_memory: bool = False, profile: bool = False):
+    """Start recording stages in this process, optionally with tracemalloc peaks and cProfile."""
+    global _run
+    _run = {
+        'pid': os.getpid(),
+        'records': [],
+        'stacks': {},
+        'start_ns': time.perf_counter_ns(),
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'trace_memory': trace_memory,
+        'profiler': None
+    }
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+    if profile:
+        import cProfile
+        _run['profiler'] = cProfile.Profile()
+        _run['profiler'].enable()
+
+def disable_metrics() -> Optional[dict]:
+    """Stop recording; returns the final metrics report (None if not enabled)."""
+    global _run
+    if _run is None:
+        return None
+    if _run['profiler'] is not None:
+        _run['profiler'].disable()
+    report = metrics_report()
+    if _run['trace_memory']:
+        import tracemalloc
+        tracemalloc.stop()
+    _run = None
+    return report
+
+class _Stage:
+    """Context manager recording one stage's wall time, RSS and (optionally) traced memory peak."""
+    __slots__ = ('name', 'attrs', 'start_ns', 'start_rss', 'traced_peak', 'stack')
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self) -> dict:
+        self.stack = _run['stacks'].setdefault(threading.get_ident(), [])
+        if _run['trace_memory']:
+            import tracemalloc
+            # Carry the peak so far to the enclosing stage before resetting it for this one
+            if self.stack:
+                self.stack[-1].traced_peak = max(self.stack[-1].traced_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self.traced_peak = 0
+        self.stack.append(self)
+        self.start_rss = current_rss()
+        self.start_ns = time.perf_counter_ns()
+        return self.attrs
+
+    def __exit__(self, exc_type, exc, tb):
+        end_ns = time.perf_counter_ns()
+        end_rss = current_rss()
+        self.stack.pop()
+        record = {
+            'name': self.name,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'depth': len(self.stack),
+            'start_ns': self.start_ns,
+            'duration_ms': (end_ns - self.start_ns) / 1e6,
+            'rss_start_mb': self.start_rss / 1024 ** 2,
+            'rss_end_mb': end_rss / 1024 ** 2,
+            'error': exc_type.__name__ if exc_type else None,
+            **self.attrs
+        }
+        if _run['trace_memory']:
+            import tracemalloc
+            self.traced_peak = max(self.traced_peak, tracemalloc.get_traced_memory()[1])
+            record['traced_peak_mb'] = self.traced_peak / 1024 ** 2
+            if self.stack:
+                self.stack[-1].traced_peak = max(self.stack[-1].traced_peak, self.traced_peak)
+        _run['records'].append(record)
+        return False
+
+def stage(name: str, **attrs):
+    """Context manager timing a stage: `with stage('merge', file=path) as info: ...`.
+
+    `info` is a dict of attributes stored with the record (add e.g. info['rows'] inside the
+    block). A shared no-op context is returned when instrumentation is disabled.
+    """
+    if _run is None:
+        return _NULL_STAGE
+    return _Stage(name, attrs)
+
+def instrumented(name: Optional[str] = None, args: tuple = ()):
+    """Decorator recording each call as a stage named `name` (default: the function name).
+
+    `args` names parameters whose values are stored with the record, e.g. args=('filepath',).
+    """
+    def decorate(fn):
+        label = name or fn.__name__
+        signature = inspect.signature(fn) if args else None
+
+        @functools.wraps(fn)
+        def wrapper(*call_args, **call_kwargs):
+            if _run is None:
+                return fn(*call_args, **call_kwargs)
+            attrs = {}
+            if signature is not None:
+                bound = signature.bind_partial(*call_args, **call_kwargs).arguments
+                attrs = {arg: str(bound[arg]) for arg in args if arg in bound}
+            with _Stage(label, attrs):
+                return fn(*call_args, **call_kwargs)
+        return wrapper
+    return decorate
+
+def take_records() -> List[dict]:
+    """Remove and return the stage records collected so far (e.g. to send from a worker process)."""
+    if _run is None:
+        return []
+    records, _run['records'] = _run['records'], []
+    return records
+
+def add_records(records: List[dict]):
+    """Merge stage records collected in another process into the active run."""
+    if _run is not None:
+        _run['records'].extend(records)
+
+def metrics_report() -> dict:
+    """Structured report of the active run: stage records (start order) and per-stage totals."""
+    stages = []
+    for record in sorted(_run['records'], key=lambda record: record['start_ns']):
+        record = dict(record)
+        record['start_ms'] = (record.pop('start_ns') - _run['start_ns']) / 1e6
+        stages.append(record)
+
+    summary = {}
+    for record in stages:
+        totals = summary.setdefault(record['name'], {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        totals['count'] += 1
+        totals['total_ms'] += record['duration_ms']
+        totals['max_ms'] = max(totals['max_ms'], record['duration_ms'])
+
+    return {
+        'meta': {
+            'script': Path(sys.argv[0]).name,
+            'argv': sys.argv[1:],
+            'pid': os.getpid(),
+            'started': _run['started'],
+            'wall_ms': (time.perf_counter_ns() - _run['start_ns']) / 1e6,
+            'peak_rss_mb': max((record['rss_end_mb'] for record in stages), default=current_rss() / 1024 ** 2)
+        },
+        'stages': stages,
+        'summary': summary
+    }
+
+def write_metrics(path, report: dict) -> Path:
+    """Write a metrics report as JSON."""
+    path = Path(path)
+    path.write_text(json.dumps(report, indent=2, default=str))
+    logger.info(f"Wrote metrics for {len(report['stages'])} stages to {path}")
+    return path
+
+def write_chrome_trace(path, report: dict) -> Path:
+    """Write stages as Chrome trace events (open in chrome://tracing or Perfetto)."""
+    events = [
+        {
+            'name': record['name'],
+            'ph': 'X',
+            'ts': record['start_ms'] * 1000,
+            'dur': record['duration_ms'] * 1000,
+            'pid': record['pid'],
+            'tid': record['tid'],
+            'args': {key: value for key, value in record.items()
+                     if key not in ('name', 'pid', 'tid', 'start_ms', 'duration_ms')}
+        }
+        for record in report['stages']
+    ]
+    path = Path(path)
+    path.write_text(json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}, default=str))
+    logger.info(f"Wrote Chrome trace to {path}")
+    return path
+
+def log_summary(report: dict, top: int = 15):
+    """Log the stages with the most total time."""
+    rows = sorted(report['summary'].items(), key=lambda item: item[1]['total_ms'], reverse=True)[:top]
+    lines = [f"{'stage':<28} {'calls':>6} {'total ms':>11} {'max ms':>10}"]
+    lines += [f"{name:<28} {totals['count']:>6} {totals['total_ms']:>11.1f} {totals['max_ms']:>10.1f}"
+              for name, totals in rows]
+    logger.info(f"Stage timings ({report['meta']['wall_ms']:.0f} ms wall, "
+                f"{report['meta']['peak_rss_mb']:.0f} MB peak RSS):\n" + '\n'.join(lines))
+
+def add_metrics_arguments(parser):
+    """Add the --metrics, --trace, --profile and --trace-memory options to a script's parser."""
+    group = parser.add_argument_group('instrumentation')
+    group.add_argument('--metrics', default=None, help="Write a JSON report of per-stage time and memory")
+    group.add_argument('--trace', default=None, help="Write stages in Chrome trace format")
+    group.add_argument('--profile', default=None, help="Write cProfile statistics of the whole run")
+    group.add_argument('--trace-memory', action='store_true',
+                       help="Record the tracemalloc peak of each stage (slows the run down)")
+
+@contextlib.contextmanager
+def metrics_session(args):
+    """Instrument a script run when any instrumentation option was given, writing the outputs at the end."""
+    if not (args.metrics or args.trace or args.profile or args.trace_memory):
+        yield
+        return
+
+    enable_metrics(trace_memory=args.trace_memory, profile=bool(args.profile))
+    profiler = _run['profiler']
+    try:
+        yield
+    finally:
+        report = disable_metrics()
+        log_summary(report)
+        if args.metrics:
+            write_metrics(args.metrics, report)
+        if args.trace:
+            write_chrome_trace(args.trace, report)
+        if profiler is not None:
+            import pstats
+            profiler.dump_stats(args.profile)
+            logger.info(f"Wrote cProfile statistics to {args.profile}")
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+
+def worker_settings() -> Optional[dict]:
+    """Settings for collect_worker_metrics in worker processes, or None when instrumentation is disabled."""
+    return None if _run is None else {'trace_memory': _run['trace_memory']}
+
+def collect_worker_metrics(settings: Optional[dict]):
+    """In a worker process, record stages when the parent run is instrumented; use with take_records().
+
+    A run inherited from a forked parent is replaced, so its records are not reported twice.
+    """
+    if settings is not None and (_run is None or _run['pid'] != os.getpid()):
+        if _run is not None and _run['trace_memory']:
+            import tracemalloc
+            tracemalloc.stop()
+        enable_metrics(**settings)
@@ -0,0 +1,214 @@
+import pandas as pd
+import numpy as np
+import logging
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from data_io import (DEFAULT_FORMAT, READABLE_FORMATS, iter_table_batches, output_path, read_table, table_columns,
+                     write_table)
+from subject_schema import as_float64
+
+logger = logging.getLogger(__name__)
+
+# Long-format patient-day store: a subject-level table plus a (subject_id, day) table
+STORE_INDEX = ['subject_id', 'day']
+STORE_TABLES = ['subjects', 'days']
+DAY_DTYPE = 'int16'
+
+def _numeric_columns(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """Coerce variable columns to numeric dtypes, warning about values that are not numbers."""
+    for col in columns:
+        if pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_bool_dtype(df[col]):
+            continue
+        numeric = pd.to_numeric(df[col], errors='coerce')
+        dropped = int((numeric.isna() & df[col].notna()).sum())
+        if dropped:
+            logger.warning(f"Dropped {dropped} non-numeric values in {col}")
+        df[col] = numeric
+    return df
+
+def to_long_days(long_df: pd.DataFrame, variables: List[str]) -> pd.DataFrame:
+    """Reduce (subject_id, day) rows to one row per patient-day with typed numeric columns.
+
+    Uses the same rules as the wide pivot: the first non-null value wins for duplicates,
+    and patient-days without any value are dropped. Days must be integers.
+    """
+    long_df = long_df.copy()
+    day = pd.to_numeric(long_df['day'], errors='coerce')
+    invalid = day.isna() & long_df['day'].notna()
+    if invalid.any():
+        logger.warning(f"Dropping {int(invalid.sum())} rows with non-numeric days: {sorted(long_df.loc[invalid, 'day'].astype(str).unique())}")
+    long_df['day'] = day
+
+    days_df = long_df.groupby(STORE_INDEX, sort=True, observed=True)[variables].first()
+    days_df = days_df.dropna(axis=0, how='all').reset_index()
+    days_df['day'] = days_df['day'].astype(DAY_DTYPE)
+    return _numeric_columns(days_df, variables)
+
+def build_store(processed_dfs: Dict[str, pd.DataFrame], variable_order: List[str]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Join per-file frames into (subjects, days) tables.
+
+    Frames with a `day` column are patient-day tables; the others are subject-level. As with
+    the wide merge, only subjects present in every frame are kept.
+    """
+    subject_ids = None
+    for df in processed_dfs.values():
+        ids = set(df['subject_id'].unique())
+        subject_ids = ids if subject_ids is None else subject_ids & ids
+    subject_ids = sorted(subject_ids)
+
+    subjects_df = pd.DataFrame({'subject_id': subject_ids})
+    days_df = None
+    for df in processed_dfs.values():
+        df = df[df['subject_id'].isin(subject_ids)]
+        if 'day' in df.columns:
+            days_df = df if days_df is None else days_df.merge(df, on=STORE_INDEX, how='outer')
+        else:
+            subjects_df = subjects_df.merge(df, on='subject_id', how='left')
+
+    if days_df is None:
+        days_df = pd.DataFrame({'subject_id': pd.Series(dtype=subjects_df['subject_id'].dtype),
+                                'day': pd.Series(dtype=DAY_DTYPE)})
+    days_df = days_df.sort_values(STORE_INDEX, ignore_index=True)
+
+    subject_vars = [var for var in variable_order if var in subjects_df.columns]
+    day_vars = [var for var in variable_order if var in days_df.columns and var not in STORE_INDEX]
+    return subjects_df[['subject_id'] + subject_vars], days_df[STORE_INDEX + day_vars]
+
+def wide_to_long(wide_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Convert the legacy wide layout ({var}_day_{n} columns) into (subjects, days) tables."""
+    day_cols = {}
+    for col in wide_df.columns:
+        if '_day_' not in col:
+            continue
+        var, day = col.split('_day_', 1)
+        if not day.isdigit():
+            logger.warning(f"Skipping column with non-numeric day: {col}")
+            continue
+        day_cols[col] = (var, int(day))
+
+    subjects_df = wide_df[[col for col in wide_df.columns if '_day_' not in col]].copy()
+
+    stacked = wide_df.set_index('subject_id')[list(day_cols)]
+    stacked.columns = pd.MultiIndex.from_tuples(list(day_cols.values()), names=['variable', 'day'])
+    variables = list(dict.fromkeys(var for var, _ in day_cols.values()))
+    days_df = stacked.stack('day', future_stack=True).dropna(axis=0, how='all')
+    days_df = days_df.reindex(columns=variables).reset_index()
+    days_df.columns.name = None
+    days_df['day'] = days_df['day'].astype(DAY_DTYPE)
+    days_df = days_df.sort_values(STORE_INDEX, ignore_index=True)
+    return subjects_df, days_df
+
+def long_to_wide(subjects_df: pd.DataFrame, days_df: pd.DataFrame,
+                 variable_order: Optional[List[str]] = None) -> pd.DataFrame:
+    """Convert (subjects, days) tables back to the legacy wide layout.
+
+    Columns follow `variable_order` (static column first, then day columns ordered as the
+    string-keyed pivot orders them), and day columns without any value are omitted.
+    """
+    day_vars = [col for col in days_df.columns if col not in STORE_INDEX]
+    wide_days = days_df.set_index(STORE_INDEX)[day_vars].unstack('day')
+    wide_days = wide_days.dropna(axis=1, how='all')
+    wide_days.columns = [f"{var}_day_{day}" for var, day in wide_days.columns]
+    wide_df = subjects_df.merge(wide_days, left_on='subject_id', right_index=True, how='left')
+
+    order = variable_order or list(dict.fromkeys(
+        [col for col in subjects_df.columns if col != 'subject_id'] + day_vars
+    ))
+    columns = ['subject_id']
+    for var in order:
+        if var in subjects_df.columns:
+            columns.append(var)
+        var_days = [col for col in wide_days.columns if col.startswith(f"{var}_day_")]
+        columns.extend(sorted(var_days, key=lambda col: col[len(var) + len('_day_'):]))
+    return wide_df[list(dict.fromkeys(columns))]
+
+def store_paths(store_dir, fmt: str = DEFAULT_FORMAT) -> Dict[str, Path]:
+    """File path of each store table inside `store_dir`."""
+    return {table: Path(store_dir) / output_path(table, fmt) for table in STORE_TABLES}
+
+def write_store(store_dir, subjects_df: pd.DataFrame, days_df: pd.DataFrame, fmt: str = DEFAULT_FORMAT) -> Path:
+    """Write the (subjects, days) tables into a store directory."""
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    paths = store_paths(store_dir, fmt)
+    write_table(subjects_df, paths['subjects'], fmt)
+    write_table(days_df, paths['days'], fmt)
+    return store_dir
+
+def is_store(path) -> bool:
+    """True if `path` is a long-format store directory."""
+    path = Path(path)
+    return path.is_dir() and any(store_paths(path, fmt)['days'].exists() for fmt in READABLE_FORMATS)
+
+def _store_columns(store_dir, subject_columns: Optional[List[str]], day_columns: Optional[List[str]]):
+    """(table paths, subject columns, day columns) to read from a store; keys are always included."""
+    fmt = next(fmt for fmt in READABLE_FORMATS if store_paths(store_dir, fmt)['days'].exists())
+    paths = store_paths(store_dir, fmt)
+
+    if subject_columns is not None:
+        available = table_columns(paths['subjects'])
+        subject_columns = list(dict.fromkeys(col for col in ['subject_id'] + subject_columns if col in available))
+    if day_columns is not None:
+        available = table_columns(paths['days'])
+        day_columns = list(dict.fromkeys(col for col in STORE_INDEX + day_columns if col in available))
+    return paths, subject_columns or None, day_columns or None
+
+def read_store(store_dir, subject_columns: Optional[List[str]] = None,
+               day_columns: Optional[List[str]] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Read a store directory, loading only the requested variables (store keys are always read)."""
+    paths, subject_columns, day_columns = _store_columns(store_dir, subject_columns, day_columns)
+    subjects_df = read_table(paths['subjects'], columns=subject_columns)
+    days_df = read_table(paths['days'], columns=day_columns)
+    return subjects_df, days_df
+
+def iter_store_chunks(store_dir, chunk_size: int, subject_columns: Optional[List[str]] = None,
+                      day_columns: Optional[List[str]] = None) -> Iterator[Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Yield (subjects, days) for `chunk_size` subjects at a time without loading either table whole.
+
+    Both tables are read in row batches, so memory holds one chunk of subjects and their
+    patient-days. The days table must list subjects in the order of the subjects table, as
+    write_store() writes it; a ValueError is raised otherwise.
+    """
+    paths, subject_columns, day_columns = _store_columns(store_dir, subject_columns, day_columns)
+    day_batches = iter_table_batches(paths['days'], columns=day_columns, batch_size=chunk_size)
+    unordered = f"The days table of {store_dir} does not follow the subject order of its subjects table"
+    pending = pd.DataFrame(columns=day_columns or STORE_INDEX)
+    exhausted = False
+
+    for subjects_df in iter_table_batches(paths['subjects'], columns=subject_columns, batch_size=chunk_size):
+        chunk_ids = set(subjects_df['subject_id'])
+        # Read patient-days until one belongs to a later chunk (or the table ends)
+        parts = [pending] if len(pending) else []
+        while not exhausted and (not parts or parts[-1]['subject_id'].isin(chunk_ids).all()):
+            batch = next(day_batches, None)
+            if batch is None:
+                exhausted = True
+            else:
+                parts.append(batch)
+        days_df = pd.concat(parts, ignore_index=True) if parts else pending
+
+        # This chunk's patient-days are a prefix; the rest belong to later chunks
+        in_chunk = days_df['subject_id'].isin(chunk_ids).to_numpy()
+        split = len(in_chunk) if in_chunk.all() else int(np.argmin(in_chunk))
+        if in_chunk[split:].any():
+            raise ValueError(unordered)
+        pending = days_df.iloc[split:]
+        yield subjects_df, days_df.iloc[:split]
+
+    if len(pending) or next(day_batches, None) is not None:
+        raise ValueError(unordered)
+
+def day_cube(days_df: pd.DataFrame, subject_ids, variables: List[str], days: List[int]) -> np.ndarray:
+    """Scatter a (subject_id, day) table into a float (subject, day, var) array aligned to `subject_ids`."""
+    cube = np.full((len(subject_ids), len(days), len(variables)), np.nan)
+    subject_pos = pd.Index(subject_ids).get_indexer(days_df['subject_id'])
+    day_pos = pd.Index(days).get_indexer(days_df['day'])
+    rows = (subject_pos >= 0) & (day_pos >= 0)
+
+    for j, var in enumerate(variables):
+        if var not in days_df.columns:
+            continue
+        values = as_float64(days_df[var])
+        cube[subject_pos[rows], day_pos[rows], j] = values[rows]
+    return cube
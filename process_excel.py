@@ -1,49 +1,26 @@
 import pandas as pd
+import numpy as np
+import argparse
 import logging
 import io
 import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-import msoffcrypto
-from dotenv import load_dotenv
 
-# Load environment variables from .env file
-load_dotenv()
+from clinical_tables import TARGET_VARIABLES
+from instrumentation import (add_metrics_arguments, add_records, collect_worker_metrics, instrumented,
+                             metrics_session, stage, take_records, worker_settings)
+from data_io import DEFAULT_FORMAT, READABLE_FORMATS, from_ipc_bytes, output_path, to_ipc_bytes, write_table
+from patient_store import build_store, to_long_days, write_store
+from subject_schema import cast_schema, enforce_schema, memory_usage_mb, report_schema_drift
+from xlsx_stream import DEFAULT_CHUNK_ROWS, iter_xlsx_chunks
+from workbook_cache import (DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES, file_fingerprint,
+                            load_cached_dataframe, store_cached_dataframe)
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Variables to extract
-TARGET_VARIABLES = [
-    'Spont_Survival21',
-    'Sex',
-    'Hispanic',
-    'Pre_NAC_IV',
-    'Hemoglobin',
-    'WBC',
-    'PMN',
-    'Lymph',
-    'Platelet_Cnt',
-    'Prothrom_Sec',
-    'ALT',
-    'Bilirubin',
-    'Creat',
-    'NA',
-    'HCO3',
-    'Phosphate',
-    'Lactate',
-    'PH',
-    'Arterial_Ammonia',
-    'Venous_Ammonia',
-    'INR1',
-    'ammonia',
-    'Ratio_PO2_FiO2',
-    'F27Q04',
-    'Infection',
-    'Trt_Ventilator',
-    'Trt_Pressors',
-    'Trt_CVVH'
-]
-
 # Excel files to process
 EXCEL_FILES = [
     'subjects_comagr_12MAR2025.xlsx',
@@ -52,49 +29,155 @@ EXCEL_FILES = [
     'subjects_unique_08NOV2024.xlsx'
 ]
 
-# Password for encrypted Excel files (loaded from environment variable)
-EXCEL_PASSWORD = os.getenv("EXCEL_PASSWORD")
+# Environment variable holding the password of the encrypted Excel files (also read from .env)
+PASSWORD_ENV_VAR = 'EXCEL_PASSWORD'
 
-def read_excel_file(filepath, password=None):
-    """Try to read an Excel file with different engines. If it fails, try decrypting with password."""
-    engines = ['openpyxl', 'xlrd']
-    
-    # First, try reading normally
+def __getattr__(name):
+    # EXCEL_PASSWORD was a module constant read from .env at import; it is kept as a
+    # deprecated alias resolved on access, so importing the module stays free of dotenv
+    if name == 'EXCEL_PASSWORD':
+        warnings.warn("process_excel.EXCEL_PASSWORD is deprecated; read os.getenv(PASSWORD_ENV_VAR) instead",
+                      DeprecationWarning, stacklevel=2)
+        from dotenv import load_dotenv
+        load_dotenv()
+        return os.getenv(PASSWORD_ENV_VAR)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@instrumented(args=('filepath',))
+def read_excel_file(filepath, password=None, cache_dir=None, cache_max_bytes=DEFAULT_CACHE_MAX_BYTES):
+    """Read an Excel file, using the encrypted parsed-workbook cache when `cache_dir` and a password are given."""
+    if not (cache_dir and password):
+        return _read_excel_uncached(filepath, password)
+    
+    fingerprint = file_fingerprint(filepath)
+    df = load_cached_dataframe(filepath, password, cache_dir, fingerprint=fingerprint)
+    if df is not None:
+        return df
+    
+    df = _read_excel_uncached(filepath, password)
+    if df is not None:
+        store_cached_dataframe(filepath, df, password, cache_dir, max_bytes=cache_max_bytes, fingerprint=fingerprint)
+    return df
+
+# File signatures used to detect workbook formats
+XLSX_MAGIC = b'PK\x03\x04'
+OLE_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+# Detected workbook formats and the pandas engine that reads each plain format
+FORMAT_ENGINES = {
+    'xlsx': 'openpyxl',
+    'xls': 'xlrd'
+}
+
+def detect_workbook_format(source) -> str:
+    """Classify a workbook as 'xlsx', 'xls', 'encrypted' or 'unknown' from its magic bytes and OLE directory."""
+    if isinstance(source, io.BytesIO):
+        source.seek(0)
+        header = source.read(len(OLE_MAGIC))
+        source.seek(0)
+    else:
+        with open(source, 'rb') as file:
+            header = file.read(len(OLE_MAGIC))
+    
+    if header.startswith(XLSX_MAGIC):
+        return 'xlsx'
+    if header != OLE_MAGIC:
+        return 'unknown'
+    
+    # OLE compound file: encrypted OOXML package or legacy BIFF workbook
+    import olefile
+    with olefile.OleFileIO(source) as ole:
+        if ole.exists('EncryptionInfo') and ole.exists('EncryptedPackage'):
+            return 'encrypted'
+        for stream_name in ('Workbook', 'Book'):
+            if ole.exists(stream_name):
+                stream = ole.openstream(stream_name)
+                return 'encrypted' if _has_filepass_record(stream) else 'xls'
+    return 'unknown'
+
+def _has_filepass_record(stream) -> bool:
+    """Scan the workbook globals substream of a BIFF stream for a FILEPASS (password) record."""
+    filepass_record, eof_record = 0x002F, 0x000A
+    while True:
+        header = stream.read(4)
+        if len(header) < 4:
+            return False
+        record_type = int.from_bytes(header[:2], 'little')
+        record_size = int.from_bytes(header[2:], 'little')
+        if record_type == filepass_record:
+            return True
+        if record_type == eof_record:
+            return False
+        stream.seek(record_size, io.SEEK_CUR)
+
+@instrumented('parse_workbook', args=('filepath',))
+def _read_with_engines(source, filepath, engines):
+    """Try each pandas engine in turn; returns None if none of them can read the workbook."""
     for engine in engines:
         try:
-            df = pd.read_excel(filepath, engine=engine)
+            if isinstance(source, io.BytesIO):
+                source.seek(0)
+            df = pd.read_excel(source, engine=engine)
             logger.info(f"Successfully read {filepath} with {engine}")
             return df
         except Exception as e:
             logger.debug(f"Failed to read {filepath} with {engine}: {e}")
             continue
+    return None
+
+@instrumented('decrypt_workbook', args=('filepath',))
+def _decrypt_workbook(filepath, password):
+    """Decrypt a password-protected workbook into memory."""
+    import msoffcrypto
+    decrypted_workbook = io.BytesIO()
+    
+    with open(filepath, 'rb') as file:
+        office_file = msoffcrypto.OfficeFile(file)
+        office_file.load_key(password=password)
+        office_file.decrypt(decrypted_workbook)
+    
+    # Reset the stream position
+    decrypted_workbook.seek(0)
+    return decrypted_workbook
+
+def _read_excel_uncached(filepath, password=None):
+    """Read an Excel file, dispatching on its detected format instead of trying every engine."""
+    engines = ['openpyxl', 'xlrd']
     
-    # If normal reading failed, try decrypting if password is provided
+    try:
+        workbook_format = detect_workbook_format(filepath)
+    except Exception as e:
+        logger.debug(f"Could not detect format of {filepath}: {e}")
+        workbook_format = 'unknown'
+    logger.info(f"Detected {filepath} as {workbook_format}")
+    
+    if workbook_format in FORMAT_ENGINES:
+        df = _read_with_engines(filepath, filepath, [FORMAT_ENGINES[workbook_format]])
+        if df is not None:
+            return df
+    elif workbook_format == 'unknown':
+        # Fall back to trying every engine
+        df = _read_with_engines(filepath, filepath, engines)
+        if df is not None:
+            return df
+    
+    # Decrypt if the file is encrypted (or could not be read) and a password is provided
     if password:
         try:
             logger.info(f"Attempting to decrypt {filepath} with password")
-            decrypted_workbook = io.BytesIO()
-            
-            with open(filepath, 'rb') as file:
-                office_file = msoffcrypto.OfficeFile(file)
-                office_file.load_key(password=password)
-                office_file.decrypt(decrypted_workbook)
+            decrypted_workbook = _decrypt_workbook(filepath, password)
             
-            # Reset the stream position
-            decrypted_workbook.seek(0)
-            
-            # Try reading the decrypted file
-            for engine in engines:
-                try:
-                    df = pd.read_excel(decrypted_workbook, engine=engine)
-                    logger.info(f"Successfully read decrypted {filepath} with {engine}")
-                    return df
-                except Exception as e:
-                    logger.debug(f"Failed to read decrypted {filepath} with {engine}: {e}")
-                    continue
+            decrypted_format = detect_workbook_format(decrypted_workbook)
+            logger.info(f"Decrypted {filepath} as {decrypted_format}")
+            decrypted_engines = [FORMAT_ENGINES[decrypted_format]] if decrypted_format in FORMAT_ENGINES else engines
+            df = _read_with_engines(decrypted_workbook, f"decrypted {filepath}", decrypted_engines)
+            if df is not None:
+                return df
             
         except Exception as e:
             logger.warning(f"Failed to decrypt {filepath}: {e}")
+    elif workbook_format == 'encrypted':
+        logger.warning(f"{filepath} is encrypted but no password was provided")
     
     logger.warning(f"Could not read {filepath} with any method")
     return None
@@ -116,11 +199,28 @@ def extract_day_number(zvisit_nm):
             return day_num
     return zvisit_str
 
-def process_dataframe(df, filepath):
-    """Process a dataframe: extract target variables and handle zVisitNm if present."""
-    logger.info(f"Processing {filepath}")
-    logger.info(f"Shape: {df.shape}, Columns: {list(df.columns)}")
+@instrumented()
+def pivot_by_day(long_df, variables):
+    """Pivot (subject_id, day) rows into wide {var}_day_{n} columns with a single groupby/unstack.
+    
+    Equivalent to a pivot_table(aggfunc='first') per variable followed by outer merges: the
+    first non-null value wins for duplicates, and all-NaN day columns and subjects without
+    any value are dropped.
+    """
+    grouped = long_df.groupby(['subject_id', 'day'], sort=True, observed=True)[variables].first()
+    wide_df = grouped.unstack('day')
+    wide_df = wide_df.dropna(axis=1, how='all').dropna(axis=0, how='all')
+    
+    # Rename columns to variable_dayX format
+    wide_df.columns = [f"{var}_day_{day}" for var, day in wide_df.columns]
+    return wide_df.reset_index()
+
+def _extract_targets(df, filepath, verbose=True):
+    """Select subject_id and the available target variables (still untyped).
     
+    Files with zVisitNm also get a day column. Returns (result_df, available_vars), or None
+    when the frame has no subject_id or no target variables.
+    """
     # Check if subject_id exists
     if 'subject_id' not in df.columns:
         logger.warning(f"No 'subject_id' column found in {filepath}")
@@ -131,7 +231,8 @@ def process_dataframe(df, filepath):
     
     # Find which target variables exist in this dataframe
     available_vars = [var for var in TARGET_VARIABLES if var in df.columns]
-    logger.info(f"Available target variables in {filepath}: {available_vars}")
+    if verbose:
+        logger.info(f"Available target variables in {filepath}: {available_vars}")
     
     # Also check for 'male' as it might be the Sex variable
     if 'male' in df.columns and 'Sex' not in df.columns:
@@ -151,153 +252,422 @@ def process_dataframe(df, filepath):
     
     result_df = df[cols_to_select].copy()
     
-    # If zVisitNm exists, we need to unstack the variables
     if has_zvisit:
-        logger.info(f"zVisitNm found in {filepath}, will unstack all variables")
-        # Extract day number
-        result_df['day'] = result_df['zVisitNm'].apply(extract_day_number)
-        
-        # Unstack all variables that are in this dataframe
-        unstacked_dfs = []
-        
-        for var in available_vars:
-            if var in result_df.columns:
-                # Pivot this variable by day
-                pivot_df = result_df[['subject_id', 'day', var]].copy()
-                pivot_df = pivot_df.pivot_table(
-                    index='subject_id',
-                    columns='day',
-                    values=var,
-                    aggfunc='first'  # Take first value if duplicates
-                )
-                
-                # Rename columns to variable_dayX format
-                pivot_df.columns = [f"{var}_day_{col}" for col in pivot_df.columns]
-                
-                unstacked_dfs.append(pivot_df)
+        if verbose:
+            logger.info(f"zVisitNm found in {filepath}, will unstack all variables")
+        # Extract day number (once per distinct visit name)
+        result_df['day'] = result_df['zVisitNm'].map(
+            {visit: extract_day_number(visit) for visit in result_df['zVisitNm'].dropna().unique()}
+        )
+    return result_df, available_vars
+
+def _reshape_targets(result_df, available_vars, layout):
+    """Reduce extracted rows to one row per subject, or per (subject_id, day) for visit files."""
+    if 'day' in result_df.columns:
+        if layout == 'long':
+            return to_long_days(result_df, available_vars)
         
-        # Merge all unstacked dataframes
-        if unstacked_dfs:
-            final_df = unstacked_dfs[0]
-            for df_pivot in unstacked_dfs[1:]:
-                final_df = final_df.merge(df_pivot, left_index=True, right_index=True, how='outer')
-            final_df = final_df.reset_index()
-            return final_df
-        else:
-            # No variables to unstack, return just subject_id
-            return result_df[['subject_id']].drop_duplicates()
+        # Unstack all variables that are in this dataframe in one reshape
+        return pivot_by_day(result_df, available_vars)
     else:
         # No zVisitNm, just return the dataframe with subject_id and variables
         # Remove duplicates per subject_id (take first)
-        return result_df.groupby('subject_id').first().reset_index()
+        return result_df.groupby('subject_id', observed=True).first().reset_index()
 
-def main():
+@instrumented(args=('filepath',))
+def process_dataframe(df, filepath, layout='wide', strict_schema=False):
+    """Process a dataframe: extract target variables and handle zVisitNm if present.
+    
+    With layout='long', files with zVisitNm are reduced to one row per (subject_id, day)
+    instead of being unstacked into {var}_day_{n} columns. The extracted columns are cast to
+    the declared subject_schema dtypes; values that do not fit are logged and treated as
+    missing, or raise SchemaError with strict_schema=True.
+    """
+    logger.info(f"Processing {filepath}")
+    logger.info(f"Shape: {df.shape}, Columns: {list(df.columns)}")
+    
+    extracted = _extract_targets(df, filepath)
+    if extracted is None:
+        return None
+    result_df, available_vars = extracted
+    enforce_schema(result_df, filepath, strict=strict_schema)
+    return _reshape_targets(result_df, available_vars, layout)
+
+def ingest_columns():
+    """Workbook columns process_dataframe uses; the streaming reader parses only these."""
+    return ['subject_id', 'zVisitNm', 'male'] + TARGET_VARIABLES
+
+@instrumented(args=('filepath',))
+def stream_excel_file(filepath, password=None, layout='wide', strict_schema=False, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Read and process an xlsx workbook row by row, without building the whole sheet.
+    
+    Only the ingest_columns() cells are kept, cast to the schema dtypes chunk by chunk, and
+    visit files are reduced to one row per (subject_id, day) as the chunks arrive, so peak
+    memory follows the selected columns rather than the sheet. Schema drift is reported
+    (or raised with strict_schema) once, over the whole sheet. The result equals
+    process_dataframe(read_excel_file(filepath)). Returns (was_read, processed); legacy .xls
+    workbooks fall back to read_excel_file.
+    """
+    try:
+        workbook_format = detect_workbook_format(filepath)
+    except Exception as e:
+        logger.debug(f"Could not detect format of {filepath}: {e}")
+        workbook_format = 'unknown'
+    
+    source = filepath
+    if workbook_format == 'encrypted' and password:
+        try:
+            source = _decrypt_workbook(filepath, password)
+        except Exception as e:
+            logger.warning(f"Failed to decrypt {filepath}: {e}")
+            return False, None
+        workbook_format = detect_workbook_format(source)
+    
+    if workbook_format != 'xlsx':
+        logger.info(f"Streaming needs an xlsx workbook; reading {filepath} ({workbook_format}) in full")
+        df = read_excel_file(filepath, password=password)
+        if df is None:
+            return False, None
+        return True, process_dataframe(df, filepath, layout=layout, strict_schema=strict_schema)
+    
+    logger.info(f"Streaming {filepath}")
+    reduced = []
+    available_vars = None
+    drift = {}
+    rows = 0
+    for chunk in iter_xlsx_chunks(source, ingest_columns(), chunk_rows=chunk_rows):
+        rows += len(chunk)
+        extracted = _extract_targets(chunk, filepath, verbose=available_vars is None)
+        if extracted is None:
+            return True, None
+        result_df, available_vars = extracted
+        # Cast before reducing: first() skips missing values, so misfits must already be missing
+        cast_schema(result_df, drift)
+        keys = ['subject_id', 'day'] if 'day' in result_df.columns else ['subject_id']
+        reduced.append(result_df.groupby(keys, sort=False, observed=True)[available_vars].first().reset_index())
+    
+    if available_vars is None:
+        logger.warning(f"No rows found in {filepath}")
+        return True, None
+    
+    report_schema_drift(drift, filepath, strict=strict_schema)
+    # Chunks with different subject_id categories concatenate to object; cast once more
+    result_df = enforce_schema(pd.concat(reduced, ignore_index=True), filepath)
+    logger.info(f"Streamed {rows} rows of {filepath} into {len(result_df)} reduced rows")
+    return True, _reshape_targets(result_df, available_vars, layout)
+
+def ingest_file(filepath, password=None, cache_dir=None, cache_max_bytes=DEFAULT_CACHE_MAX_BYTES, columnar=False,
+                layout='wide', strict_schema=False, streaming=False, collect_metrics=None):
+    """Read and process one Excel file.
+    
+    Returns (was_read, processed, timings). With columnar=True the processed dataframe is
+    returned as Arrow IPC bytes, which are far cheaper to send between processes than a pickle.
+    With streaming=True, xlsx workbooks missing from the cache are read row by row with
+    stream_excel_file (reading and processing are then timed together as read_seconds).
+    When collect_metrics holds the parent's worker_settings() (in worker processes), the
+    recorded stages are returned in timings['stages'].
+    """
+    collect_worker_metrics(collect_metrics)
+    was_read, processed, timings = _ingest_file(filepath, password, cache_dir, cache_max_bytes, columnar, layout,
+                                                strict_schema, streaming)
+    if collect_metrics is not None:
+        timings['stages'] = take_records()
+    return was_read, processed, timings
+
+def _ingest_file(filepath, password, cache_dir, cache_max_bytes, columnar, layout, strict_schema, streaming):
+    start = time.perf_counter()
+    df = None
+    if streaming and cache_dir and password:
+        # A cached parse is still the fastest source; misses are streamed and not cached
+        df = load_cached_dataframe(filepath, password, cache_dir)
+    if streaming and df is None:
+        was_read, processed_df = stream_excel_file(filepath, password=password, layout=layout,
+                                                   strict_schema=strict_schema)
+        timings = {'read_seconds': time.perf_counter() - start, 'process_seconds': 0.0}
+        if not was_read:
+            return False, None, timings
+    else:
+        if df is None:
+            df = read_excel_file(filepath, password=password, cache_dir=cache_dir, cache_max_bytes=cache_max_bytes)
+        read_seconds = time.perf_counter() - start
+        if df is None:
+            return False, None, {'read_seconds': read_seconds, 'process_seconds': 0.0}
+        
+        start = time.perf_counter()
+        processed_df = process_dataframe(df, filepath, layout=layout, strict_schema=strict_schema)
+        process_seconds = time.perf_counter() - start
+        timings = {'read_seconds': read_seconds, 'process_seconds': process_seconds}
+    
+    if columnar and processed_df is not None:
+        try:
+            return True, to_ipc_bytes(processed_df), timings
+        except Exception as e:
+            # e.g. object columns mixing numbers and strings; fall back to pickling
+            logger.debug(f"Could not serialize {filepath} to Arrow: {e}")
+    return True, processed_df, timings
+
+def ingest_files(filepaths, workers=1, **ingest_kwargs):
+    """Read and process Excel files, in a process pool when workers > 1.
+    
+    Files are scheduled largest-first. Returns {filepath: (was_read, processed_df)} in the
+    order of `filepaths` regardless of completion order.
+    """
+    results = {}
+    
+    if workers <= 1:
+        for filepath in filepaths:
+            was_read, processed_df, timings = ingest_file(filepath, **ingest_kwargs)
+            _log_ingest_timings(filepath, timings)
+            results[filepath] = (was_read, processed_df)
+        return results
+    
+    by_size = sorted(filepaths, key=lambda filepath: os.path.getsize(filepath), reverse=True)
+    logger.info(f"Ingesting {len(by_size)} files with {workers} workers (largest first): {by_size}")
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(ingest_file, filepath, columnar=True, collect_metrics=worker_settings(),
+                            **ingest_kwargs): filepath
+            for filepath in by_size
+        }
+        for future in as_completed(futures):
+            filepath = futures[future]
+            was_read, processed, timings = future.result()
+            add_records(timings.pop('stages', []))
+            if isinstance(processed, bytes):
+                timings['transfer_bytes'] = len(processed)
+                processed = from_ipc_bytes(processed)
+            _log_ingest_timings(filepath, timings)
+            results[filepath] = (was_read, processed)
+    
+    return {filepath: results[filepath] for filepath in filepaths}
+
+def _log_ingest_timings(filepath, timings):
+    message = f"Ingested {filepath}: read {timings['read_seconds']:.2f}s, process {timings['process_seconds']:.2f}s"
+    if 'transfer_bytes' in timings:
+        message += f", transferred {timings['transfer_bytes'] / 1024 ** 2:.1f} MB"
+    logger.info(message)
+
+def log_variable_summary(found_vars):
+    """Log which target variables were found in the merged data."""
+    missing_vars = set(TARGET_VARIABLES) - found_vars
+    
+    logger.info(f"\n{'='*60}")
+    logger.info("VARIABLE SUMMARY")
+    logger.info(f"{'='*60}")
+    logger.info(f"Found variables ({len(found_vars)}): {sorted(found_vars)}")
+    logger.info(f"Missing variables ({len(missing_vars)}): {sorted(missing_vars)}")
+    
+    if missing_vars:
+        logger.warning(f"\nNote: Missing variables are likely in encrypted files:")
+        logger.warning(f"  - subjects_comagr_12MAR2025.xlsx (CDFV2 Encrypted)")
+        logger.warning(f"  - subjects_labsV2_12MAR2025.xlsx (CDFV2 Encrypted)")
+
+@instrumented()
+def write_long_store(processed_dfs, store_dir, fmt):
+    """Join processed long-layout frames into the (subjects, days) store and write it."""
+    subjects_df, days_df = build_store(processed_dfs, TARGET_VARIABLES)
+    logger.info(f"Store shapes: subjects = {subjects_df.shape}, days = {days_df.shape}")
+    
+    found_vars = set(subjects_df.columns) | set(days_df.columns)
+    log_variable_summary(found_vars - {'subject_id', 'day'})
+    
+    write_store(store_dir, subjects_df, days_df, fmt)
+    logger.info(f"\nSaved long-format store to {store_dir}")
+    
+    all_subject_ids = set()
+    for df in processed_dfs.values():
+        all_subject_ids.update(df['subject_id'].unique())
+    subject_id_df = pd.DataFrame({'subject_id': sorted(all_subject_ids)})
+    subject_id_file = write_table(subject_id_df, output_path('subject_ids', fmt), fmt)
+    logger.info(f"Saved subject IDs to {subject_id_file}")
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Merge ALFSG Excel files into one subject-level table")
+    parser.add_argument('--output-format', choices=READABLE_FORMATS, default=DEFAULT_FORMAT,
+                        help=f"Intermediate format of merged_subjects and subject_ids (default: {DEFAULT_FORMAT})")
+    parser.add_argument('--export-xlsx', action='store_true',
+                        help="Also export merged_subjects.xlsx and subject_ids.xlsx")
+    parser.add_argument('--cache-dir', default=str(DEFAULT_CACHE_DIR),
+                        help=f"Encrypted cache of parsed workbooks (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_CACHE_MAX_BYTES // 1024 ** 2,
+                        help="Evict least recently used cache entries above this size")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Always decrypt and parse the Excel files")
+    parser.add_argument('--layout', choices=['wide', 'long'], default='wide',
+                        help="wide: merged_subjects with {var}_day_{n} columns; long: (subject_id, day) store directory")
+    parser.add_argument('--store-dir', default='merged_subjects_long',
+                        help="Output directory of the long-format store (with --layout long)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of processes used to read and process the Excel files in parallel")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Read xlsx workbooks row by row, keeping only the target columns (lower peak memory)")
+    parser.add_argument('--strict-schema', action='store_true',
+                        help="Fail on values that do not fit the declared column dtypes instead of treating them as missing")
+    add_metrics_arguments(parser)
+    return parser.parse_args(argv)
+
+def target_columns(columns) -> dict:
+    """Map each TARGET_VARIABLES entry found in `columns` to its columns.
+
+    A variable's columns are the variable itself (first) and then its {var}_day_{n}
+    variants in column order.
+    """
+    targets = set(TARGET_VARIABLES)
+    var_columns = {}
+    for col in columns:
+        var = col if col in targets else col.partition('_day_')[0]
+        if var in targets and (col == var or col.startswith(f"{var}_day_")):
+            var_columns.setdefault(var, []).append(col)
+    return {var: sorted(cols, key=lambda col: col != var) for var, cols in var_columns.items()}
+
+def _shared_rows(subject_ids: pd.Series, subject_index: pd.Index, filepath) -> np.ndarray:
+    """Row positions of `subject_index` in a file's subject_id column (first row per subject)."""
+    if subject_ids.is_unique:
+        return pd.Index(subject_ids).get_indexer(subject_index)
+    logger.warning(f"{filepath} has several rows per subject_id; keeping the first")
+    first = np.flatnonzero(~subject_ids.duplicated().to_numpy())
+    return first[pd.Index(subject_ids.iloc[first]).get_indexer(subject_index)]
+
+@instrumented()
+def join_processed_dfs(processed_dfs):
+    """Inner-join the per-file frames on subject_id and keep the target variable columns.
+
+    The subject_id sets are intersected once, each file's shared rows and target columns are
+    taken in one step with subject_id as the index, and all of them are aligned in a single
+    concat instead of a chain of merges that copies the growing table once per file. Columns
+    are ordered by TARGET_VARIABLES (each variable before its day variants), rows by subject_id.
+
+    Returns the merged table and the sorted IDs of all subjects seen in any file.
+    """
+    all_subject_ids = set()
+    shared_ids = None
+    for df in processed_dfs.values():
+        subject_ids = set(df['subject_id'].unique())
+        all_subject_ids.update(subject_ids)
+        shared_ids = subject_ids if shared_ids is None else shared_ids & subject_ids
+    shared_ids = shared_ids or set()
+    
+    logger.info(f"Found {len(all_subject_ids)} unique subject IDs, {len(shared_ids)} in every file")
+    subject_index = pd.Index(sorted(shared_ids), name='subject_id')
+    
+    # Shared rows and target columns of each file; a column found in several files is taken
+    # from the first. spans[var] lists (file, start, stop) slices of the taken frames.
+    taken = {}
+    spans = {}
+    seen = set()
+    for filepath, df in processed_dfs.items():
+        columns = []
+        for var, var_cols in target_columns(df.columns).items():
+            duplicates = [col for col in var_cols if col in seen]
+            if duplicates:
+                logger.warning(f"Columns {duplicates} of {filepath} were already joined from another file; keeping the first")
+                var_cols = [col for col in var_cols if col not in seen]
+            if var_cols:
+                spans.setdefault(var, []).append((filepath, len(columns), len(columns) + len(var_cols)))
+                columns.extend(var_cols)
+                seen.update(var_cols)
+        
+        rows = _shared_rows(df['subject_id'], subject_index, filepath)
+        taken[filepath] = df.iloc[rows, df.columns.get_indexer(columns)].set_axis(subject_index, axis=0)
+        logger.info(f"Aligned {filepath}: {len(columns)} target columns")
+    
+    # Column slices in output order: each variable's own column, then its day variants file by file
+    pieces = [pd.DataFrame({'subject_id': subject_index}, index=subject_index)]
+    for var in TARGET_VARIABLES:
+        var_spans = [(taken[filepath], start, stop) for filepath, start, stop in spans.get(var, [])]
+        for frame, start, stop in var_spans:
+            if frame.columns[start] == var:
+                pieces.append(frame.iloc[:, start:start + 1])
+        for frame, start, stop in var_spans:
+            start += frame.columns[start] == var
+            if start < stop:
+                pieces.append(frame.iloc[:, start:stop])
+    
+    with stage('concat', files=len(taken)) as info:
+        final_df = pd.concat(pieces, axis=1)
+        final_df.index = pd.RangeIndex(len(final_df))
+        info['rows'], info['columns'] = final_df.shape
+    
+    return final_df, sorted(all_subject_ids)
+
+def main(argv=None):
+    from dotenv import load_dotenv
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv()
+    args = parse_args(argv)
+    with metrics_session(args):
+        run(args)
+
+def run(args):
+    """Read, process and merge the Excel files as configured by the command line options."""
     logger.info("Starting Excel file processing")
     
-    # Read all Excel files
-    dataframes = {}
+    # Read and process all Excel files
+    filepaths = []
     for filepath in EXCEL_FILES:
         full_path = Path(filepath)
         if not full_path.exists():
             logger.warning(f"File not found: {filepath}")
             continue
-        
-        # Try reading with password for encrypted files
-        df = read_excel_file(filepath, password=EXCEL_PASSWORD)
-        if df is not None:
-            dataframes[filepath] = df
-    
-    if not dataframes:
+        filepaths.append(filepath)
+    
+    # Try reading with password for encrypted files
+    results = ingest_files(
+        filepaths,
+        workers=args.workers,
+        password=os.getenv(PASSWORD_ENV_VAR),
+        cache_dir=None if args.no_cache else args.cache_dir,
+        cache_max_bytes=args.cache_max_mb * 1024 ** 2,
+        layout=args.layout,
+        strict_schema=args.strict_schema,
+        streaming=args.streaming
+    )
+    
+    read_count = sum(was_read for was_read, _ in results.values())
+    if not read_count:
         logger.error("No Excel files could be read!")
         return
     
-    logger.info(f"Successfully read {len(dataframes)} Excel files")
+    logger.info(f"Successfully read {read_count} Excel files")
     
-    # Process each dataframe
-    processed_dfs = {}
-    for filepath, df in dataframes.items():
-        processed_df = process_dataframe(df, filepath)
-        if processed_df is not None:
-            processed_dfs[filepath] = processed_df
+    processed_dfs = {
+        filepath: processed_df
+        for filepath, (_, processed_df) in results.items()
+        if processed_df is not None
+    }
     
     if not processed_dfs:
         logger.error("No dataframes could be processed!")
         return
     
-    # Get all unique subject_ids
-    all_subject_ids = set()
-    for df in processed_dfs.values():
-        if 'subject_id' in df.columns:
-            all_subject_ids.update(df['subject_id'].unique())
-    
-    logger.info(f"Found {len(all_subject_ids)} unique subject IDs")
-    
-    # Create base dataframe with subject_id
-    result_df = pd.DataFrame({'subject_id': sorted(all_subject_ids)})
-    
-    # Inner join all processed dataframes
-    logger.info("Performing inner joins...")
-    for filepath, df in processed_dfs.items():
-        logger.info(f"Joining {filepath}")
-        # Merge on subject_id
-        result_df = result_df.merge(df, on='subject_id', how='inner')
-        logger.info(f"After joining {filepath}: shape = {result_df.shape}")
-    
-    # Select only target variables (and their day variants) plus subject_id
-    # Get all columns that match target variables or their day variants
-    target_cols = ['subject_id']
-    for var in TARGET_VARIABLES:
-        # Add exact match
-        if var in result_df.columns:
-            target_cols.append(var)
-        # Add day variants
-        day_variants = [col for col in result_df.columns if col.startswith(f"{var}_day_")]
-        target_cols.extend(day_variants)
-    
-    # Remove duplicates while preserving order
-    target_cols = list(dict.fromkeys(target_cols))
+    if args.layout == 'long':
+        write_long_store(processed_dfs, args.store_dir, args.output_format)
+        return
     
-    # Select only these columns
-    final_df = result_df[target_cols].copy()
+    final_df, all_subject_ids = join_processed_dfs(processed_dfs)
     
-    logger.info(f"Final dataframe shape: {final_df.shape}")
+    logger.info(f"Final dataframe shape: {final_df.shape}, {memory_usage_mb(final_df):.1f} MB")
     logger.info(f"Final columns: {list(final_df.columns)}")
     
     # Create summary of found vs missing variables
-    found_vars = set()
-    for col in final_df.columns:
-        if col == 'subject_id':
-            continue
-        # Extract base variable name (remove _day_X suffix)
-        if '_day_' in col:
-            base_var = col.split('_day_')[0]
-            found_vars.add(base_var)
-        else:
-            found_vars.add(col)
-    
-    missing_vars = set(TARGET_VARIABLES) - found_vars
-    
-    logger.info(f"\n{'='*60}")
-    logger.info("VARIABLE SUMMARY")
-    logger.info(f"{'='*60}")
-    logger.info(f"Found variables ({len(found_vars)}): {sorted(found_vars)}")
-    logger.info(f"Missing variables ({len(missing_vars)}): {sorted(missing_vars)}")
-    
-    if missing_vars:
-        logger.warning(f"\nNote: Missing variables are likely in encrypted files:")
-        logger.warning(f"  - subjects_comagr_12MAR2025.xlsx (CDFV2 Encrypted)")
-        logger.warning(f"  - subjects_labsV2_12MAR2025.xlsx (CDFV2 Encrypted)")
+    log_variable_summary(set(target_columns(final_df.columns)))
     
-    # Save to Excel
-    output_file = 'merged_subjects.xlsx'
-    final_df.to_excel(output_file, index=False, engine='openpyxl')
-    logger.info(f"\nSaved results to {output_file}")
+    # Save in the intermediate format (and optionally export to Excel)
+    output_formats = [args.output_format]
+    if args.export_xlsx and 'xlsx' not in output_formats:
+        output_formats.append('xlsx')
     
     # Also create a file with just subject_id
-    subject_id_df = pd.DataFrame({'subject_id': sorted(all_subject_ids)})
-    subject_id_file = 'subject_ids.xlsx'
-    subject_id_df.to_excel(subject_id_file, index=False, engine='openpyxl')
-    logger.info(f"Saved subject IDs to {subject_id_file}")
+    subject_id_df = pd.DataFrame({'subject_id': all_subject_ids})
+    
+    for fmt in output_formats:
+        output_file = write_table(final_df, output_path('merged_subjects', fmt), fmt)
+        logger.info(f"\nSaved results to {output_file}")
+        
+        subject_id_file = write_table(subject_id_df, output_path('subject_ids', fmt), fmt)
+        logger.info(f"Saved subject IDs to {subject_id_file}")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,91 @@
+import pandas as pd
+import numpy as np
+import hashlib
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from agent_router import AGENT_VARIABLES, compile_routes
+from clinical_tables import BINNING_THRESHOLDS
+from trend_engine import TREND_WINDOWS
+
+# Bump when the rendered text changes; part of every agent cache key
+PROMPT_TEMPLATE_VERSION = 2
+
+def _trend_phrase(end_offset: int, span: int) -> str:
+    end = 'day i' if end_offset == 0 else f"day i-{end_offset}"
+    return f"trend from day i-{end_offset + span} to {end}"
+
+# One line per variable: "- {var}: {bin} [trend from ...: {trend}]" or "- {var}: {text label}".
+# Only labels are rendered, never identifiers or raw values, so equal labels give equal prompts.
+def _variable_segments(var: str, columns) -> List[Tuple[str, str, str]]:
+    """(column, prefix, suffix) segments of one variable's line that exist in the layout."""
+    if var in BINNING_THRESHOLDS:
+        segments = [(f"{var}_binned", ' ', '')]
+        segments += [(f"{var}{suffix}", f" [{_trend_phrase(end_offset, span)}: ", ']')
+                     for suffix, end_offset, span in TREND_WINDOWS]
+    else:
+        segments = [(f"{var}_text", ' ', '')]
+    return [segment for segment in segments if segment[0] in columns]
+
+@lru_cache(maxsize=16)
+def _compile_templates(columns: Tuple[str, ...]) -> Dict[str, List[Tuple[str, List[Tuple[str, str, str]]]]]:
+    templates = {}
+    for agent, indices in compile_routes(columns).items():
+        routed = {columns[i] for i in indices}
+        templates[agent] = [(var, _variable_segments(var, routed)) for var in AGENT_VARIABLES[agent]]
+        templates[agent] = [(var, segments) for var, segments in templates[agent] if segments]
+    return templates
+
+def compile_templates(columns) -> Dict[str, List[Tuple[str, List[Tuple[str, str, str]]]]]:
+    """Compile each agent's prompt template over a vignette layout (once per distinct layout).
+
+    A template is the agent's variables in README order, each with the (column, prefix,
+    suffix) segments of its line; variables without any column in the layout are dropped.
+    """
+    return _compile_templates(tuple(columns))
+
+@lru_cache(maxsize=4096)
+def _label_fragments(categories: Tuple[str, ...], prefix: str, suffix: str) -> np.ndarray:
+    """Fragment for every category code, with '' at the end for code -1 (missing)."""
+    return np.array([f"{prefix}{label}{suffix}" for label in categories] + [''], dtype=object)
+
+def _fragments(column: pd.Series, prefix: str, suffix: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Render one label column into (text fragments, present mask), with '' where the label is missing."""
+    if not isinstance(column.dtype, pd.CategoricalDtype):
+        # Object layout (create_vignettes(categorical=False))
+        column = column.astype('category')
+    codes = column.cat.codes.to_numpy()
+    table = _label_fragments(tuple(column.cat.categories), prefix, suffix)
+    return table[codes], codes >= 0
+
+def render_prompts(vignettes_df: pd.DataFrame, agent: str) -> List[str]:
+    """Render one agent's prompt for every patient-day in a single columnar pass.
+
+    Each label column becomes an array of text fragments through one category-table lookup,
+    and a variable's line is kept only where one of its columns has a label (a vectorized
+    mask); each row is then a single join of its fragments, with no per-cell Python
+    branching. The prompt holds the agent's bin, trend and text labels only (no subject_id,
+    day or raw values), so patient-days with equal labels get byte-identical prompts and
+    share agent cache entries. render_headers() renders the identifying line separately.
+    """
+    template = compile_templates(vignettes_df.columns)[agent]
+    parts = [np.full(len(vignettes_df), 'Clinical findings', dtype=object)]
+    for var, segments in template:
+        rendered = [_fragments(vignettes_df[column], prefix, suffix) for column, prefix, suffix in segments]
+        has_value = np.logical_or.reduce([present for _, present in rendered])
+        parts.append(np.where(has_value, f"\n- {var}:", ''))
+        parts.extend(fragments for fragments, _ in rendered)
+    return [''.join(row) for row in zip(*parts)]
+
+def render_headers(vignettes_df: pd.DataFrame) -> List[str]:
+    """'Patient {subject_id}, hospital day {day}' for every patient-day, kept out of the prompts."""
+    return list('Patient ' + vignettes_df['subject_id'].astype(str).to_numpy(dtype=object)
+                + ', hospital day ' + vignettes_df['day'].astype(str).to_numpy(dtype=object))
+
+def render_all_prompts(vignettes_df: pd.DataFrame, agents: Optional[List[str]] = None) -> Dict[str, List[str]]:
+    """Render prompts for every agent (or only `agents`)."""
+    return {agent: render_prompts(vignettes_df, agent) for agent in (agents or AGENT_VARIABLES)}
+
+def prompt_digest(prompt: str) -> str:
+    """Stable content hash of a rendered prompt."""
+    return hashlib.blake2b(prompt.encode('utf-8'), digest_size=20).hexdigest()
@@ -0,0 +1,374 @@
+import pandas as pd
+import numpy as np
+import argparse
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+from typing import Dict, List, Optional, Tuple
+
+from agent_router import compile_routes
+from clinical_tables import BINNING_THRESHOLDS, STATIC_CATEGORICAL_VARS, TREATMENT_VARS
+from committee import DEFAULT_MAX_CONCURRENCY, LEADER, Backend, run_committee_async, stub_backend
+from create_vignettes import build_day_cube, vignettes_from_cubes
+from data_io import read_table
+from prompt_renderer import compile_templates
+from trend_engine import trend_reach
+
+logger = logging.getLogger(__name__)
+
+# Service defaults
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_WAIT_MS = 2.0
+DEFAULT_MAX_SUBJECTS = 100_000
+MAX_BODY_BYTES = 1024 ** 2
+
+# Values kept per subject-day and per subject; the outcome is never a scoring input
+DAY_VARS = list(BINNING_THRESHOLDS) + TREATMENT_VARS
+SUBJECT_VARS = list(STATIC_CATEGORICAL_VARS)
+OUTCOME = 'Spont_Survival21'
+_DAY_POSITION = {var: j for j, var in enumerate(DAY_VARS)}
+_SUBJECT_POSITION = {var: j for j, var in enumerate(SUBJECT_VARS)}
+
+# Days of history behind each vignette: day i and the days its trend windows reach back to
+WINDOW_DAYS = trend_reach() + 1
+
+class RequestError(ValueError):
+    """A malformed scoring request (answered with 400 Bad Request)."""
+
+class SubjectHistory:
+    """Recent daily values of each subject, bounded to the trend windows and `max_subjects` (LRU).
+
+    A vignette for day i needs days i - trend_reach() .. i, so older days are dropped as later
+    ones arrive and no merged table has to be reloaded to compute trends.
+    """
+
+    def __init__(self, max_subjects: int = DEFAULT_MAX_SUBJECTS):
+        self.max_subjects = max_subjects
+        self._subjects: 'OrderedDict[str, Tuple[np.ndarray, Dict[int, np.ndarray]]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._subjects)
+
+    def _entry(self, subject_id: str):
+        entry = self._subjects.get(subject_id)
+        if entry is None:
+            entry = self._subjects[subject_id] = (np.full(len(SUBJECT_VARS), np.nan), {})
+            if len(self._subjects) > self.max_subjects:
+                self._subjects.popitem(last=False)
+        else:
+            self._subjects.move_to_end(subject_id)
+        return entry
+
+    def update(self, subject_id: str, day: int, values: Dict[str, float]):
+        """Merge raw values reported for a subject-day (subject-level variables apply to every day).
+
+        Raises RequestError for a day older than the subject's trend window: its values could
+        no longer reach any vignette, so a late report is refused instead of silently dropped.
+        """
+        static, days = self._entry(subject_id)
+        if days and day <= max(days) - WINDOW_DAYS:
+            raise RequestError(f"Day {day} of subject {subject_id} is outside its trend window "
+                               f"(days {max(days) - WINDOW_DAYS + 1}-{max(days)} are kept)")
+        row = days.get(day)
+        if row is None:
+            row = days[day] = np.full(len(DAY_VARS), np.nan)
+        for var, value in values.items():
+            if var in _SUBJECT_POSITION:
+                static[_SUBJECT_POSITION[var]] = value
+            else:
+                row[_DAY_POSITION[var]] = value
+        for stale in [d for d in days if d <= max(days) - WINDOW_DAYS]:
+            del days[stale]
+
+    def load(self, subject_id: str, static: np.ndarray, days: Dict[int, np.ndarray]):
+        """Seed a subject's history, e.g. from a merged table at startup."""
+        entry = self._entry(subject_id)
+        entry[0][:] = static
+        entry[1].update(days)
+
+    def window(self, subject_id: str, day: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(subject values, (WINDOW_DAYS, day vars) values) ending at `day`; NaN where nothing was reported."""
+        static, days = self._subjects.get(subject_id, (np.full(len(SUBJECT_VARS), np.nan), {}))
+        window = np.full((WINDOW_DAYS, len(DAY_VARS)), np.nan)
+        for k, d in enumerate(range(day - WINDOW_DAYS + 1, day + 1)):
+            if d in days:
+                window[k] = days[d]
+        return static, window
+
+def parse_score_request(body: dict) -> Tuple[str, int, Dict[str, float], bool]:
+    """Validate a /score request body: {"subject_id", "day", "values": {var: number}, "committee": bool}."""
+    if not isinstance(body, dict) or 'subject_id' not in body or 'day' not in body:
+        raise RequestError("Expected a JSON object with 'subject_id' and 'day'")
+    day = body['day']
+    if isinstance(day, bool) or not isinstance(day, int) or day < 1:
+        raise RequestError(f"'day' must be a positive integer, got {day!r}")
+    values = body.get('values', {})
+    if not isinstance(values, dict):
+        raise RequestError("'values' must be an object of variable: number")
+    unknown = sorted(set(values) - set(_DAY_POSITION) - set(_SUBJECT_POSITION))
+    if unknown:
+        raise RequestError(f"Unknown variables: {unknown}")
+    parsed = {}
+    for var, value in values.items():
+        if value is None:
+            parsed[var] = np.nan
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            parsed[var] = float(value)
+        else:
+            raise RequestError(f"Value of {var} must be a number or null, got {value!r}")
+    return str(body['subject_id']), day, parsed, bool(body.get('committee', True))
+
+def _json_value(value):
+    """JSON-safe cell: None for missing, plain Python numbers."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        return _json_value(value.item())
+    return value
+
+class ScoringService:
+    """Micro-batching scorer of single patient-days.
+
+    Concurrent /score requests queue up and are served together: one vectorized vignette build
+    over every queued subject's history window, then one committee run over the batch. A batch
+    is closed at `max_batch` requests or `max_wait_ms` after its first request.
+    """
+
+    def __init__(self, backend: Optional[Backend] = None, history: Optional[SubjectHistory] = None,
+                 max_batch: int = DEFAULT_MAX_BATCH, max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.backend = backend or stub_backend()
+        self.history = history if history is not None else SubjectHistory()
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_concurrency = max_concurrency
+        self.continuous_vars = list(BINNING_THRESHOLDS)
+        self.stats = {'requests': 0, 'batches': 0, 'rejected': 0, 'max_batch_size': 0, 'build_seconds': 0.0,
+                      'committee_seconds': 0.0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.warm_up()
+
+    def warm_up(self):
+        """Build one vignette so the binning tables, agent routes and prompt templates are compiled before serving."""
+        vignettes_df = self._build([(np.full(len(SUBJECT_VARS), np.nan), np.full((WINDOW_DAYS, len(DAY_VARS)), np.nan))],
+                                   ['warm-up'], [WINDOW_DAYS])
+        compile_routes(vignettes_df.columns)
+        compile_templates(vignettes_df.columns)
+
+    def _build(self, windows: List[Tuple[np.ndarray, np.ndarray]], subject_ids: List[str],
+               days: List[int]) -> pd.DataFrame:
+        """One vignette per (subject window, day), built in a single vectorized pass."""
+        static = np.array([static for static, _ in windows]).reshape(len(windows), len(SUBJECT_VARS))
+        values = np.array([window for _, window in windows]).reshape(len(windows), WINDOW_DAYS, len(DAY_VARS))
+        static_data = pd.DataFrame(static, columns=SUBJECT_VARS)
+        static_data.insert(0, 'subject_id', subject_ids)
+        # The vignette layout has an outcome column; it is unknown here and dropped below
+        static_data.insert(1, OUTCOME, np.nan)
+        n_continuous = len(self.continuous_vars)
+        vignettes_df = vignettes_from_cubes(static_data, values[:, :, :n_continuous], self.continuous_vars,
+                                            values[:, :, n_continuous:], list(range(1, WINDOW_DAYS + 1)))
+        # The windows are positional; keep each subject's last day and give it the requested day number
+        vignettes_df = vignettes_df.iloc[WINDOW_DAYS - 1::WINDOW_DAYS].drop(columns=OUTCOME).reset_index(drop=True)
+        vignettes_df['day'] = np.asarray(days, dtype=np.int64)
+        return vignettes_df
+
+    async def score(self, subject_id: str, day: int, values: Dict[str, float], committee: bool = True) -> dict:
+        """Record a subject-day's values and return its vignette (and committee opinions)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # The batching queue and its worker belong to one event loop
+            self._loop, self._queue = loop, asyncio.Queue()
+            self._worker = loop.create_task(self._serve_batches())
+        future = loop.create_future()
+        await self._queue.put((subject_id, day, values, committee, future))
+        return await future
+
+    async def _serve_batches(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0 and self._queue.empty():
+                    break
+                try:
+                    batch.append(self._queue.get_nowait() if timeout <= 0
+                                 else await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._score_batch(batch)
+            except Exception as e:
+                logger.exception("Scoring batch failed")
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _score_batch(self, batch: list):
+        # Updates are applied in arrival order and each window is taken right after its own
+        # update, before a later day of the same subject in the batch can prune its days
+        accepted, windows = [], []
+        for request in batch:
+            subject_id, day, values, _, future = request
+            try:
+                self.history.update(subject_id, day, values)
+            except RequestError as e:
+                logger.warning(f"Rejected /score request: {e}")
+                self.stats['rejected'] += 1
+                future.set_exception(e)
+                continue
+            static, window = self.history.window(subject_id, day)
+            accepted.append(request)
+            windows.append((static.copy(), window))
+        batch = accepted
+        if not batch:
+            return
+
+        start = time.perf_counter()
+        subject_ids = [request[0] for request in batch]
+        days = [request[1] for request in batch]
+        vignettes_df = self._build(windows, subject_ids, days)
+        self.stats['build_seconds'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        wanted = [i for i, request in enumerate(batch) if request[3]]
+        opinions = {}
+        if wanted:
+            predictions, _ = await run_committee_async(vignettes_df.iloc[wanted], self.backend, batch_size=len(wanted),
+                                                       max_concurrency=self.max_concurrency)
+            opinions = dict(zip(wanted, predictions.drop(columns=['subject_id', 'day']).to_dict('records')))
+        self.stats['committee_seconds'] += time.perf_counter() - start
+
+        records = vignettes_df.astype(object).to_dict('records')
+        for i, (*_, future) in enumerate(batch):
+            response = {'vignette': {key: _json_value(value) for key, value in records[i].items()}}
+            if i in opinions:
+                response['committee'] = {key: _json_value(value) for key, value in opinions[i].items()}
+                response['decision'] = opinions[i][f"{LEADER}_decision"]
+            if not future.done():
+                future.set_result(response)
+
+        self.stats['requests'] += len(batch)
+        self.stats['batches'] += 1
+        self.stats['max_batch_size'] = max(self.stats['max_batch_size'], len(batch))
+
+    def health(self) -> dict:
+        stats = dict(self.stats)
+        stats['mean_batch_size'] = stats['requests'] / stats['batches'] if stats['batches'] else 0.0
+        return {'status': 'ok', 'subjects': len(self.history), **stats}
+
+    async def handle(self, method: str, path: str, body: bytes) -> Tuple[HTTPStatus, dict]:
+        """Route one HTTP request: POST /score, GET /health."""
+        if path == '/health' and method == 'GET':
+            return HTTPStatus.OK, self.health()
+        if path != '/score':
+            return HTTPStatus.NOT_FOUND, {'error': f"No route for {path}"}
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': "Use POST /score"}
+        try:
+            subject_id, day, values, committee = parse_score_request(json.loads(body or b'null'))
+            return HTTPStatus.OK, await self.score(subject_id, day, values, committee)
+        except (RequestError, json.JSONDecodeError, UnicodeDecodeError) as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+
+async def _handle_connection(service: ScoringService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Serve HTTP/1.1 requests on one (keep-alive) connection."""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY_BYTES:
+                status, payload = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': "Request body too large"}
+                headers['connection'] = 'close'
+            else:
+                body = await reader.readexactly(length)
+                try:
+                    status, payload = await service.handle(method, path.split('?', 1)[0], body)
+                except Exception as e:
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}
+
+            keep_alive = headers.get('connection', '').lower() != 'close'
+            data = json.dumps(payload).encode()
+            writer.write(
+                f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data
+            )
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(service: ScoringService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+    """Serve `service` over HTTP until cancelled."""
+    server = await asyncio.start_server(lambda reader, writer: _handle_connection(service, reader, writer), host, port)
+    logger.info(f"Scoring service listening on http://{host}:{port} (max batch {service.max_batch}, "
+                f"max wait {service.max_wait * 1000:g} ms, {len(service.history)} subjects in history)")
+    async with server:
+        await server.serve_forever()
+
+def load_history(path, max_subjects: int = DEFAULT_MAX_SUBJECTS, n_days: Optional[int] = None) -> SubjectHistory:
+    """Seed a SubjectHistory from a wide merged table (the last WINDOW_DAYS days of each subject)."""
+    df = read_table(path)
+    suffixes = {col.rsplit('_day_', 1)[1] for col in df.columns if '_day_' in col}
+    days = sorted(int(suffix) for suffix in suffixes if suffix.isdigit())
+    days = days[-(n_days or WINDOW_DAYS):]
+    cube = np.concatenate([build_day_cube(df, list(BINNING_THRESHOLDS), days),
+                           build_day_cube(df, TREATMENT_VARS, days)], axis=2)
+    static = np.column_stack([pd.to_numeric(df[var], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+                              if var in df.columns else np.full(len(df), np.nan) for var in SUBJECT_VARS])
+    history = SubjectHistory(max_subjects)
+    for i, subject_id in enumerate(df['subject_id'].astype(str)):
+        history.load(subject_id, static[i], {day: cube[i, k] for k, day in enumerate(days)})
+    logger.info(f"Loaded the history of {len(history)} subjects ({days[0]}-{days[-1]}) from {path}")
+    return history
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Serve on-demand vignettes and committee opinions for single patient-days")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--history', default=None,
+                        help="Seed the per-subject history from this merged table (parquet or feather)")
+    parser.add_argument('--max-subjects', type=int, default=DEFAULT_MAX_SUBJECTS,
+                        help=f"Subjects kept in the history cache, least recently used dropped (default: {DEFAULT_MAX_SUBJECTS})")
+    parser.add_argument('--max-batch', type=int, default=DEFAULT_MAX_BATCH,
+                        help=f"Requests served by one vignette build (default: {DEFAULT_MAX_BATCH})")
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help=f"Time a batch waits for more requests after its first (default: {DEFAULT_MAX_WAIT_MS:g})")
+    parser.add_argument('--stub-latency-ms', type=float, default=0.0,
+                        help="Simulated latency per request of the local stub backend")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    history = load_history(args.history, args.max_subjects) if args.history else SubjectHistory(args.max_subjects)
+    service = ScoringService(stub_backend(latency=args.stub_latency_ms / 1000), history,
+                             max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        logger.info("Scoring service stopped")
+
+if __name__ == '__main__':
+    main()
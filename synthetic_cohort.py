@@ -0,0 +1,134 @@
+import pandas as pd
+import numpy as np
+import argparse
+import io
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from clinical_tables import BINNING_THRESHOLDS, TARGET_VARIABLES
+from process_excel import EXCEL_FILES
+
+logger = logging.getLogger(__name__)
+
+# Variables written to each of the EXCEL_FILES, mirroring the real extracts:
+# coma grade, daily checklist and labs are one row per visit; the unique file one row per subject
+SUBJECT_VARIABLES = ['Spont_Survival21', 'male', 'Hispanic', 'Pre_NAC_IV']
+COMA_VARIABLES = ['F27Q04']
+DAILY_CHECK_VARIABLES = ['Infection', 'Trt_Ventilator', 'Trt_Pressors', 'Trt_CVVH']
+LAB_VARIABLES = [var for var in TARGET_VARIABLES if var in BINNING_THRESHOLDS]
+
+FILE_VARIABLES = {
+    EXCEL_FILES[0]: COMA_VARIABLES,
+    EXCEL_FILES[1]: DAILY_CHECK_VARIABLES,
+    EXCEL_FILES[2]: LAB_VARIABLES,
+    EXCEL_FILES[3]: SUBJECT_VARIABLES
+}
+VISIT_FILES = EXCEL_FILES[:3]
+
+def visit_names(n_days: int) -> List[str]:
+    """zVisitNm values for days 1..n_days ('ALF Admission' is day 1)."""
+    return ['ALF Admission'] + [f"ALF Day {day}" for day in range(2, n_days + 1)]
+
+def _lab_values(rng: np.random.Generator, var: str, n_subjects: int, n_days: int) -> np.ndarray:
+    """Per-subject daily lab series: a start value across the variable's bins and a multiplicative random walk."""
+    bins = BINNING_THRESHOLDS[var]['bins']
+    start = rng.uniform(bins[1] * 0.5, bins[-2] * 1.3, n_subjects)
+    steps = rng.lognormal(mean=0.0, sigma=0.15, size=(n_subjects, n_days))
+    steps[:, 0] = 1.0
+    return np.round(start[:, None] * np.cumprod(steps, axis=1), 2)
+
+def generate_cohort(n_subjects: int, n_days: int = 7, missing_rate: float = 0.2, visit_missing_rate: float = 0.1,
+                    seed: int = 0) -> Dict[str, pd.DataFrame]:
+    """Generate synthetic frames shaped like the four EXCEL_FILES.
+
+    Visit files have one row per (subject_id, zVisitNm) with `visit_missing_rate` of
+    patient-days absent; every variable cell is missing with probability `missing_rate`.
+    Subject IDs are strings like 'S000001'.
+    """
+    rng = np.random.default_rng(seed)
+    subject_ids = np.array([f"S{i:06d}" for i in range(1, n_subjects + 1)], dtype=object)
+
+    frames = {}
+    for filepath in VISIT_FILES:
+        present = rng.random((n_subjects, n_days)) >= visit_missing_rate
+        subject_pos, day_pos = np.nonzero(present)
+        frame = {
+            'subject_id': subject_ids[subject_pos],
+            'zVisitNm': np.array(visit_names(n_days), dtype=object)[day_pos]
+        }
+        for var in FILE_VARIABLES[filepath]:
+            if var in LAB_VARIABLES:
+                values = _lab_values(rng, var, n_subjects, n_days)[subject_pos, day_pos]
+            elif var == 'F27Q04':
+                values = rng.integers(0, 5, len(subject_pos)).astype(float)
+            else:
+                values = (rng.random(len(subject_pos)) < 0.3).astype(float)
+            values[rng.random(len(values)) < missing_rate] = np.nan
+            frame[var] = values
+        # Extra columns the pipeline ignores, as in the real extracts
+        frame['site_id'] = rng.integers(1, 30, len(subject_pos))
+        frames[filepath] = pd.DataFrame(frame)
+
+    subjects = {'subject_id': subject_ids}
+    for var in SUBJECT_VARIABLES:
+        subjects[var] = rng.integers(0, 2, n_subjects).astype(float)
+    subjects['form_version'] = 'v2'
+    frames[EXCEL_FILES[3]] = pd.DataFrame(subjects)
+    return frames
+
+def _xlsx_bytes(df: pd.DataFrame) -> bytes:
+    """Write a frame to xlsx with openpyxl's write-only mode (missing values as empty cells)."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(df.columns))
+    values = df.astype(object).where(df.notna(), None).to_numpy()
+    for row in values.tolist():
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+def write_cohort(frames: Dict[str, pd.DataFrame], output_dir, password: Optional[str] = None) -> List[Path]:
+    """Write the cohort frames as workbooks in `output_dir`, password-encrypted when `password` is given."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for filepath, df in frames.items():
+        path = output_dir / filepath
+        data = _xlsx_bytes(df)
+        if password:
+            from msoffcrypto.format.ooxml import OOXMLFile
+            with open(path, 'wb') as out:
+                OOXMLFile(io.BytesIO(data)).encrypt(password, out)
+        else:
+            path.write_bytes(data)
+        logger.info(f"Wrote {df.shape} {'encrypted ' if password else ''}workbook to {path}")
+        paths.append(path)
+    return paths
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Generate a synthetic cohort shaped like the ALFSG Excel extracts")
+    parser.add_argument('--subjects', type=int, default=1000, help="Number of subjects (default: 1000)")
+    parser.add_argument('--days', type=int, default=7, help="Visit days per subject (default: 7)")
+    parser.add_argument('--missing-rate', type=float, default=0.2,
+                        help="Probability that a variable value is missing (default: 0.2)")
+    parser.add_argument('--visit-missing-rate', type=float, default=0.1,
+                        help="Probability that a patient-day has no row in a visit file (default: 0.1)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', default='synthetic_cohort', help="Directory for the workbooks")
+    parser.add_argument('--password', default=None, help="Encrypt the workbooks with this password")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    frames = generate_cohort(args.subjects, n_days=args.days, missing_rate=args.missing_rate,
+                             visit_missing_rate=args.visit_missing_rate, seed=args.seed)
+    write_cohort(frames, args.output_dir, password=args.password)
+
+if __name__ == '__main__':
+    main()
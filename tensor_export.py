@@ -0,0 +1,163 @@
+import pandas as pd
+import numpy as np
+import argparse
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from clinical_tables import BINNING_THRESHOLDS, CATEGORICAL_MAPPINGS, STATIC_CATEGORICAL_VARS, TREATMENT_VARS
+from create_vignettes import bin_codes
+from data_io import output_path, read_table, table_columns
+from instrumentation import add_metrics_arguments, instrumented, metrics_session
+from subject_schema import as_float64
+from trend_engine import TREND_CLASSES, TREND_WINDOWS, window_trends
+
+logger = logging.getLogger(__name__)
+
+# Written last, so a directory with a manifest holds a complete export
+MANIFEST_FILE = 'manifest.json'
+TENSOR_FORMAT_VERSION = 1
+
+# Tensor files and their axes; codes are -1 where missing (values are NaN)
+TENSOR_AXES = {
+    'values': ['subject', 'day', 'variable'],
+    'bins': ['subject', 'day', 'variable'],
+    'trends': ['subject', 'day', 'variable', 'window'],
+    'flags': ['subject', 'day', 'flag'],
+    'outcome': ['subject']
+}
+
+# Binary and coded variables exported as flags: static ones repeat on every day
+FLAG_VARS = [var for var in STATIC_CATEGORICAL_VARS + TREATMENT_VARS if var in CATEGORICAL_MAPPINGS]
+
+def tensor_input_columns(columns) -> List[str]:
+    """Vignette columns the tensors are built from (raw values only, no labels)."""
+    wanted = {'subject_id', 'day', 'Spont_Survival21'} | set(FLAG_VARS)
+    wanted |= {f"{var}_value" for var in BINNING_THRESHOLDS}
+    return [col for col in columns if col in wanted]
+
+def _flag_codes(values: np.ndarray, var_name: str) -> np.ndarray:
+    """CATEGORICAL_MAPPINGS codes of a float array as int8, -1 where missing or unmapped (as _categorical_text)."""
+    truncated = np.trunc(values)
+    codes = np.full(values.shape, -1, dtype=np.int8)
+    for code in CATEGORICAL_MAPPINGS[var_name]:
+        codes[truncated == code] = code
+    return codes
+
+def _patient_day_index(vignettes_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, pd.Index, List[int]]:
+    """(subject position, day position) of every vignette row, with subjects in first-seen order."""
+    subject_pos, subjects = pd.factorize(vignettes_df['subject_id'])
+    days = sorted(int(day) for day in vignettes_df['day'].unique())
+    day_pos = pd.Index(days).get_indexer(vignettes_df['day'])
+    return subject_pos, day_pos, pd.Index(subjects), days
+
+def build_tensors(vignettes_df: pd.DataFrame) -> Tuple[Dict[str, np.ndarray], dict]:
+    """Build the feature tensors and their manifest from a vignette table.
+
+    Raw values come from the `{var}_value` columns; bins and trends are recomputed from them
+    with bin_codes and the trend engine, so no label is parsed. Returns ({name: array}, manifest).
+    """
+    subject_pos, day_pos, subjects, days = _patient_day_index(vignettes_df)
+    n_subjects, n_days = len(subjects), len(days)
+    variables = [var for var in BINNING_THRESHOLDS if f"{var}_value" in vignettes_df.columns]
+    flags = [var for var in FLAG_VARS if var in vignettes_df.columns]
+
+    cube = np.full((n_subjects, n_days, len(variables)), np.nan)
+    for j, var in enumerate(variables):
+        cube[subject_pos, day_pos, j] = as_float64(vignettes_df[f"{var}_value"])
+    codes = np.empty(cube.shape, dtype=np.int8)
+    for j, var in enumerate(variables):
+        codes[:, :, j] = bin_codes(cube[:, :, j], var)
+    trends = np.stack([trend for _, trend, _, _ in window_trends(cube, codes)], axis=-1)
+
+    flag_codes = np.full((n_subjects, n_days, len(flags)), -1, dtype=np.int8)
+    for j, var in enumerate(flags):
+        flag_codes[subject_pos, day_pos, j] = _flag_codes(as_float64(vignettes_df[var]), var)
+
+    # The outcome is per subject: taken from each subject's first row
+    survival = as_float64(vignettes_df['Spont_Survival21'])[np.unique(subject_pos, return_index=True)[1]]
+    outcome = np.where(np.isnan(survival), -1, survival).astype(np.int8)
+
+    tensors = {
+        'values': cube.astype(np.float32),
+        'bins': codes,
+        'trends': trends,
+        'flags': flag_codes,
+        'outcome': outcome
+    }
+    manifest = {
+        'version': TENSOR_FORMAT_VERSION,
+        'subjects': [str(subject) for subject in subjects],
+        'days': days,
+        'variables': [
+            {'name': var, 'unit': BINNING_THRESHOLDS[var].get('unit'), 'bins': BINNING_THRESHOLDS[var]['labels']}
+            for var in variables
+        ],
+        'windows': [{'suffix': suffix, 'end_offset': end_offset, 'span': span}
+                    for suffix, end_offset, span in TREND_WINDOWS],
+        'trend_classes': TREND_CLASSES,
+        'flags': [{'name': var, 'codes': {str(code): label for code, label in CATEGORICAL_MAPPINGS[var].items()}}
+                  for var in flags],
+        'outcome': 'Spont_Survival21',
+        'tensors': {
+            name: {
+                'file': f"{name}.npy",
+                'dtype': str(array.dtype),
+                'shape': list(array.shape),
+                'axes': TENSOR_AXES[name],
+                'missing': 'nan' if array.dtype.kind == 'f' else -1
+            }
+            for name, array in tensors.items()
+        }
+    }
+    return tensors, manifest
+
+@instrumented(args=('output_dir',))
+def write_tensors(vignettes_df: pd.DataFrame, output_dir) -> Path:
+    """Write the feature tensors as .npy files plus a JSON manifest; returns the manifest path."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tensors, manifest = build_tensors(vignettes_df)
+    (output_dir / MANIFEST_FILE).unlink(missing_ok=True)
+    for name, array in tensors.items():
+        np.save(output_dir / manifest['tensors'][name]['file'], array)
+    path = output_dir / MANIFEST_FILE
+    path.write_text(json.dumps(manifest, indent=2))
+    values = manifest['tensors']['values']['shape']
+    logger.info(f"Wrote {values[0]} subjects x {values[1]} days x {values[2]} variables of tensors to {output_dir}")
+    return path
+
+def load_tensors(tensor_dir, mmap_mode: str = 'r') -> Tuple[dict, Dict[str, np.ndarray]]:
+    """Map the tensors written by write_tensors; returns (manifest, {name: array}).
+
+    Arrays are memory-mapped (no copy or parsing), so slicing a day, e.g. tensors['values'][:, 2],
+    reads only those pages. Pass mmap_mode=None to load them into memory instead.
+    """
+    tensor_dir = Path(tensor_dir)
+    manifest = json.loads((tensor_dir / MANIFEST_FILE).read_text())
+    if manifest['version'] != TENSOR_FORMAT_VERSION:
+        raise ValueError(f"{tensor_dir} holds tensor format {manifest['version']}, expected {TENSOR_FORMAT_VERSION}")
+    tensors = {name: np.load(tensor_dir / spec['file'], mmap_mode=mmap_mode)
+               for name, spec in manifest['tensors'].items()}
+    return manifest, tensors
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Export the clinical vignettes as memory-mappable feature tensors")
+    parser.add_argument('--input', default=str(output_path('clinical_vignettes', 'parquet')),
+                        help="Vignette table written by create_vignettes (parquet or feather)")
+    parser.add_argument('--output-dir', default='vignette_tensors',
+                        help="Directory for the .npy tensors and manifest.json (default: vignette_tensors)")
+    add_metrics_arguments(parser)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    with metrics_session(args):
+        vignettes_df = read_table(args.input, columns=tensor_input_columns(table_columns(args.input)))
+        write_tensors(vignettes_df, args.output_dir)
+
+if __name__ == '__main__':
+    main()
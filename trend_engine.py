@@ -0,0 +1,84 @@
+import numpy as np
+from typing import Iterator, List, Tuple
+
+# Trend windows for day i as (column suffix, end offset, span in days):
+# - Day i-1 to Day i (current period, 1 day)
+# - Day i-2 to Day i-1 (previous period, 1 day)
+# - Day i-3 to Day i-1 (longer term, 2 days)
+# A further window, e.g. ('_trend_week', 0, 6) for Day i-6 to Day i, only needs an entry here:
+# vignette columns, agent routes, prompts and incremental manifests all follow this list.
+TREND_WINDOWS = [
+    ('_trend', 0, 1),
+    ('_trend_prev1', 1, 1),
+    ('_trend_prev2', 1, 2),
+]
+
+# Trend classes in the order used by calculate_trend_detailed
+TREND_CLASSES = [
+    'Stable',
+    'Rapidly Worsening',
+    'Rapidly Increasing',
+    'Worsening',
+    'Mildly Increasing',
+    'Rapidly Improving',
+    'Rapidly Decreasing',
+    'Improving',
+    'Mildly Decreasing',
+]
+
+# calculate_trend_detailed thresholds on the percent change. Decreases are classified on
+# [edge, next edge) and increases on (edge, next edge], so -5 and 5 are both Stable.
+DECREASE_EDGES = np.array([-100.0, -50.0, -20.0, -5.0])
+INCREASE_EDGES = np.array([5.0, 20.0, 50.0, 100.0])
+
+# TREND_CLASSES index for each interval between the edges, from below -100 to above 100
+_INTERVAL_CLASSES = np.array([
+    TREND_CLASSES.index(trend) for trend in [
+        'Rapidly Improving', 'Rapidly Decreasing', 'Improving', 'Mildly Decreasing', 'Stable',
+        'Mildly Increasing', 'Worsening', 'Rapidly Increasing', 'Rapidly Worsening'
+    ]
+], dtype=np.int8)
+
+def classify_percent_change(percent_change: np.ndarray) -> np.ndarray:
+    """Vectorized trend classification; returns int8 indices into TREND_CLASSES (Stable for NaN)."""
+    interval = (np.searchsorted(DECREASE_EDGES, percent_change, side='right')
+                + np.searchsorted(INCREASE_EDGES, percent_change, side='left'))
+    classes = _INTERVAL_CLASSES[interval]
+    classes[np.isnan(percent_change)] = 0
+    return classes
+
+def trend_suffixes(windows=TREND_WINDOWS) -> List[str]:
+    """Vignette column suffixes of the trend windows."""
+    return [suffix for suffix, _, _ in windows]
+
+def trend_reach(windows=TREND_WINDOWS) -> int:
+    """Days before day i whose values feed day i's trend windows."""
+    return max(end_offset + span for _, end_offset, span in windows)
+
+def window_trends(cube: np.ndarray, codes: np.ndarray,
+                  windows=TREND_WINDOWS) -> Iterator[Tuple[str, np.ndarray, np.ndarray, np.ndarray]]:
+    """Classify every trend window over a (subject, day, var) value cube and its bin codes.
+
+    Yields (suffix, trend, previous_codes, current_codes) per window, each shaped like the
+    cube: trend holds TREND_CLASSES indices (-1 where the window has no trend: a missing or
+    zero previous value, a missing current value or a day before the window's reach) and the
+    codes are the bin codes (-1 for missing) at the window's start and end. Each window is one
+    pass over day-offset views of the cube; nothing is shifted or copied.
+    """
+    n_days = cube.shape[1]
+    for suffix, end_offset, span in windows:
+        lag = end_offset + span
+        trend = np.full(cube.shape, -1, dtype=np.int8)
+        previous_codes = np.full(codes.shape, -1, dtype=codes.dtype)
+        current_codes = np.full(codes.shape, -1, dtype=codes.dtype)
+        if lag < n_days:
+            # Day d compares day d - end_offset with day d - lag, for d >= lag
+            current = cube[:, span:n_days - end_offset]
+            previous = cube[:, :n_days - lag]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                percent_change = (current - previous) / previous * 100
+            valid = ~np.isnan(current) & ~np.isnan(previous) & (previous != 0)
+            trend[:, lag:] = np.where(valid, classify_percent_change(percent_change), -1)
+            previous_codes[:, lag:] = codes[:, :n_days - lag]
+            current_codes[:, lag:] = codes[:, span:n_days - end_offset]
+        yield suffix, trend, previous_codes, current_codes
@@ -0,0 +1,101 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bump when the manifest layout or fingerprint inputs change so old manifests force a full run
+MANIFEST_VERSION = 1
+MANIFEST_METADATA_KEY = b'vignette_manifest'
+STATIC_COLUMN = 'static'
+
+def manifest_path(output) -> Path:
+    """Default manifest location next to a vignette output, e.g. clinical_vignettes.manifest.parquet."""
+    output = Path(output)
+    return output.with_name(f"{output.stem}.manifest.parquet")
+
+def _hash_rows(values: pd.DataFrame) -> np.ndarray:
+    """64-bit hash of each row's values (column order matters, the index does not)."""
+    return pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+
+def subject_fingerprints(static_data: pd.DataFrame, static_columns, cubes, days) -> pd.DataFrame:
+    """Fingerprint every subject's vignette inputs: one hash of its static values and one per day.
+
+    `cubes` are float (subject, day, var) arrays aligned with `static_data` rows; each day's
+    hash covers that day's values across all cubes, so a new or corrected lab on day d only
+    changes the day_d fingerprint.
+    """
+    n_subjects = len(static_data)
+    day_values = np.concatenate(list(cubes), axis=2).reshape(n_subjects * len(days), -1)
+    day_hashes = _hash_rows(pd.DataFrame(day_values)).reshape(n_subjects, len(days))
+
+    fingerprints = pd.DataFrame(day_hashes, columns=[f"day_{day}" for day in days])
+    fingerprints.insert(0, STATIC_COLUMN, _hash_rows(static_data[list(static_columns)]))
+    fingerprints.insert(0, 'subject_id', static_data['subject_id'].to_numpy())
+    return fingerprints
+
+def affected_days(previous: Optional[pd.DataFrame], current: pd.DataFrame, reach: int) -> np.ndarray:
+    """Boolean (subject, day) mask of vignette rows to recompute, aligned with `current`.
+
+    A row is affected when its subject is new, its static values changed, or the inputs of
+    that day or any of the `reach` days before it (the trend windows) changed.
+    """
+    day_cols = [col for col in current.columns if col.startswith('day_')]
+    if previous is None:
+        return np.ones((len(current), len(day_cols)), dtype=bool)
+
+    # Compare hashes positionally; reindexing would upcast the uint64 hashes to float
+    position = pd.Index(previous['subject_id']).get_indexer(current['subject_id'])
+    known = position >= 0
+    position = np.where(known, position, 0)
+    static_changed = ~known | (previous[STATIC_COLUMN].to_numpy()[position] != current[STATIC_COLUMN].to_numpy())
+
+    changed = previous[day_cols].to_numpy()[position] != current[day_cols].to_numpy()
+    affected = changed.copy()
+    for lag in range(1, reach + 1):
+        affected[:, lag:] |= changed[:, :-lag]
+    affected |= static_changed[:, None]
+    return affected
+
+def write_manifest(path, fingerprints: pd.DataFrame, settings: dict) -> Path:
+    """Write subject fingerprints with the run settings stored in the Parquet schema metadata."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = Path(path)
+    table = pa.Table.from_pandas(fingerprints, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[MANIFEST_METADATA_KEY] = json.dumps({'version': MANIFEST_VERSION, **settings}).encode('utf-8')
+    tmp_path = path.with_name(path.name + '.tmp')
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+    tmp_path.replace(path)
+    logger.info(f"Wrote manifest for {len(fingerprints)} subjects to {path}")
+    return path
+
+def read_manifest(path, settings: dict) -> Optional[pd.DataFrame]:
+    """Read a manifest written with the same settings, or None if missing or stale."""
+    import pyarrow.parquet as pq
+
+    path = Path(path)
+    if not path.exists():
+        logger.info(f"No manifest at {path}; running a full build")
+        return None
+
+    table = pq.read_table(path)
+    stored = json.loads((table.schema.metadata or {}).get(MANIFEST_METADATA_KEY, b'{}'))
+    if stored != {'version': MANIFEST_VERSION, **settings}:
+        logger.info(f"Manifest {path} was written with different settings; running a full build")
+        return None
+    return table.to_pandas()
+
+def settings_digest(*objects) -> str:
+    """Stable digest of configuration objects (e.g. binning thresholds) for manifest settings."""
+    return hashlib.blake2b(repr(objects).encode('utf-8'), digest_size=16).hexdigest()
+
+def manifest_summary(affected: np.ndarray) -> Tuple[int, int]:
+    """Number of (subjects, vignette rows) to recompute."""
+    return int(affected.any(axis=1).sum()), int(affected.sum())
@@ -0,0 +1,133 @@
+import pandas as pd
+import base64
+import hashlib
+import io
+import logging
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+logger = logging.getLogger(__name__)
+
+# Default location and size budget of the parsed-workbook cache
+DEFAULT_CACHE_DIR = Path('.cache') / 'workbooks'
+DEFAULT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Bump when the cached layout changes so stale entries are never read
+CACHE_FORMAT_VERSION = 1
+
+CACHE_SUFFIX = '.parquet.enc'
+KDF_ITERATIONS = 390_000
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+def file_fingerprint(filepath) -> str:
+    """Fingerprint a file by (resolved path, size, mtime, content hash)."""
+    path = Path(filepath).resolve()
+    stat = path.stat()
+
+    content_hash = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            content_hash.update(chunk)
+
+    key = f"{CACHE_FORMAT_VERSION}|{path}|{stat.st_size}|{stat.st_mtime_ns}|{content_hash.hexdigest()}"
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=20).hexdigest()
+
+def _cache_salt(cache_dir: Path) -> bytes:
+    """Read the cache's key-derivation salt, creating it on first use.
+
+    Concurrent workers on a cold cache race to create it: each writes a complete candidate
+    file and hard-links it into place, which fails if the salt already exists, so exactly one
+    salt wins and every worker reads that one.
+    """
+    salt_file = cache_dir / 'salt'
+    if not salt_file.exists():
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        candidate = salt_file.with_name(f"salt.{os.getpid()}.{os.urandom(4).hex()}.tmp")
+        candidate.write_bytes(os.urandom(16))
+        try:
+            os.link(candidate, salt_file)
+        except FileExistsError:
+            pass
+        finally:
+            candidate.unlink(missing_ok=True)
+    return salt_file.read_bytes()
+
+@lru_cache(maxsize=8)
+def _derive_fernet(password: str, salt: bytes) -> Fernet:
+    """Derive the cache encryption key from the workbook password."""
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=KDF_ITERATIONS)
+    return Fernet(base64.urlsafe_b64encode(kdf.derive(password.encode('utf-8'))))
+
+def _entry_path(cache_dir: Path, fingerprint: str) -> Path:
+    return cache_dir / f"{fingerprint}{CACHE_SUFFIX}"
+
+def load_cached_dataframe(filepath, password: str, cache_dir=DEFAULT_CACHE_DIR,
+                          fingerprint: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """Return the cached parsed DataFrame for `filepath`, or None on a cache miss."""
+    cache_dir = Path(cache_dir)
+    fingerprint = fingerprint or file_fingerprint(filepath)
+    entry = _entry_path(cache_dir, fingerprint)
+    if not entry.exists():
+        logger.info(f"Cache miss for {filepath}")
+        return None
+
+    try:
+        fernet = _derive_fernet(password, _cache_salt(cache_dir))
+        df = pd.read_parquet(io.BytesIO(fernet.decrypt(entry.read_bytes())))
+    except (InvalidToken, OSError, ValueError) as e:
+        logger.warning(f"Discarding unreadable cache entry for {filepath}: {e}")
+        entry.unlink(missing_ok=True)
+        return None
+
+    # Mark as recently used for eviction
+    os.utime(entry)
+    logger.info(f"Cache hit for {filepath} ({entry.name})")
+    return df
+
+def store_cached_dataframe(filepath, df: pd.DataFrame, password: str, cache_dir=DEFAULT_CACHE_DIR,
+                           max_bytes: int = DEFAULT_CACHE_MAX_BYTES, fingerprint: Optional[str] = None) -> Optional[Path]:
+    """Encrypt and store a parsed DataFrame for `filepath`, then evict down to `max_bytes`."""
+    cache_dir = Path(cache_dir)
+    fingerprint = fingerprint or file_fingerprint(filepath)
+
+    buffer = io.BytesIO()
+    try:
+        df.to_parquet(buffer, index=False)
+    except Exception as e:
+        # e.g. object columns mixing numbers and strings
+        logger.warning(f"Could not cache {filepath}: {e}")
+        return None
+
+    fernet = _derive_fernet(password, _cache_salt(cache_dir))
+    entry = _entry_path(cache_dir, fingerprint)
+    tmp_entry = entry.with_name(entry.name + '.tmp')
+    tmp_entry.write_bytes(fernet.encrypt(buffer.getvalue()))
+    tmp_entry.replace(entry)
+    logger.info(f"Cached {filepath} as {entry.name} ({entry.stat().st_size} bytes)")
+
+    evict_cache(cache_dir, max_bytes)
+    return entry
+
+def evict_cache(cache_dir=DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_MAX_BYTES) -> int:
+    """Delete least recently used entries until the cache fits in `max_bytes`; returns entries removed."""
+    cache_dir = Path(cache_dir)
+    if not cache_dir.exists():
+        return 0
+
+    entries = sorted(cache_dir.glob(f"*{CACHE_SUFFIX}"), key=lambda entry: entry.stat().st_mtime)
+    total = sum(entry.stat().st_size for entry in entries)
+    removed = 0
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        total -= entry.stat().st_size
+        entry.unlink()
+        removed += 1
+        logger.info(f"Evicted cache entry {entry.name}")
+    return removed
@@ -0,0 +1,68 @@
+import pandas as pd
+import io
+import logging
+from operator import itemgetter
+from typing import Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Rows materialized as Python objects at a time while streaming a sheet
+DEFAULT_CHUNK_ROWS = 50_000
+
+def resolve_header(header, columns: List[str]) -> dict:
+    """Map each wanted column name found in a header row to its index (first occurrence wins)."""
+    wanted = set(columns)
+    positions = {}
+    for index, name in enumerate(header):
+        name = None if name is None else str(name).strip()
+        if name in wanted and name not in positions:
+            positions[name] = index
+    return positions
+
+def iter_xlsx_chunks(source, columns: List[str], chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                     sheet_name: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """Stream the rows of an xlsx sheet as DataFrames holding only the requested columns.
+
+    `source` is a path or a (decrypted) BytesIO. The workbook is opened read-only, so cells
+    are parsed row by row and never kept as a cell tree; the header (first row) is resolved
+    once and each row contributes only the cells of `columns` that exist in the sheet.
+    Columns missing from the sheet are left out. Values keep the types openpyxl returns, as
+    pd.read_excel would; chunks are at most `chunk_rows` rows.
+    """
+    from openpyxl import load_workbook
+
+    if isinstance(source, io.BytesIO):
+        source.seek(0)
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        positions = resolve_header(header, columns)
+        if not positions:
+            logger.warning("None of the requested columns are in the sheet header")
+            return
+
+        names = list(positions)
+        indices = list(positions.values())
+        width = max(indices) + 1
+        pick = itemgetter(*indices) if len(indices) > 1 else (lambda row: (row[indices[0]],))
+
+        chunk = []
+        for row in rows:
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            values = pick(row)
+            # Blank rows are skipped, as pd.read_excel does
+            if all(value is None for value in values):
+                continue
+            chunk.append(values)
+            if len(chunk) >= chunk_rows:
+                yield pd.DataFrame.from_records(chunk, columns=names)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame.from_records(chunk, columns=names)
+    finally:
+        workbook.close()